@@ -8,16 +8,27 @@ print "\n"
 
 import ROOT
 from rat import dsreader
+from event_view import EventView
+from array_hist import ArrayHist1D
+import event_cache
+import cuts
+import analysis_runner
+import hist_store
+import energy_fit
+import fit_scheduler
+import numpy as np
 import sys
-import math
 
 # ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
-def EHistMaker(input_files, ERange, ECut, hist_display_title, retriggerfilter): 
+def EHistMaker(input_files, ERange, ECut, hist_display_title, retriggerfilter, use_cache=False, uncleaned=None, n_workers=1, use_store=False,
+               return_energies=False): 
 
     """
 
     Description:
     Extract data from root file(s) fitted with the PartialFitter, apply cuts, and return energy histogram with name "h_energy_name" 
+    Each file is done separately by EHistPartial (in n_workers processes) and the partial histograms are merged in file 
+    order, so the result doesn't depend on n_workers
 
     Parameters:
     input_files : list of str 
@@ -28,6 +39,16 @@ def EHistMaker(input_files, ERange, ECut, hist_display_title, retriggerfilter):
         Energy below which events are cut
     retriggerfilter : bool 
         Whether to only use first event in an entry
+    use_cache : bool
+        Read the events through event_cache.py instead of the dsreader (ROOT is only read the first time)
+    uncleaned : UncleanedEnergy or None
+        Also filled with every event before any cut, in the same loop (for plot_fit_energy)
+    n_workers : int
+        Number of processes the files are shared between
+    use_store : bool
+        Take the partial histogram of each unchanged file from hist_store.py, only processing new or changed files
+    return_energies : bool
+        Also return the energies that passed the cuts (unbinned, for the energy_fit.py fits)
 
 
     Returns:
@@ -35,6 +56,42 @@ def EHistMaker(input_files, ERange, ECut, hist_display_title, retriggerfilter):
         The energy histogram
     Counts : list 
         CountTotal, CountTrigger, CountValid, CountRadius, LowECountFiltered
+    energies : numpy array of floats
+        Only with return_energies, the energy of every event in h_energy [MeV]
+
+    """
+
+    args = (ERange, ECut, hist_display_title, retriggerfilter, use_cache, uncleaned is not None, return_energies)
+    map_files = hist_store.map_files_stored if use_store else analysis_runner.map_files
+    partials = map_files(EHistPartial, input_files, args, n_workers)
+    h_energy, Counts, file_uncleaned = analysis_runner.merge_partials([EHistPartial([], *args)] + partials) # starting from empty
+
+    if uncleaned is not None : uncleaned.merge(file_uncleaned)
+
+    #h_energy.Scale(1/h_energy.GetEntries()) # scale by entries
+    
+    if return_energies :
+        return h_energy.to_TH1D(), Counts, h_energy.values()
+    return h_energy.to_TH1D(), Counts
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def EHistPartial(input_files, ERange, ECut, hist_display_title, retriggerfilter, use_cache, with_uncleaned, with_energies=False): 
+
+    """
+
+    Description:
+    The EHistMaker loop, returning the (picklable, mergeable) accumulators instead of a TH1D
+
+    Parameters:
+    As EHistMaker, with with_uncleaned : bool, whether to fill an UncleanedEnergy
+    and with_energies : bool, whether h_energy keeps the energies it is filled with
+
+    Returns:
+    h_energy : ArrayHist1D
+    Counts : list 
+        CountTotal, CountTrigger, CountValid, CountRadius, LowECountFiltered
+    uncleaned : UncleanedEnergy or None
 
     """
 
@@ -43,43 +100,54 @@ def EHistMaker(input_files, ERange, ECut, hist_display_title, retriggerfilter):
     nbins = 100
     Counts = [0, 0, 0, 0, 0]        # CountTotal, CountTrigger, CountRadius, CountValid, LowECountFiltered
 
-    h_energy = ROOT.TH1D("h_energy_name", hist_display_title, nbins, ERange[0], ERange[1])
-    h_energy.SetDirectory(0)
+    h_energy = ArrayHist1D("h_energy_name", hist_display_title, nbins, ERange[0], ERange[1], keep_values=with_energies)
+    uncleaned = UncleanedEnergy(ERange, ECut) if with_uncleaned else None
+
+    low_energy = cuts.energy_min(ECut)
+    gauntlet = cuts.CutFlow(([cuts.retrigger] if retriggerfilter else []) + [cuts.valid_position, cuts.fv, cuts.valid_energy, low_energy])
 
     for fname in input_files :
 
+        if use_cache : # same gauntlet on the cached columns, a chunk at a time
+            for events in event_cache.iter_chunks(event_cache.load_events(fname, fitName), gauntlet.columns + ["default_energy"]) :
+                if uncleaned is not None :
+                    uncleaned.fill_array(events["valid_energy"], events["default_energy"]) # original unfiltered data
+                h_energy.fill_array(events["energy"][gauntlet.mask(events)])
+            continue
+
         for ds, run in dsreader(fname): # ds is equivalent to dsreader.GetEntry(i) in c++
 
             for iev in range(0, ds.GetEVCount()):
 
                 Counts[0] += 1                                           # total event count
 
+                ev = EventView(ds.GetEV(iev), fitName) # fit result read once, the rest as the cuts need it
+
+                if uncleaned is not None :
+                    uncleaned.fill_event(ev)                             # original unfiltered data
+
                 if retriggerfilter and iev > 0 :
                     Counts[1] += 1 
                     continue                                             # re-trigger filter
                                                             
 
-                ev = ds.GetEV(iev)
-
-                if not ev.FitResultExists(fitName) or not ev.GetFitResult(fitName).GetVertex(0).ContainsPosition() or not ev.GetFitResult(fitName).GetVertex(0).ValidPosition() :
+                if not ev.valid_position :
                     continue # valid position cut
 
-                fVertex = ev.GetFitResult(fitName).GetVertex(0)
-                PosEV = fVertex.GetPosition()
-                REV = PosEV.Mag() 
-                RhoEV = math.sqrt(PosEV.X()**2 + PosEV.Y()**2)
+                REV = ev.r
+                RhoEV = ev.rho
 
                 
                 # FV cut
-                if REV > 6000 or PosEV.Z() < 747.5 :                  
+                if REV > 6000 or ev.z < 747.5 :                  
                     continue                                             # if outside AV, don't use
                 Counts[2] += 1                                           # inside AV count
                 
                 '''
                 # see if inside the AV (including the neck)
-                if PosEV.Z() >= 6000 and RhoEV >= 730 :             
+                if ev.z >= 6000 and RhoEV >= 730 :             
                     continue
-                if PosEV.Z() < 6000 and REV > 6000 :
+                if ev.z < 6000 and REV > 6000 :
                     continue
                 Counts[2] += 1                                           
                 '''
@@ -90,23 +158,155 @@ def EHistMaker(input_files, ERange, ECut, hist_display_title, retriggerfilter):
                 Counts[2] += 1   
                 '''  
 
-                if not fVertex.ValidEnergy(): continue # valid energy cut
-                finalE = fVertex.GetEnergy()
+                if not ev.valid_energy: continue # valid energy cut
+                finalE = ev.energy
                 if finalE < ECut: continue # low energy cut
                 Counts[3] += 1                                           # how many actually pass the gauntlet
 
-                h_energy.Fill(finalE) 
+                h_energy.fill(finalE) 
 
-                if fVertex.GetEnergy() < ECut: 
+                if finalE < ECut: 
                     Counts[4] += 1                                       # keep track of LowE which pass the filter 
 
-    #h_energy.Scale(1/h_energy.GetEntries()) # scale by entries
-    
-    return h_energy, Counts
+    if use_cache :
+        Counts[0] = gauntlet.total                                                        # total event count
+        Counts[1] = gauntlet.total - gauntlet.count(cuts.retrigger) if retriggerfilter else 0 # re-trigger filter
+        Counts[2] = gauntlet.count(cuts.fv)                                               # inside AV count
+        Counts[3] = gauntlet.count(low_energy)                                            # how many actually pass the gauntlet
+        gauntlet.print_table("Energy cuts")
+
+    return h_energy, Counts, uncleaned
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+class UncleanedEnergy(object): 
+
+    """
+
+    Description:
+    Low energy spectrum and counts of the original unfiltered data (every event with a valid partialFitter energy, no
+    re-trigger filter or position cut), filled alongside h_energy by EHistMaker or EnergyConsumer so plot_fit_energy
+    can compare them without reading the files again
+
+    Parameters:
+    ERange : list of floats
+        The energy range of h_energy
+    ECut : float
+        Energy below which events are considered "low energy", upper edge of the histogram
+
+    Attributes:
+    h_fit_energy_3 : ArrayHist1D
+        Default fit energy of the events with a valid fit, between ERange[0] and ECut
+    OriginalCount, OriginalCountValidFit, LowECountUnfiltered : ints
+        All events, those with a valid fit energy, and those of them below ECut
+
+    """
+
+    def __init__(self, ERange, ECut):
+
+        nbins = 100
+        LowEnbins = int(nbins*(ECut-ERange[0])/(ERange[1]-ERange[0]))
+        self.ECut = ECut
+        self.h_fit_energy_3 = ArrayHist1D("QpartialFitter", "Removing Retrigger Events Test", LowEnbins, ERange[0], ECut)
+        self.OriginalCount = 0
+        self.OriginalCountValidFit = 0
+        self.LowECountUnfiltered = 0
+
+    def fill_event(self, ev):
+
+        """
+        Add one event, an EventView (sharing its fit result lookup with the cuts)
+        """
+
+        self.OriginalCount += 1
+
+        if not ev.valid_energy : return
+
+        self.OriginalCountValidFit += 1
+
+        energy = ev.default_energy
+        if energy < self.ECut : 
+            self.LowECountUnfiltered += 1
+        self.h_fit_energy_3.fill(energy)
+
+    def fill_array(self, valid_energy, default_energy):
+
+        """
+        Add a chunk of events, from the event_cache columns "valid_energy" and "default_energy"
+        """
+
+        self.OriginalCount += len(valid_energy)
+        energy = default_energy[valid_energy]
+        self.OriginalCountValidFit += len(energy)
+        self.LowECountUnfiltered += np.count_nonzero(energy < self.ECut)
+        self.h_fit_energy_3.fill_array(energy)
+
+    def merge(self, other):
+
+        """
+        Add the counts and histogram of other (UncleanedEnergy with the same ERange and ECut), return self
+        """
+
+        self.OriginalCount += other.OriginalCount
+        self.OriginalCountValidFit += other.OriginalCountValidFit
+        self.LowECountUnfiltered += other.LowECountUnfiltered
+        self.h_fit_energy_3.merge(other.h_fit_energy_3)
+        return self
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+class EnergyConsumer(object): 
+
+    """
+
+    Description:
+    The EHistMaker energy histogram as a consumer of analysis_runner.run_analysis, so it can be filled in the same pass
+    as the other histograms
+
+    Parameters:
+    ERange : list of floats
+        The energy range for the histogram
+    ECut : float
+        Energy below which events are cut
+    hist_display_title : str
+        Title of the histogram
+    uncleaned : UncleanedEnergy or None
+        Also filled with every event before any cut (for plot_fit_energy)
+
+    Returns (result):
+    h_energy : TH1D histogram
+        The energy histogram
+    Counts : list 
+        CountTotal, CountTrigger, CountRadius, CountValid, LowECountFiltered (as EHistMaker)
+
+    """
+
+    def __init__(self, ERange, ECut, hist_display_title, uncleaned=None):
+
+        self.uncleaned = uncleaned
+        self.h_energy = ArrayHist1D("h_energy_name", hist_display_title, 100, ERange[0], ERange[1])
+        self.low_energy = cuts.energy_min(ECut)
+        self.gauntlet = cuts.CutFlow([cuts.fv, cuts.valid_energy, self.low_energy])
+        self.columns = self.gauntlet.columns + ["default_energy"]
+
+    def begin_file(self, fname):
+        pass
+
+    def consume(self, events, keep):
+
+        if self.uncleaned is not None :
+            self.uncleaned.fill_array(events["valid_energy"], events["default_energy"]) # original unfiltered data
+
+        self.h_energy.fill_array(events["energy"][self.gauntlet.mask(events, keep)])
+
+    def result(self, counts):
+
+        self.gauntlet.print_table("Energy cuts")
+        return self.h_energy.to_TH1D(), [counts[0], counts[1], self.gauntlet.count(cuts.fv), self.gauntlet.count(self.low_energy), 0]
 # ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
 
 # ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
-def plot_fit_energy(input_files, h_energy, compare_uncleaned, Counts, ERange, ECut, plotTitle):
+def plot_fit_energy(h_energy, Counts, ERange, ECut, plotTitle, uncleaned=None):
     
     """ 
 
@@ -115,11 +315,11 @@ def plot_fit_energy(input_files, h_energy, compare_uncleaned, Counts, ERange, EC
     
     Parameters:
     h_energy    - pre-processed data in a histogram labelled "h_energy_name"
-    input_files - list of name(s) of unfiltered root file(s) that h_energy was made from
     Counts      - counts from the filtered data, as they make it through each of the filtering gauntlets 
                 - CountTotal, CountTrigger, CountRadius, CountValid, LowECountFiltered
     ERange      - energy range of the histogram h_energy_range [MeV]
     ECut        - arbitrary cutoff below which events are considered "low energy" [MeV]
+    uncleaned   - UncleanedEnergy filled by EHistMaker along with h_energy, to compare with the unfiltered data (or None)
 
     Returns:
     return - The histogram plot TCanvas
@@ -137,33 +337,14 @@ def plot_fit_energy(input_files, h_energy, compare_uncleaned, Counts, ERange, EC
         print "Failed to get data histogram"
         sys.exit(1)
 
-    # create low E histogram from original unfiltered data
+    # low E histogram from original unfiltered data, filled by EHistMaker
+    compare_uncleaned = uncleaned is not None
     if compare_uncleaned :
-        OriginalCount = 0
-        OriginalCountValidFit = 0
-        LowECountUnfiltered = 0
-        LowEnbins = int(nbins*(ECut-ERange[0])/(ERange[1]-ERange[0]))
-        h_fit_energy_3 = ROOT.TH1D("QpartialFitter", "Removing Retrigger Events Test", LowEnbins, ERange[0], ECut)
-        h_fit_energy_3.SetDirectory(0)
+        OriginalCount = uncleaned.OriginalCount
+        OriginalCountValidFit = uncleaned.OriginalCountValidFit
+        LowECountUnfiltered = uncleaned.LowECountUnfiltered
+        h_fit_energy_3 = uncleaned.h_fit_energy_3.to_TH1D()
         h_fit_energy_3.SetStats(0)
-        for fname in input_files :
-            for ds, run in dsreader(fname):
-                for iev in range(0, ds.GetEVCount()):
-
-                    ev = ds.GetEV(iev)
-                    OriginalCount += 1
-
-                    fVertex = ev.GetFitResult("partialFitter").GetVertex(0)
-
-                    if not fVertex.ValidEnergy():
-                        continue
-
-                    OriginalCountValidFit += 1
-
-                    if ev.GetDefaultFitVertex().GetEnergy() < ECut : 
-                        LowECountUnfiltered += 1
-
-                    h_fit_energy_3.Fill(ev.GetDefaultFitVertex().GetEnergy())
 
     canvas = ROOT.TCanvas("canvas")                                                    # make canvas       
     canvas.cd()
@@ -183,24 +364,17 @@ def plot_fit_energy(input_files, h_energy, compare_uncleaned, Counts, ERange, EC
     h_fit_energy_0.GetXaxis().SetTitle("Fitted energy [MeV]")
     h_fit_energy_0.GetYaxis().SetRangeUser(0, max_bin_value + 0.1*max_bin_value)
 
-    gaussFit00 = ROOT.TF1("gaussfit", "gaus", ECut, ERange[1])                         # auto-determine range for gauss fitting
-    h_fit_energy_0.Fit(gaussFit00, "ERL")                    
-    fit00 = []
-    fit00.append(h_fit_energy_0.GetMean())                                             # mean 
-    fit00.append(gaussFit00.GetParameter(2))                                           # stdev
+    centres, contents = fit_scheduler.histogram_arrays(h_fit_energy_0)
+    seeds = energy_fit.seeds_from_ranges(centres, [[ECut, ERange[1]]], contents)              # start from the mean and spread above ECut
+    fit = fit_scheduler.run_fits([fit_scheduler.fit_job(h_fit_energy_0, "peaks", [ECut, ERange[1]], seeds=seeds, background=False)])[0]
 
-    gaussFit0 = ROOT.TF1("gaussfit", "gaus", fit00[0]-5*fit00[1], fit00[0]+5*fit00[1]) # actual gaussian fit
-    h_fit_energy_0.Fit(gaussFit0, "ERL")    
+    gaussFit0 = ROOT.TF1("gaussfit", "gaus", fit["mean"][0]-5*fit["sigma"][0], fit["mean"][0]+5*fit["sigma"][0]) # gaussian fit
+    gaussFit0.SetParameters(*energy_fit.gaus_parameters(fit, 0, h_fit_energy_0.GetBinWidth(1), [ECut, ERange[1]]))
     
-    fit0 = [] 
-    fit0.append(gaussFit0.GetChisquare())  # chi20       0
-    fit0.append(gaussFit0.GetNDF())        # ndf0        1
-    fit0.append(gaussFit0.GetParameter(1)) # mean0       2
-    fit0.append(gaussFit0.GetParError(1))  # mean0error  3
-    fit0.append(gaussFit0.GetParameter(2)) # sigma0      4
-    fit0.append(gaussFit0.GetParError(2))  # sigma0error 5
+    fit0 = [fit["chi2"], fit["ndf"], fit["mean"][0], fit["mean_error"][0], fit["sigma"][0], fit["sigma_error"][0]] # chi2, ndf, mean, error, sigma, error
 
     h_fit_energy_0.Draw()
+    gaussFit0.Draw("same")
     if compare_uncleaned :
         h_fit_energy_3.Draw("same")
 
@@ -246,11 +420,14 @@ def plot_fit_energy(input_files, h_energy, compare_uncleaned, Counts, ERange, EC
 # ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
 
 # ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
-def plot_dual_multiple_fit_E(h_energy_MC, h_energy_data, ERange, plotTitle):
+def plot_dual_multiple_fit_E(h_energy_MC, h_energy_data, energies_MC, energies_data, ERange, plotTitle, n_workers=1):
     
     ''' 
     Description:
     2 pads, 2 peaks in each, fit both peaks in each canvas with Gaussians
+    The peaks (+ flat background) are fitted together to the unbinned energies with energy_fit.py, over the range 
+    covering both peak ranges, starting from the mean and spread of the energies in each peak range
+    Without peak ranges, the peaks are found by energy_fit.find_peaks and fitted within 3 sigma of them
     Save as pdf
     
     Parameters:
@@ -258,10 +435,15 @@ def plot_dual_multiple_fit_E(h_energy_MC, h_energy_data, ERange, plotTitle):
         Histogram containing MC data
     h_energy_data : ROOT TH1D
         Histogram containing data
+    energies_MC, energies_data : numpy arrays of floats
+        The energies filled in h_energy_MC and h_energy_data (EHistMaker with return_energies)
     ERange : list of lists
         structured like [[total energy range], [range of 1st MC peak], [range of 2nd MC peak], [range of 1st data peak], [range of 2nd data peak]]
+        or just [[total energy range]] to find the peaks automatically
     plotTitle : str
         What to title the output file
+    n_workers : int
+        Number of processes the MC and data fits are shared between (fit_scheduler.py, which also keeps the results)
 
     Returns:
     canvas : ROOT TCanvas
@@ -280,6 +462,24 @@ def plot_dual_multiple_fit_E(h_energy_MC, h_energy_data, ERange, plotTitle):
         print "Failed to get data histogram"
         sys.exit(1)
 
+    if len(ERange) >= 5 : # hand-picked peak ranges
+        fit_range_MC = [min(ERange[1][0], ERange[2][0]), max(ERange[1][1], ERange[2][1])]
+        fit_range_data = [min(ERange[3][0], ERange[4][0]), max(ERange[3][1], ERange[4][1])]
+        seeds_MC = energy_fit.seeds_from_ranges(energies_MC, ERange[1:3])
+        seeds_data = energy_fit.seeds_from_ranges(energies_data, ERange[3:5])
+    else :
+        seeds_MC = energy_fit.find_peaks(energies_MC, ERange[0])
+        seeds_data = energy_fit.find_peaks(energies_data, ERange[0])
+        if len(seeds_MC) < 2 or len(seeds_data) < 2 :
+            print "Failed to find both peaks, give their ranges in ERange"
+            sys.exit(1)
+        fit_range_MC = energy_fit.seeds_range(seeds_MC, ERange[0])
+        fit_range_data = energy_fit.seeds_range(seeds_data, ERange[0])
+
+    fitMC, fitData = fit_scheduler.run_fits([fit_scheduler.fit_job(energies_MC, "peaks", fit_range_MC, seeds=seeds_MC),
+                                             fit_scheduler.fit_job(energies_data, "peaks", fit_range_data, seeds=seeds_data)],
+                                            n_workers)
+
     canvas = ROOT.TCanvas("canvas")     
     canvas.Divide(1,2)  
 
@@ -294,56 +494,18 @@ def plot_dual_multiple_fit_E(h_energy_MC, h_energy_data, ERange, plotTitle):
     h_energy_MC.GetXaxis().SetTitle("Fitted energy [MeV]")
     h_energy_MC.GetYaxis().SetRangeUser(0, max_bin_value_MC + 0.1*max_bin_value_MC)
 
-    gaussFit0MC = ROOT.TF1("gaussFit0MC", "gaus", ERange[1][0], ERange[1][1]) # temp fit with built in range
-    h_energy_MC.Fit(gaussFit0MC, "ERL") # fit Po peak                
-    fitMCtemppeakPo = []
-    fitMCtemppeakPo.append(gaussFit0MC.GetParameter(1))                                    # mean 
-    fitMCtemppeakPo.append(gaussFit0MC.GetParameter(2))                                    # stdev
-
-    gaussFit1MC = ROOT.TF1("gaussFit1MC", "gaus", ERange[2][0], ERange[2][1]) # temp fit with built in range
-    h_energy_MC.Fit(gaussFit1MC, "ERL") # fit Bi peak                
-    fitMCtemppeakBi = []
-    fitMCtemppeakBi.append(gaussFit1MC.GetParameter(1))                                    # mean 
-    fitMCtemppeakBi.append(gaussFit1MC.GetParameter(2))                                    # stdev
-
-
-    gaussFit0MC = ROOT.TF1("gaussFit0MC", "gaus", fitMCtemppeakPo[0]-2.0*fitMCtemppeakPo[1], fitMCtemppeakPo[0]+2.0*fitMCtemppeakPo[1]) # actual gaussian fit
-    h_energy_MC.Fit(gaussFit0MC, "ERL")   
-    fitMCtemppeakPo = []
-    fitMCtemppeakPo.append(gaussFit0MC.GetParameter(1))                                    # mean 
-    fitMCtemppeakPo.append(gaussFit0MC.GetParameter(2))                                    # stdev
- 
-    gaussFit1MC = ROOT.TF1("gaussFit1MC", "gaus", fitMCtemppeakBi[0]-2.0*fitMCtemppeakBi[1], fitMCtemppeakBi[0]+2.0*fitMCtemppeakBi[1]) # actual gaussian fit
-    h_energy_MC.Fit(gaussFit1MC, "ERL")                
-    fitMCtemppeakBi = []
-    fitMCtemppeakBi.append(gaussFit1MC.GetParameter(1))                                    # mean 
-    fitMCtemppeakBi.append(gaussFit1MC.GetParameter(2))                                    # stdev
-
-
-    # last time, symmetrical 
-    gaussFit0MC = ROOT.TF1("gaussFit0MC", "gaus", fitMCtemppeakPo[0]-2.0*fitMCtemppeakPo[1], fitMCtemppeakPo[0]+2.0*fitMCtemppeakPo[1]) # actual gaussian fit
-    h_energy_MC.Fit(gaussFit0MC, "ERL")    
- 
-    gaussFit1MC = ROOT.TF1("gaussFit1MC", "gaus", fitMCtemppeakBi[0]-2.0*fitMCtemppeakBi[1], fitMCtemppeakBi[0]+2.0*fitMCtemppeakBi[1]) # actual gaussian fit
-    h_energy_MC.Fit(gaussFit1MC, "ERL+")  
+    gaussFit0MC = ROOT.TF1("gaussFit0MC", "gaus", fitMC["mean"][0]-2.0*fitMC["sigma"][0], fitMC["mean"][0]+2.0*fitMC["sigma"][0]) # Po peak
+    gaussFit0MC.SetParameters(*energy_fit.gaus_parameters(fitMC, 0, h_energy_MC.GetBinWidth(1), fit_range_MC))
+    gaussFit1MC = ROOT.TF1("gaussFit1MC", "gaus", fitMC["mean"][1]-2.0*fitMC["sigma"][1], fitMC["mean"][1]+2.0*fitMC["sigma"][1]) # Bi peak
+    gaussFit1MC.SetParameters(*energy_fit.gaus_parameters(fitMC, 1, h_energy_MC.GetBinWidth(1), fit_range_MC))
     
-    fit0 = [] 
-    fit0.append(gaussFit0MC.GetChisquare())  # chi20       0
-    fit0.append(gaussFit0MC.GetNDF())        # ndf0        1
-    fit0.append(gaussFit0MC.GetParameter(1)) # mean0       2
-    fit0.append(gaussFit0MC.GetParError(1))  # mean0error  3
-    fit0.append(gaussFit0MC.GetParameter(2)) # sigma0      4
-    fit0.append(gaussFit0MC.GetParError(2))  # sigma0error 5
-    fit1 = [] 
-    fit1.append(gaussFit1MC.GetChisquare())  # chi20       0
-    fit1.append(gaussFit1MC.GetNDF())        # ndf0        1
-    fit1.append(gaussFit1MC.GetParameter(1)) # mean0       2
-    fit1.append(gaussFit1MC.GetParError(1))  # mean0error  3
-    fit1.append(gaussFit1MC.GetParameter(2)) # sigma0      4
-    fit1.append(gaussFit1MC.GetParError(2))  # sigma0error 5
+    fit0 = [fitMC["chi2"], fitMC["ndf"], fitMC["mean"][0], fitMC["mean_error"][0], fitMC["sigma"][0], fitMC["sigma_error"][0]] # chi2, ndf (of both peaks), mean, error, sigma, error
+    fit1 = [fitMC["chi2"], fitMC["ndf"], fitMC["mean"][1], fitMC["mean_error"][1], fitMC["sigma"][1], fitMC["sigma_error"][1]]
     
 
     h_energy_MC.Draw()
+    gaussFit0MC.Draw("same")
+    gaussFit1MC.Draw("same")
 
     legendMC = ROOT.TLegend(0.73, 0.73, 0.9, 0.9) 
     legendMC.AddEntry(h_energy_MC, "Fitted BiPo MC  ")        
@@ -365,14 +527,14 @@ def plot_dual_multiple_fit_E(h_energy_MC, h_energy_data, ERange, plotTitle):
     latex.DrawText(xloc0, yloc0, "n = %i (Entries)"%(h_energy_MC.GetEntries()))
     latex.DrawLatex(xloc0, yloc0-0.04, "Mean = %.3f #pm %.4f MeV"%(fit0[2], fit0[3]))
     latex.DrawLatex(xloc0, yloc0-0.08, "#sigma = %.3f #pm %.4f"%(fit0[4], fit0[5]))
-    latex.DrawLatex(xloc0, yloc0-0.12, "#Chi^{2}n/ndf = %.1f/%i"%(fit0[0]*h_energy_MC.GetEntries(), fit0[1]))
+    latex.DrawLatex(xloc0, yloc0-0.12, "#Chi^{2}/ndf = %.1f/%i"%(fit0[0], fit0[1]))
 
     latex.SetTextSize(0.04)
     latex.DrawText(xloc0-0.01, yloc1, "Peak with Mean %.2f MeV"%(fit1[2])) 
     latex.SetTextSize(0.03)
     latex.DrawLatex(xloc0, yloc1-0.04, "Mean = %.3f #pm %.4f MeV"%(fit1[2], fit1[3]))
     latex.DrawLatex(xloc0, yloc1-0.08, "#sigma = %.3f #pm %.4f"%(fit1[4], fit1[5]))
-    latex.DrawLatex(xloc0, yloc1-0.12, "#Chi^{2}n/ndf = %.1f/%i"%(fit1[0]*h_energy_MC.GetEntries(), fit1[1]))
+    latex.DrawLatex(xloc0, yloc1-0.12, "#Chi^{2}/ndf = %.1f/%i"%(fit1[0], fit1[1]))
     
     # ===============================================================================================     
     canvas.cd(2)
@@ -386,55 +548,18 @@ def plot_dual_multiple_fit_E(h_energy_MC, h_energy_data, ERange, plotTitle):
     h_energy_data.GetYaxis().SetRangeUser(0, max_bin_value_data + 0.1*max_bin_value_data) 
 
     
-    gaussFit0data = ROOT.TF1("gaussFit0data", "gaus", ERange[3][0], ERange[3][1]) # temp fit with hardcoded range
-    h_energy_data.Fit(gaussFit0data, "ERL") # fit Po peak                
-    fitDatatemppeakPo = []
-    fitDatatemppeakPo.append(gaussFit0data.GetParameter(1))                                    # mean 
-    fitDatatemppeakPo.append(gaussFit0data.GetParameter(2))                                    # stdev
-
-    gaussFit1data = ROOT.TF1("gaussFit1data", "gaus", ERange[4][0], ERange[4][1]) # temp fit with hard coded range
-    h_energy_data.Fit(gaussFit1data, "ERL") # fit Po peak                
-    fitDatatemppeakBi = []
-    fitDatatemppeakBi.append(gaussFit1data.GetParameter(1))                                    # mean 
-    fitDatatemppeakBi.append(gaussFit1data.GetParameter(2))                                    # stdev
-
-    gaussFit0data = ROOT.TF1("gaussFit0data", "gaus", fitDatatemppeakPo[0]-2.0*fitDatatemppeakPo[1], fitDatatemppeakPo[0]+2.0*fitDatatemppeakPo[1]) # actual gaussian fit
-    h_energy_data.Fit(gaussFit0data, "ERL")  
-    fitDatatemppeakPo = []
-    fitDatatemppeakPo.append(gaussFit0data.GetParameter(1))                                    # mean 
-    fitDatatemppeakPo.append(gaussFit0data.GetParameter(2))                                    # stdev  
- 
-    gaussFit1data = ROOT.TF1("gaussFit1data", "gaus", fitDatatemppeakBi[0]-2.0*fitDatatemppeakBi[1], fitDatatemppeakBi[0]+2.0*fitDatatemppeakBi[1]) # actual gaussian fit
-    h_energy_data.Fit(gaussFit1data, "ERL")     
-    fitDatatemppeakBi = []
-    fitDatatemppeakBi.append(gaussFit1data.GetParameter(1))                                    # mean 
-    fitDatatemppeakBi.append(gaussFit1data.GetParameter(2))                                    # stdev
-
-
-    gaussFit0data = ROOT.TF1("gaussFit0data", "gaus", fitDatatemppeakPo[0]-2.0*fitDatatemppeakPo[1], fitDatatemppeakPo[0]+2.0*fitDatatemppeakPo[1]) # actual gaussian fit
-    h_energy_data.Fit(gaussFit0data, "ERL")    
- 
-    gaussFit1data = ROOT.TF1("gaussFit1data", "gaus", fitDatatemppeakBi[0]-2.0*fitDatatemppeakBi[1], fitDatatemppeakBi[0]+2.0*fitDatatemppeakBi[1]) # actual gaussian fit
-    h_energy_data.Fit(gaussFit1data, "ERL+")     
+    gaussFit0data = ROOT.TF1("gaussFit0data", "gaus", fitData["mean"][0]-2.0*fitData["sigma"][0], fitData["mean"][0]+2.0*fitData["sigma"][0]) # Po peak
+    gaussFit0data.SetParameters(*energy_fit.gaus_parameters(fitData, 0, h_energy_data.GetBinWidth(1), fit_range_data))
+    gaussFit1data = ROOT.TF1("gaussFit1data", "gaus", fitData["mean"][1]-2.0*fitData["sigma"][1], fitData["mean"][1]+2.0*fitData["sigma"][1]) # Bi peak
+    gaussFit1data.SetParameters(*energy_fit.gaus_parameters(fitData, 1, h_energy_data.GetBinWidth(1), fit_range_data))
 
-    
-    fit0D = [] 
-    fit0D.append(gaussFit0data.GetChisquare())  # chi20       0
-    fit0D.append(gaussFit0data.GetNDF())        # ndf0        1
-    fit0D.append(gaussFit0data.GetParameter(1)) # mean0       2
-    fit0D.append(gaussFit0data.GetParError(1))  # mean0error  3
-    fit0D.append(gaussFit0data.GetParameter(2)) # sigma0      4
-    fit0D.append(gaussFit0data.GetParError(2))  # sigma0error 5
-    fit1D = [] 
-    fit1D.append(gaussFit1data.GetChisquare())  # chi20       0
-    fit1D.append(gaussFit1data.GetNDF())        # ndf0        1
-    fit1D.append(gaussFit1data.GetParameter(1)) # mean0       2
-    fit1D.append(gaussFit1data.GetParError(1))  # mean0error  3
-    fit1D.append(gaussFit1data.GetParameter(2)) # sigma0      4
-    fit1D.append(gaussFit1data.GetParError(2))  # sigma0error 5
+    fit0D = [fitData["chi2"], fitData["ndf"], fitData["mean"][0], fitData["mean_error"][0], fitData["sigma"][0], fitData["sigma_error"][0]]
+    fit1D = [fitData["chi2"], fitData["ndf"], fitData["mean"][1], fitData["mean_error"][1], fitData["sigma"][1], fitData["sigma_error"][1]]
     
 
     h_energy_data.Draw()
+    gaussFit0data.Draw("same")
+    gaussFit1data.Draw("same")
 
     legend = ROOT.TLegend(0.73, 0.73, 0.9, 0.9) 
     legend.AddEntry(h_energy_data, "Fitted BiPo Data")         
@@ -455,14 +580,14 @@ def plot_dual_multiple_fit_E(h_energy_MC, h_energy_data, ERange, plotTitle):
     latex.DrawText(xloc0, yloc0, "n = %i (Entries)"%(h_energy_data.GetEntries()))
     latex.DrawLatex(xloc0, yloc0-0.04, "Mean = %.3f #pm %.4f MeV"%(fit0D[2], fit0D[3]))
     latex.DrawLatex(xloc0, yloc0-0.08, "#sigma = %.3f #pm %.4f"%(fit0D[4], fit0D[5]))
-    latex.DrawLatex(xloc0, yloc0-0.12, "#Chi^{2}n/ndf = %.1f/%i"%(fit0D[0]*h_energy_data.GetEntries(), fit0D[1]))
+    latex.DrawLatex(xloc0, yloc0-0.12, "#Chi^{2}/ndf = %.1f/%i"%(fit0D[0], fit0D[1]))
 
     latex.SetTextSize(0.04)
     latex.DrawText(xloc0-0.01, yloc1, "Peak with Mean %.2f MeV"%(fit1D[2])) 
     latex.SetTextSize(0.03)
     latex.DrawLatex(xloc0, yloc1-0.04, "Mean = %.3f #pm %.4f MeV"%(fit1D[2], fit1D[3]))
     latex.DrawLatex(xloc0, yloc1-0.08, "#sigma = %.3f #pm %.4f"%(fit1D[4], fit1D[5]))
-    latex.DrawLatex(xloc0, yloc1-0.12, "#Chi^{2}n/ndf = %.1f/%i"%(fit1D[0]*h_energy_data.GetEntries(), fit1D[1]))
+    latex.DrawLatex(xloc0, yloc1-0.12, "#Chi^{2}/ndf = %.1f/%i"%(fit1D[0], fit1D[1]))
     
     # =============================================================================================== 
 
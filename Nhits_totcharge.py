@@ -2,17 +2,27 @@
 
 import ROOT
 from rat import dsreader
+from event_view import EventView
+from array_hist import ArrayHist1D
+import event_cache
+import cuts
+import av_geometry
+import analysis_runner
+import hist_store
+import numpy as np
 import math
 import sys
 
 
 # ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
-def histMaker(input_files, NhitsRange, QRange, hist_display_title, retriggerfilter):
+def histMaker(input_files, NhitsRange, QRange, hist_display_title, retriggerfilter, use_cache=False, n_workers=1, use_store=False):
 
     """
 
     Description:
     Extract data from root file(s), apply retrigger filtering, and return histograms "h_Nhits_name" and "h_totcharge_name"
+    Each file is done separately by histPartial (in n_workers processes) and the partial histograms are merged in file 
+    order, so the result doesn't depend on n_workers
 
     Parameters:
     input_files - root files to extract data from
@@ -20,6 +30,9 @@ def histMaker(input_files, NhitsRange, QRange, hist_display_title, retriggerfilt
     QRange - range to plot on x axis (units of Coulombs)
     hist_display_title - list containing the titles of the histograms, unused
     retriggerfilter - bool 
+    use_cache - bool, read the events through event_cache.py instead of the dsreader (ROOT is only read the first time)
+    n_workers - int, number of processes the files are shared between
+    use_store - bool, take the partial histograms of each unchanged file from hist_store.py, only processing new or changed files
 
     Returns:
     h_Nhits - the TH1D Nhits histogram
@@ -28,18 +41,52 @@ def histMaker(input_files, NhitsRange, QRange, hist_display_title, retriggerfilt
 
     """
 
+    args = (NhitsRange, QRange, retriggerfilter, use_cache)
+    map_files = hist_store.map_files_stored if use_store else analysis_runner.map_files
+    partials = map_files(histPartial, input_files, args, n_workers)
+    h_Nhits, h_totcharge, Counts = analysis_runner.merge_partials([histPartial([], *args)] + partials) # starting from empty
+
+    return h_Nhits.to_TH1D(), h_totcharge.to_TH1D(), Counts
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def histPartial(input_files, NhitsRange, QRange, retriggerfilter, use_cache):
+
+    """
+
+    Description:
+    The histMaker loop, returning the (picklable, mergeable) ArrayHist1Ds instead of TH1Ds
+
+    Parameters:
+    As histMaker
+
+    Returns:
+    h_Nhits - ArrayHist1D
+    h_totcharge - ArrayHist1D
+    Counts - list  [CountTotal, CountTrigger, CountValid, CountRadius, LowECountFiltered]
+
+    """
+
     fitName = "partialFitter"
 
     nbins = 100
     Counts = [0, 0, 0, 0, 0]        # CountTotal, CountTrigger, CountRadius, CountValid, LowECountFiltered
 
-    h_Nhits = ROOT.TH1D("h_Nhits_name", "Nhits Fit", nbins, NhitsRange[0], NhitsRange[1])
-    h_Nhits.SetDirectory(0)
-    h_totcharge = ROOT.TH1D("h_totcharge_name", "Total Charge Fit", nbins, QRange[0], QRange[1])
-    h_totcharge.SetDirectory(0)
+    h_Nhits = ArrayHist1D("h_Nhits_name", "Nhits Fit", nbins, NhitsRange[0], NhitsRange[1])
+    h_totcharge = ArrayHist1D("h_totcharge_name", "Total Charge Fit", nbins, QRange[0], QRange[1])
+
+    gauntlet = cuts.CutFlow(([cuts.retrigger] if retriggerfilter else []) + [cuts.valid_position, cuts.in_av, cuts.valid_energy])
 
     for fname in input_files :
 
+        if use_cache : # same gauntlet on the cached columns, a chunk at a time
+            for events in event_cache.iter_chunks(event_cache.load_events(fname, fitName), gauntlet.columns + ["energy", "nhits", "pos_energy_error"]) :
+                keep = gauntlet.mask(events)
+                Counts[4] += np.count_nonzero(events["energy"][keep] < 0.2) # keep track of LowE which pass the filter
+                h_Nhits.fill_array(events["nhits"][keep])
+                h_totcharge.fill_array(events["pos_energy_error"][keep])
+            continue
+
         for ds, run in dsreader(fname): # ds is equivalent to dsreader.GetEntry(i) in c++
 
             for iev in range(0, ds.GetEVCount()):
@@ -50,39 +97,84 @@ def histMaker(input_files, NhitsRange, QRange, hist_display_title, retriggerfilt
                     continue                                             # re-trigger filter
                 Counts[1] += 1                                           # events that aren't re-triggers count
 
-                ev = ds.GetEV(iev)
+                ev = EventView(ds.GetEV(iev), fitName) # fit result read once
 
-                if not ev.FitResultExists(fitName) or not ev.GetFitResult(fitName).GetVertex(0).ContainsPosition() or not ev.GetFitResult(fitName).GetVertex(0).ValidPosition() :
+                if not ev.valid_position :
                     continue
 
-                fVertex = ev.GetFitResult(fitName).GetVertex(0)
-                PosEV = fVertex.GetPosition()
-                REV = PosEV.Mag()
-                RhoEV = math.sqrt(PosEV.X()**2 + PosEV.Y()**2)
-
-                # see if inside the AV
-                if PosEV.Z() >= 6000 and RhoEV >= 730 :
-                    continue
-                if PosEV.Z() < 6000 and REV > 6000 :
+                # see if inside the AV (including the neck), as cuts.in_av
+                if not av_geometry.is_liquid(ev.x, ev.y, ev.z) :
                     continue
                 Counts[2] += 1                                           # inside AV count
 
-                if not fVertex.ValidEnergy():
+                if not ev.valid_energy:
                     continue
                 Counts[3] += 1                                           # how many actually pass the gauntlet
 
-                should_be_charge = fVertex.GetPositiveEnergyError()
+                should_be_charge = ev.vertex.GetPositiveEnergyError()
                 if Counts[0] % 100 == 0 : print should_be_charge
 
-                h_Nhits.Fill(ev.GetNhits())
-                h_totcharge.Fill(should_be_charge)
+                h_Nhits.fill(ev.nhits)
+                h_totcharge.fill(should_be_charge)
 
-                if fVertex.GetEnergy() < 0.2: #ECut:
+                if ev.energy < 0.2: #ECut:
                     Counts[4] += 1                                       # keep track of LowE which pass the filter
 
+    if use_cache :
+        Counts[0] = gauntlet.total                                                        # total event count
+        Counts[1] = gauntlet.count(cuts.retrigger) if retriggerfilter else gauntlet.total # events that aren't re-triggers count
+        Counts[2] = gauntlet.count(cuts.in_av)                                            # inside AV count
+        Counts[3] = gauntlet.count(cuts.valid_energy)                                     # how many actually pass the gauntlet
+        gauntlet.print_table("Nhits and charge cuts")
+
     return h_Nhits, h_totcharge, Counts
 # ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
 
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+class NhitsChargeConsumer(object):
+
+    """
+
+    Description:
+    The histMaker Nhits and charge histograms as a consumer of analysis_runner.run_analysis, so they can be filled in the
+    same pass as the other histograms
+
+    Parameters:
+    NhitsRange - range to plot on x axis (units of hits)
+    QRange - range to plot on x axis (units of Coulombs)
+
+    Returns (result):
+    h_Nhits - the TH1D Nhits histogram
+    h_totcharge - TH1D charge histogram
+    Counts - list  [CountTotal, CountTrigger, CountRadius, CountValid, LowECountFiltered] (as histMaker)
+
+    """
+
+    def __init__(self, NhitsRange, QRange):
+
+        self.h_Nhits = ArrayHist1D("h_Nhits_name", "Nhits Fit", 100, NhitsRange[0], NhitsRange[1])
+        self.h_totcharge = ArrayHist1D("h_totcharge_name", "Total Charge Fit", 100, QRange[0], QRange[1])
+        self.gauntlet = cuts.CutFlow([cuts.in_av, cuts.valid_energy])
+        self.columns = self.gauntlet.columns + ["energy", "nhits", "pos_energy_error"]
+        self.LowECountFiltered = 0
+
+    def begin_file(self, fname):
+        pass
+
+    def consume(self, events, keep):
+
+        keep = self.gauntlet.mask(events, keep)
+        self.LowECountFiltered += np.count_nonzero(events["energy"][keep] < 0.2) # keep track of LowE which pass the filter
+        self.h_Nhits.fill_array(events["nhits"][keep])
+        self.h_totcharge.fill_array(events["pos_energy_error"][keep])
+
+    def result(self, counts):
+
+        self.gauntlet.print_table("Nhits and charge cuts")
+        Counts = [counts[0], counts[0] - counts[1], self.gauntlet.count(cuts.in_av), self.gauntlet.count(cuts.valid_energy), self.LowECountFiltered]
+        return self.h_Nhits.to_TH1D(), self.h_totcharge.to_TH1D(), Counts
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
 # ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
 def plot_Nhits_totcharge(h_Nhits, h_totcharge, Counts, NhitsRange, QRange):
     
@@ -227,7 +319,7 @@ def plot_Nhits_totcharge(h_Nhits, h_totcharge, Counts, NhitsRange, QRange):
 # ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
 
 # ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
-def histMaker_combo(input_files_MC, input_files_data, NhitsRange, QRange, retriggerfilter):
+def histMaker_combo(input_files_MC, input_files_data, NhitsRange, QRange, retriggerfilter, use_cache=False):
 
     """
 
@@ -243,6 +335,8 @@ def histMaker_combo(input_files_MC, input_files_data, NhitsRange, QRange, retrig
         Range to plot on x axis (units of Coulombs)
     retriggerfilter : bool 
         Whether to only use first event in an entry
+    use_cache : bool
+        Read the events through event_cache.py instead of the dsreader (ROOT is only read the first time)
 
     Returns:
     h_Nhits - the TH1D Nhits histogram
@@ -255,18 +349,24 @@ def histMaker_combo(input_files_MC, input_files_data, NhitsRange, QRange, retrig
     nbins = 100
     Counts = [0, 0, 0, 0, 0]        # CountTotal, CountTrigger, CountRadius, CountValid, LowECountFiltered
 
-    h_Nhits_MC = ROOT.TH1D("h_Nhits_name", "Normalized Nhits Fit", nbins, NhitsRange[0], NhitsRange[1])
-    h_Nhits_MC.SetDirectory(0)
-    h_totcharge_MC = ROOT.TH1D("h_totcharge_name", "Normalized Charge Fit", nbins, QRange[0], QRange[1])
-    h_totcharge_MC.SetDirectory(0)
+    h_Nhits_MC = ArrayHist1D("h_Nhits_name", "Normalized Nhits Fit", nbins, NhitsRange[0], NhitsRange[1])
+    h_totcharge_MC = ArrayHist1D("h_totcharge_name", "Normalized Charge Fit", nbins, QRange[0], QRange[1])
 
-    h_Nhits_data = ROOT.TH1D("h_Nhits_name", "Normalized Nhits Fit", nbins, NhitsRange[0], NhitsRange[1])
-    h_Nhits_data.SetDirectory(0)
-    h_totcharge_data = ROOT.TH1D("h_totcharge_name", "Normalized Charge Fit", nbins, QRange[0], QRange[1])
-    h_totcharge_data.SetDirectory(0)
+    h_Nhits_data = ArrayHist1D("h_Nhits_name", "Normalized Nhits Fit", nbins, NhitsRange[0], NhitsRange[1])
+    h_totcharge_data = ArrayHist1D("h_totcharge_name", "Normalized Charge Fit", nbins, QRange[0], QRange[1])
+
+    gauntlet_MC = cuts.CutFlow(([cuts.retrigger] if retriggerfilter else []) + [cuts.valid_position, cuts.fv, cuts.valid_energy, cuts.energy_min(0.5)])
+    gauntlet_data = cuts.CutFlow(([cuts.retrigger] if retriggerfilter else []) + [cuts.valid_position, cuts.fv, cuts.valid_energy])
 
     for fname in input_files_MC :
 
+        if use_cache : # same gauntlet on the cached columns, a chunk at a time
+            for events in event_cache.iter_chunks(event_cache.load_events(fname, fitName), gauntlet_MC.columns + ["nhits", "total_charge"]) :
+                keep = gauntlet_MC.mask(events)
+                h_Nhits_MC.fill_array(events["nhits"][keep])
+                h_totcharge_MC.fill_array(events["total_charge"][keep])
+            continue
+
         for ds, run in dsreader(fname): # ds is equivalent to dsreader.GetEntry(i) in c++
 
             for iev in range(0, ds.GetEVCount()):
@@ -292,11 +392,18 @@ def histMaker_combo(input_files_MC, input_files_data, NhitsRange, QRange, retrig
                 finalE = fVertex.GetEnergy()
                 if finalE < 0.5: continue
 
-                h_Nhits_MC.Fill(ev.GetNhits())
-                h_totcharge_MC.Fill(ev.GetTotalCharge())
+                h_Nhits_MC.fill(ev.GetNhits())
+                h_totcharge_MC.fill(ev.GetTotalCharge())
 
     for fname in input_files_data :
 
+        if use_cache : # same gauntlet on the cached columns, a chunk at a time
+            for events in event_cache.iter_chunks(event_cache.load_events(fname, fitName), gauntlet_data.columns + ["nhits", "pos_energy_error"]) :
+                keep = gauntlet_data.mask(events)
+                h_Nhits_data.fill_array(events["nhits"][keep])
+                h_totcharge_data.fill_array(events["pos_energy_error"][keep])
+            continue
+
         for ds, run in dsreader(fname): # ds is equivalent to dsreader.GetEntry(i) in c++
 
             for iev in range(0, ds.GetEVCount()):
@@ -323,8 +430,15 @@ def histMaker_combo(input_files_MC, input_files_data, NhitsRange, QRange, retrig
 
                 should_be_charge = fVertex.GetPositiveEnergyError()
 
-                h_Nhits_data.Fill(ev.GetNhits())
-                h_totcharge_data.Fill(should_be_charge)
+                h_Nhits_data.fill(ev.GetNhits())
+                h_totcharge_data.fill(should_be_charge)
+
+    if use_cache :
+        gauntlet_MC.print_table("MC cuts")
+        gauntlet_data.print_table("Data cuts")
+
+    h_Nhits_MC, h_Nhits_data = h_Nhits_MC.to_TH1D(), h_Nhits_data.to_TH1D()
+    h_totcharge_MC, h_totcharge_data = h_totcharge_MC.to_TH1D(), h_totcharge_data.to_TH1D()
 
     h_Nhits_MC.Scale(1/h_Nhits_MC.GetEntries())
     h_Nhits_data.Scale(1/h_Nhits_data.GetEntries())
@@ -0,0 +1,184 @@
+# analysis_runner.py
+
+'''
+Make several analysis products from one read of the input files. Each product is a consumer object (EFit.EnergyConsumer,
+Nhits_totcharge.NhitsChargeConsumer, posFit.ZRhoConsumer, delta_r_t.DeltaRTConsumer) with :
+
+    columns                 list of the event_cache columns it needs
+    begin_file(fname)       called before the events of each input file
+    consume(events, keep)   called for each chunk of events (dict of numpy arrays, file order) with the shared cuts
+    result(counts)          returns the product, counts being [total, re-triggers, valid position after re-triggers]
+
+e.g.
+    (h_energy, Counts), (h_Nhits, h_totcharge, Counts_n) = run_analysis(input_files,
+                                        [EFit.EnergyConsumer(ERange, ECut, title), Nhits_totcharge.NhitsChargeConsumer(NhitsRange, QRange)])
+'''
+
+import cuts
+import event_cache
+import multiprocessing
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def run_analysis(input_files, consumers, fitName="partialFitter", retriggerfilter=True, use_cache=False, chunk_size=100000):
+
+    '''
+
+    Description
+    -----------
+    Read each input file once, chunk_size events at a time, apply the shared cuts (re-trigger filter and valid position)
+    once per chunk, and pass the chunk to every consumer.
+
+    Parameters
+    ----------
+    input_files : list of str
+        RAT DS files to process.
+    consumers : list of consumer objects
+        See the module docstring.
+    fitName : str
+        Fit result to use.
+    retriggerfilter : bool
+        Whether to only use the first event in an entry.
+    use_cache : bool
+        Read the events through event_cache.py instead of the dsreader (ROOT is only read the first time).
+    chunk_size : int
+        Number of events per chunk.
+
+    Returns
+    -------
+    results : list
+        consumer.result(counts) of each consumer, in the same order.
+
+    '''
+
+    shared = cuts.CutFlow(([cuts.retrigger] if retriggerfilter else []) + [cuts.valid_position])
+
+    columns = set(shared.columns)
+    for consumer in consumers :
+        columns.update(consumer.columns)
+    columns = sorted(columns)
+
+    for fname in input_files :
+
+        for consumer in consumers :
+            consumer.begin_file(fname)
+
+        if use_cache :
+            chunks = event_cache.iter_chunks(event_cache.load_events(fname, fitName), columns, chunk_size)
+        else :
+            chunks = (event_cache.add_derived_columns(events) for events in event_cache.read_event_chunks(fname, fitName, chunk_size))
+
+        for events in chunks :
+
+            keep = shared.mask(events)
+            for consumer in consumers :
+                consumer.consume(events, keep)
+
+    shared.print_table("Shared cuts")
+
+    counts = [shared.total, shared.total - shared.count(cuts.retrigger) if retriggerfilter else 0, shared.count(cuts.valid_position)]
+    return [consumer.result(counts) for consumer in consumers]
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def map_files(file_func, input_files, args=(), n_workers=1):
+
+    '''
+
+    Description
+    -----------
+    Run file_func([fname], *args) for every input file, in n_workers processes, e.g. the per-file partial histograms of
+    EFit.EHistPartial. Each file is done the same way whichever process does it, so with merge_partials the result is
+    the same (bit for bit) for any number of workers.
+
+    Parameters
+    ----------
+    file_func : function
+        Module level function (so it can be pickled) taking a list of input files, then args.
+    input_files : list of str
+        RAT DS files to process.
+    args : tuple
+        Other arguments of file_func.
+    n_workers : int
+        Number of processes, 1 to run everything in this one.
+
+    Returns
+    -------
+    partials : list
+        What file_func returned for each file, in the order of input_files.
+
+    '''
+
+    jobs = [(file_func, [fname], args) for fname in input_files]
+    if n_workers <= 1 or len(jobs) <= 1 :
+        return [run_job(job) for job in jobs]
+
+    pool = multiprocessing.Pool(min(n_workers, len(jobs)))
+    try :
+        return pool.map(run_job, jobs, chunksize=1) # in order of input_files, whichever worker did them
+    finally :
+        pool.close()
+        pool.join()
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def run_job(job):
+
+    '''
+    Call file_func(input_files, *args) for job = (file_func, input_files, args), in a worker process.
+    '''
+
+    file_func, input_files, args = job
+    return file_func(input_files, *args)
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def merge_partials(partials):
+
+    '''
+
+    Description
+    -----------
+    Combine partial results, in order, into the first one : objects with a merge method (array_hist.ArrayHist1D/2D, 
+    cuts.CutFlow, EFit.UncleanedEnergy) are merged, numbers are added, and lists and tuples are combined element by 
+    element (so a maker's (histogram, Counts) partials give the (histogram, Counts) of all the files). None stays None.
+
+    Parameters
+    ----------
+    partials : list
+        Partial results with the same structure, e.g. from map_files. Not empty.
+
+    Returns
+    -------
+    merged : same structure as each partial
+
+    '''
+
+    merged = partials[0]
+    for partial in partials[1:] :
+        merged = merge_two(merged, partial)
+    return merged
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def merge_two(a, b):
+
+    '''
+    Combine two partial results (see merge_partials), reusing a where possible.
+    '''
+
+    if a is None and b is None : return None
+    if hasattr(a, "merge") : return a.merge(b)
+    if isinstance(a, (list, tuple)) :
+        if len(a) != len(b) : raise ValueError("Can't merge partial results of different lengths.")
+        return type(a)(merge_two(x, y) for x, y in zip(a, b))
+    return a + b
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
@@ -0,0 +1,294 @@
+# array_hist.py
+
+'''
+Histograms filled from numpy instead of one TH1D.Fill call per event: values are buffered and binned in batches,
+and only turned into a ROOT TH1D when one is asked for (to_TH1D). They are plain numpy arrays, so they can be pickled
+and sent between processes, and partial histograms (e.g. one per file) are combined exactly with merge.
+'''
+
+import ROOT
+import numpy as np
+from array import array
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+class ArrayHist1D(object):
+
+    '''
+
+    Description
+    -----------
+    Fixed-bin 1D histogram with the same binning, under/overflow and statistics as a ROOT TH1D: bin 0 is the
+    underflow, nbins + 1 the overflow (including nan), and the statistics (mean, RMS) only use the bins in range.
+
+    Parameters
+    ----------
+    name, title : str
+        Name and title of the TH1D.
+    nbins : int
+        Number of bins between lo and hi.
+    lo, hi : floats
+        Histogram range.
+    buffer_size : int
+        Number of single fill() values collected before they are binned.
+    keep_values : bool
+        Also keep every value filled (unbinned, e.g. for energy_fit.py), returned by values().
+
+    '''
+
+    def __init__(self, name, title, nbins, lo, hi, buffer_size=100000, keep_values=False):
+
+        self.name = name
+        self.title = title
+        self.nbins = int(nbins)
+        self.lo = float(lo)
+        self.hi = float(hi)
+        self.buffer_size = buffer_size
+
+        self.sumw = np.zeros(self.nbins + 2)  # per bin, including under/overflow
+        self.sumw2 = np.zeros(self.nbins + 2)
+        self.entries = 0
+        self.stats = np.zeros(4)              # sum of w, w^2, w*x, w*x^2 over the bins in range (as TH1::GetStats)
+        self.buffer = []                      # values from fill(), not binned yet
+        self.weights = []
+        self.keep_values = keep_values
+        self.kept = []                        # arrays of values filled, with keep_values
+
+    def fill(self, x, w=1.0):
+
+        '''
+        Add one value x (with weight w), like TH1D.Fill.
+        '''
+
+        self.buffer.append(x)
+        self.weights.append(w)
+        if len(self.buffer) >= self.buffer_size : self.flush()
+
+    def fill_array(self, x, w=None):
+
+        '''
+        Add every value in x (array-like), with weights w (array-like or None for 1).
+        '''
+
+        x = np.asarray(x, dtype=np.float64)
+        if w is None :
+            w = np.ones(len(x))
+        else :
+            w = np.asarray(w, dtype=np.float64)
+
+        idx, in_range = find_fix_bins(x, self.nbins, self.lo, self.hi)
+
+        self.sumw += np.bincount(idx, weights=w, minlength=self.nbins + 2)
+        self.sumw2 += np.bincount(idx, weights=w*w, minlength=self.nbins + 2)
+        self.entries += len(x)
+        if self.keep_values : self.kept.append(x.copy())
+
+        w, x = w[in_range], x[in_range]
+        self.stats += [w.sum(), (w*w).sum(), (w*x).sum(), (w*x*x).sum()]
+
+    def flush(self):
+
+        '''
+        Bin the values collected by fill().
+        '''
+
+        if not self.buffer : return
+        self.fill_array(self.buffer, self.weights)
+        self.buffer = []
+        self.weights = []
+
+    def merge(self, other):
+
+        '''
+        Add the contents of other (ArrayHist1D with the same binning) to this histogram, and return it.
+        Merging the same partial histograms in the same order always gives the same (bit for bit) result.
+        '''
+
+        if (self.nbins, self.lo, self.hi) != (other.nbins, other.lo, other.hi) :
+            raise ValueError("Can't merge %s into %s, the binning is different."%(other.name, self.name))
+        self.flush()
+        other.flush()
+        self.sumw += other.sumw
+        self.sumw2 += other.sumw2
+        self.entries += other.entries
+        self.stats += other.stats
+        self.kept += other.kept
+        return self
+
+    def GetEntries(self):
+
+        self.flush()
+        return self.entries
+
+    def values(self):
+
+        '''
+        Every value filled (numpy array of floats, in fill order), with keep_values.
+        '''
+
+        self.flush()
+        return np.concatenate(self.kept) if self.kept else np.zeros(0)
+
+    def to_TH1D(self):
+
+        '''
+        Build the ROOT TH1D (not attached to any file) with the contents, errors, entries and statistics.
+        '''
+
+        self.flush()
+
+        hist = ROOT.TH1D(self.name, self.title, self.nbins, self.lo, self.hi)
+        hist.SetDirectory(0)
+        for iBin in range(self.nbins + 2) :
+            hist.SetBinContent(iBin, self.sumw[iBin])
+            hist.SetBinError(iBin, np.sqrt(self.sumw2[iBin]))
+        hist.SetEntries(self.entries)
+        hist.PutStats(array("d", self.stats))
+        return hist
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+class ArrayHist2D(object):
+
+    '''
+
+    Description
+    -----------
+    Fixed-bin 2D histogram with the binning and statistics of a ROOT TH2D, filled in batches like ArrayHist1D.
+
+    Parameters
+    ----------
+    name, title : str
+        Name and title of the TH2D.
+    nbinsx, xlo, xhi, nbinsy, ylo, yhi : int, floats
+        Binning of each axis, as for TH2D.
+    buffer_size : int
+        Number of single fill() values collected before they are binned.
+
+    '''
+
+    def __init__(self, name, title, nbinsx, xlo, xhi, nbinsy, ylo, yhi, buffer_size=100000):
+
+        self.name = name
+        self.title = title
+        self.xaxis = (int(nbinsx), float(xlo), float(xhi))
+        self.yaxis = (int(nbinsy), float(ylo), float(yhi))
+
+        self.sumw = np.zeros((self.yaxis[0] + 2)*(self.xaxis[0] + 2)) # global bin ix + (nbinsx + 2)*iy, as ROOT
+        self.sumw2 = np.zeros(len(self.sumw))
+        self.entries = 0
+        self.stats = np.zeros(7) # sum of w, w^2, w*x, w*x^2, w*y, w*y^2, w*x*y over the bins in range
+        self.buffer_size = buffer_size
+        self.buffer = []         # (x, y, w) from fill(), not binned yet
+
+    def fill(self, x, y, w=1.0):
+
+        '''
+        Add one pair of values x, y (with weight w), like TH2D.Fill.
+        '''
+
+        self.buffer.append((x, y, w))
+        if len(self.buffer) >= self.buffer_size : self.flush()
+
+    def flush(self):
+
+        '''
+        Bin the values collected by fill().
+        '''
+
+        if not self.buffer : return
+        x, y, w = zip(*self.buffer)
+        self.buffer = []
+        self.fill_array(x, y, w)
+
+    def fill_array(self, x, y, w=None):
+
+        '''
+        Add every pair of values in x and y (array-likes), with weights w (array-like or None for 1).
+        '''
+
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        w = np.ones(len(x)) if w is None else np.asarray(w, dtype=np.float64)
+
+        ix, x_in = find_fix_bins(x, *self.xaxis)
+        iy, y_in = find_fix_bins(y, *self.yaxis)
+
+        idx = ix + (self.xaxis[0] + 2)*iy
+        self.sumw += np.bincount(idx, weights=w, minlength=len(self.sumw))
+        self.sumw2 += np.bincount(idx, weights=w*w, minlength=len(self.sumw))
+        self.entries += len(x)
+
+        in_range = x_in & y_in
+        w, x, y = w[in_range], x[in_range], y[in_range]
+        self.stats += [w.sum(), (w*w).sum(), (w*x).sum(), (w*x*x).sum(), (w*y).sum(), (w*y*y).sum(), (w*x*y).sum()]
+
+    def merge(self, other):
+
+        '''
+        Add the contents of other (ArrayHist2D with the same binning) to this histogram, and return it.
+        '''
+
+        if (self.xaxis, self.yaxis) != (other.xaxis, other.yaxis) :
+            raise ValueError("Can't merge %s into %s, the binning is different."%(other.name, self.name))
+        self.flush()
+        other.flush()
+        self.sumw += other.sumw
+        self.sumw2 += other.sumw2
+        self.entries += other.entries
+        self.stats += other.stats
+        return self
+
+    def to_TH2D(self):
+
+        '''
+        Build the ROOT TH2D (not attached to any file) with the contents, errors, entries and statistics.
+        '''
+
+        self.flush()
+
+        hist = ROOT.TH2D(self.name, self.title, self.xaxis[0], self.xaxis[1], self.xaxis[2], self.yaxis[0], self.yaxis[1], self.yaxis[2])
+        hist.SetDirectory(0)
+        for iy in range(self.yaxis[0] + 2) :
+            for ix in range(self.xaxis[0] + 2) :
+                iBin = ix + (self.xaxis[0] + 2)*iy
+                hist.SetBinContent(ix, iy, self.sumw[iBin])
+                hist.SetBinError(ix, iy, np.sqrt(self.sumw2[iBin]))
+        hist.SetEntries(self.entries)
+        hist.PutStats(array("d", self.stats))
+        return hist
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def find_fix_bins(x, nbins, lo, hi):
+
+    '''
+
+    Description
+    -----------
+    Bin index of every value in x, as TAxis::FindFixBin : 0 below lo, nbins + 1 from hi up (and nan), 
+    otherwise 1 + int(nbins*(x - lo)/(hi - lo)).
+
+    Returns (all in a tuple)
+    -------
+    idx : numpy array of ints
+    in_range : numpy array of bools
+        Whether each value is in one of bins 1 to nbins.
+
+    '''
+
+    with np.errstate(invalid="ignore") :
+        underflow = x < lo
+        overflow = ~(x < hi) & ~underflow
+    in_range = ~underflow & ~overflow
+
+    idx = np.empty(len(x), dtype=np.int64)
+    idx[underflow] = 0
+    idx[overflow] = nbins + 1
+    idx[in_range] = 1 + (nbins*(x[in_range] - lo)/(hi - lo)).astype(np.int64)
+    return idx, in_range
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
@@ -0,0 +1,124 @@
+# av_geometry.py
+
+'''
+Boundaries of the acrylic vessel (AV) and its neck, and the region of the detector each position is in, worked out for
+whole arrays of positions at once, e.g.
+
+    region = av_geometry.classify(events["x"], events["y"], events["z"])
+    in_neck = region == av_geometry.NECK
+    in_liquid = av_geometry.in_regions(region, av_geometry.LIQUID)
+
+and is_liquid does the same for one position, in per-event loops. The boundaries are defined here only (cuts.py uses
+the same constants). Positions in [mm], with z along the neck.
+'''
+
+import numpy as np
+
+R_AV = 6000.0          # [mm] AV radius (inner surface)
+R_AV_OUTER = 6055.0    # [mm] outer surface of the AV
+Z_FV_MIN = 747.5       # [mm] lowest z of the FV (scintillator above the water in the partial fill)
+Z_NECK = 6000.0        # [mm] start of the neck
+Z_NECK_BOSS = 6055.0   # [mm] top of the neck boss (where the neck joins the outer surface of the AV)
+RHO_NECK = 730.0       # [mm] neck radius (inner surface)
+RHO_NECK_OUTER = 755.0 # [mm] outer surface of the neck
+RHO_NECK_BOSS = 785.0  # [mm] outer radius of the neck boss
+
+# region codes, as returned by classify
+INVALID = 0      # no position (nan, e.g. invalid fit or data without MC)
+SCINTILLATOR = 1 # inside the AV, from Z_FV_MIN up to the neck
+WATER = 2        # inside the AV, below Z_FV_MIN (water phase of the partial fill)
+NECK = 3         # inside the neck
+AV_SHELL = 4     # in the acrylic of the AV or neck
+OUTSIDE = 5      # outside the acrylic
+
+REGION_NAMES = {INVALID : "invalid", SCINTILLATOR : "scintillator", WATER : "water", NECK : "neck",
+                AV_SHELL : "AV shell", OUTSIDE : "outside"}
+
+LIQUID = (SCINTILLATOR, WATER, NECK) # everything inside the acrylic
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def classify(x, y, z):
+
+    '''
+
+    Description
+    -----------
+    Region of each position, with the first of these that applies :
+
+        INVALID         x, y or z is nan
+        NECK            z > 0, rho < RHO_NECK and r > R_AV (from where the neck meets the sphere, below Z_NECK, up)
+        SCINTILLATOR    r <= R_AV and z >= Z_FV_MIN
+        WATER           r <= R_AV and z < Z_FV_MIN
+        AV_SHELL        r <= R_AV_OUTER, or z >= Z_NECK and rho < RHO_NECK_BOSS (below Z_NECK_BOSS) or
+                        RHO_NECK_OUTER (above)
+        OUTSIDE         anything else
+
+    Parameters
+    ----------
+    x, y, z : array-likes of floats
+        Positions [mm], e.g. the "x", "y", "z" or "mc_x", "mc_y", "mc_z" event columns.
+
+    Returns
+    -------
+    region : numpy array of int8
+        Region code of each position.
+
+    '''
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    z = np.asarray(z, dtype=np.float64)
+    rho2 = x**2 + y**2
+    r2 = rho2 + z**2
+
+    with np.errstate(invalid="ignore") : # nan positions fail every comparison, and are caught by the first condition
+        inside_av = r2 <= R_AV**2
+        rho_neck_outer = np.where(z < Z_NECK_BOSS, RHO_NECK_BOSS, RHO_NECK_OUTER)
+        conditions = [np.isnan(r2),
+                      (z > 0) & (rho2 < RHO_NECK**2) & ~inside_av,
+                      inside_av & (z >= Z_FV_MIN),
+                      inside_av,
+                      (r2 <= R_AV_OUTER**2) | ((z >= Z_NECK) & (rho2 < rho_neck_outer**2))]
+
+    return np.select(conditions, [INVALID, NECK, SCINTILLATOR, WATER, AV_SHELL], OUTSIDE).astype(np.int8)
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def in_regions(region, codes):
+
+    '''
+    Whether each region code in region (numpy array, from classify) is one of codes (int or sequence of ints, e.g. LIQUID).
+    '''
+
+    return np.in1d(region, np.atleast_1d(codes)).reshape(np.shape(region))
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def is_liquid(x, y, z):
+
+    '''
+    Whether one position (floats [mm]) is in LIQUID, as classify would say, without its numpy overhead : inside the AV,
+    or in the neck. False for nan.
+    '''
+
+    rho2 = x*x + y*y
+    return rho2 + z*z <= R_AV**2 or (z > 0 and rho2 < RHO_NECK**2)
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def region_counts(region):
+
+    '''
+    Number of positions in each region (dict, region name : int) of region (numpy array, from classify).
+    '''
+
+    counts = np.bincount(np.asarray(region, dtype=np.int64), minlength=len(REGION_NAMES))
+    return dict((REGION_NAMES[code], int(counts[code])) for code in REGION_NAMES)
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
@@ -0,0 +1,162 @@
+# bipo_pairs.py
+
+'''
+Fixed-dtype binary output of tagged BiPo pairs: one packed record per pair, appended to the file as they are found, 
+so a file of any size can be loaded (or memory-mapped) straight back into a numpy record array.
+'''
+
+import os
+import zlib
+import numpy as np
+
+PAIR_DTYPE = np.dtype([("file_id", "<u4"),                                   # file_id() of the input file
+                       ("bi_entry", "<i8"), ("bi_iev", "<i4"), ("bi_gtid", "<i8"),
+                       ("po_entry", "<i8"), ("po_iev", "<i4"), ("po_gtid", "<i8"),
+                       ("delta_r", "<f8"), ("delta_t", "<f8"),                # [mm], [ns]
+                       ("bi_x", "<f8"), ("bi_y", "<f8"), ("bi_z", "<f8"),     # [mm]
+                       ("po_x", "<f8"), ("po_y", "<f8"), ("po_z", "<f8"),     # [mm]
+                       ("bi_nhits_cleaned", "<i4"), ("po_nhits_cleaned", "<i4")])
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def file_id(fname):
+
+    '''
+    Stable 32 bit id for an input file name (str, as in bipo214_comb's in_files), stored in every pair record.
+    '''
+
+    return zlib.crc32(fname) & 0xffffffff
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def pairs_to_records(pairs, fid):
+
+    '''
+
+    Description
+    -----------
+    Convert pairs from find_bipo214_pairs_window into a PAIR_DTYPE record array.
+
+    Parameters
+    ----------
+    pairs : list of tuples
+        (iEntryBi, iEvBi, BiGTID, iEntryPo, iEvPo, PoGTID, delta_r, delta_t, (bi x, y, z), (po x, y, z), 
+        bi nhits cleaned, po nhits cleaned)
+    fid : int
+        file_id of the input file.
+
+    Returns
+    -------
+    records : numpy record array of PAIR_DTYPE
+
+    '''
+
+    records = np.zeros(len(pairs), dtype=PAIR_DTYPE)
+    for i in range(len(pairs)) :
+        pair = pairs[i]
+        records[i] = (fid, pair[0], pair[1], pair[2], pair[3], pair[4], pair[5], pair[6], pair[7], 
+                      pair[8][0], pair[8][1], pair[8][2], pair[9][0], pair[9][1], pair[9][2], pair[10], pair[11])
+    return records
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+class PairWriter(object):
+
+    '''
+
+    Description
+    -----------
+    Append pair records to a binary file as they are found, buffering chunk_size pairs at a time. 
+
+    Parameters
+    ----------
+    pairFile : str
+        full path to the output file, overwritten if it exists.
+    fid : int
+        file_id of the input file the pairs come from.
+    chunk_size : int
+        Number of pairs buffered before they are written.
+
+    '''
+
+    def __init__(self, pairFile, fid, chunk_size=10000):
+
+        self.pairFile = pairFile
+        self.fid = fid
+        self.chunk_size = chunk_size
+        self.buffer = []
+        self.nwritten = 0
+        self.fo = open(pairFile, 'wb') # write mode deletes if prexisting
+
+    def write(self, pairs):
+
+        '''
+        Add pairs (list of tuples, as in pairs_to_records) to the file.
+        '''
+
+        self.buffer.extend(pairs)
+        if len(self.buffer) >= self.chunk_size : self.flush()
+
+    def write_records(self, records):
+
+        '''
+        Add records (PAIR_DTYPE record array) to the file.
+        '''
+
+        self.flush()
+        np.asarray(records, dtype=PAIR_DTYPE).tofile(self.fo)
+        self.nwritten += len(records)
+
+    def flush(self):
+
+        if not self.buffer : return
+        pairs_to_records(self.buffer, self.fid).tofile(self.fo)
+        self.nwritten += len(self.buffer)
+        self.buffer = []
+
+    def close(self):
+
+        self.flush()
+        self.fo.close()
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def load_pairs(pairFiles, mmap=True):
+
+    '''
+
+    Description
+    -----------
+    Load pair records written by PairWriter.
+
+    Parameters
+    ----------
+    pairFiles : str or list of str
+        full path(s) to the pair file(s).
+    mmap : bool
+        Memory-map a single file read-only instead of reading it into memory. Several files are always concatenated 
+        in memory.
+
+    Returns
+    -------
+    records : numpy record array of PAIR_DTYPE
+
+    '''
+
+    if isinstance(pairFiles, basestring) : pairFiles = [pairFiles]
+
+    arrays = []
+    for pairFile in pairFiles :
+        if os.path.getsize(pairFile) == 0 : continue # can't memory-map an empty file
+        if mmap and len(pairFiles) == 1 : return np.memmap(pairFile, dtype=PAIR_DTYPE, mode='r')
+        arrays.append(np.fromfile(pairFile, dtype=PAIR_DTYPE))
+
+    if not arrays : return np.zeros(0, dtype=PAIR_DTYPE)
+    return np.concatenate(arrays)
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
@@ -0,0 +1,98 @@
+# bipo_spatial.py
+
+'''
+Voxel-hash spatial index, so coincidence searches only compare events that are close to each other.
+'''
+
+import math
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+class VoxelHash(object):
+
+    '''
+
+    Description
+    -----------
+    Points hashed into cubic voxels of side cell_size. A query with radius <= cell_size only looks at the 27 voxels 
+    around the query point, so its cost depends on the local density of points, not on how many are stored.
+
+    Parameters
+    ----------
+    cell_size : float
+        Voxel side length [mm], normally the largest radius that will be queried (bipo_delta_r_max).
+
+    '''
+
+    def __init__(self, cell_size):
+
+        self.cell_size = float(cell_size)
+        self.voxels = {} # voxel (ix, iy, iz) -> {key : (x, y, z, item)}
+        self.where = {}  # key -> voxel
+
+    def __len__(self):
+
+        return len(self.where)
+
+    def __contains__(self, key):
+
+        return key in self.where
+
+    def voxel(self, x, y, z):
+
+        return (int(math.floor(x/self.cell_size)), int(math.floor(y/self.cell_size)), int(math.floor(z/self.cell_size)))
+
+    def insert(self, key, x, y, z, item=None):
+
+        '''
+        Store item at position (x, y, z) [mm] under a unique (hashable) key.
+        '''
+
+        v = self.voxel(x, y, z)
+        self.voxels.setdefault(v, {})[key] = (x, y, z, item)
+        self.where[key] = v
+
+    def remove(self, key):
+
+        '''
+        Remove key from the index, does nothing if it isn't stored.
+        '''
+
+        v = self.where.pop(key, None)
+        if v is None : return
+        voxel = self.voxels[v]
+        del voxel[key]
+        if not voxel : del self.voxels[v]
+
+    def query(self, x, y, z, radius):
+
+        '''
+
+        Description
+        -----------
+        Find every stored point closer than radius to (x, y, z).
+
+        Returns
+        -------
+        found : list of tuples
+            (distance [mm], key, item) for every point with distance < radius, in no particular order.
+
+        '''
+
+        reach = int(math.ceil(radius/self.cell_size))
+        ix, iy, iz = self.voxel(x, y, z)
+        found = []
+
+        for jx in range(ix-reach, ix+reach+1) :
+            for jy in range(iy-reach, iy+reach+1) :
+                for jz in range(iz-reach, iz+reach+1) :
+
+                    voxel = self.voxels.get((jx, jy, jz))
+                    if not voxel : continue
+
+                    for key, (px, py, pz, item) in voxel.iteritems() :
+                        distance = math.sqrt((x - px)**2 + (y - py)**2 + (z - pz)**2)
+                        if distance < radius : found.append((distance, key, item))
+
+        return found
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
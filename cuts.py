@@ -0,0 +1,300 @@
+# cuts.py
+
+'''
+Named event cuts written once as expressions over the event columns (event_cache.py names), evaluated as numpy boolean
+masks, and chained in a CutFlow that keeps the pass/fail count of each cut, e.g.
+
+    flow = cuts.CutFlow([cuts.retrigger, cuts.valid_position, cuts.fv, cuts.valid_energy, cuts.energy_min(ECut)])
+    for events in event_cache.iter_chunks(event_cache.load_events(fname, fitName), flow.columns) :
+        h_energy.fill_array(events["energy"][flow.mask(events)])
+    flow.print_table()
+
+Cuts combine with &, | and ~. Invalid fits have nan positions/energies, which fail every comparison (but pass a negated
+one, so put valid_position / valid_energy before the position and energy cuts).
+'''
+
+import numpy as np
+from av_geometry import R_AV, Z_FV_MIN, Z_NECK, RHO_NECK, LIQUID # [mm] boundaries and region codes, defined in av_geometry.py
+from av_geometry import in_regions
+
+FUNCTIONS = {"sqrt" : np.sqrt, "abs" : np.abs, "in_regions" : in_regions} # can be used in the expressions
+CONSTANTS = {"True" : True, "False" : False}     # names in py2, not columns
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+class Cut(object):
+
+    '''
+
+    Description
+    -----------
+    One named cut : a python expression over event columns, evaluated with numpy, True for the events that pass.
+
+    Parameters
+    ----------
+    name : str
+        Name shown in the cut flow table.
+    expr : str
+        Expression, e.g. "(r <= R_AV) & (z >= Z_FV_MIN)". Use &, |, ~ (not and, or, not) and brackets around comparisons.
+    params : dict or None
+        Values of the names in expr that are not columns (cut values). The module constants are always available.
+        expr has to read at least one event column, so a constant cut ("True") raises ValueError.
+
+    Attributes
+    ----------
+    columns : list of str
+        Event columns expr reads.
+
+    '''
+
+    def __init__(self, name, expr, params=None):
+
+        self.name = name
+        self.expr = expr
+        self.params = {"R_AV" : R_AV, "Z_FV_MIN" : Z_FV_MIN, "Z_NECK" : Z_NECK, "RHO_NECK" : RHO_NECK, "LIQUID" : LIQUID}
+        if params : self.params.update(params)
+
+        self.code = compile(expr, "<cut %s>"%name, "eval")
+        self.columns = sorted(set(self.code.co_names) - set(self.params) - set(FUNCTIONS) - set(CONSTANTS))
+        if not self.columns :
+            raise ValueError("Cut %r doesn't read any event column."%name)
+
+    def mask(self, events):
+
+        '''
+        Whether each event in events (dict of numpy arrays or event_cache.EventColumns) passes.
+        '''
+
+        namespace = dict((name, events[name]) for name in self.columns)
+        namespace.update(self.params)
+        with np.errstate(invalid="ignore") : # nan of invalid fits
+            passed = eval(self.code, dict(FUNCTIONS, __builtins__={}, **CONSTANTS), namespace)
+        return np.asarray(passed, dtype=bool)
+
+    def __and__(self, other):
+        return Cut("%s & %s"%(self.name, other.name), "(%s) & (%s)"%(self.expr, other.expr), merge_params(self, other))
+
+    def __or__(self, other):
+        return Cut("%s | %s"%(self.name, other.name), "(%s) | (%s)"%(self.expr, other.expr), merge_params(self, other))
+
+    def __invert__(self):
+        return Cut("not %s"%self.name, "~(%s)"%self.expr, self.params)
+
+    def __repr__(self):
+        return "Cut(%r, %r)"%(self.name, self.expr)
+
+    def __eq__(self, other):
+        return isinstance(other, Cut) and (self.name, self.expr, self.params) == (other.name, other.expr, other.params)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((self.name, self.expr))
+
+    def __reduce__(self): # the compiled code can't be pickled, compile it again
+        return (Cut, (self.name, self.expr, self.params))
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def merge_params(cut1, cut2):
+
+    '''
+    params of two combined cuts. Raises ValueError if they use the same name for different values.
+    '''
+
+    params = dict(cut1.params)
+    for name in cut2.params :
+        if name in params and params[name] != cut2.params[name] :
+            raise ValueError("Cuts %r and %r use %s with different values."%(cut1.name, cut2.name, name))
+        params[name] = cut2.params[name]
+    return params
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+class CutFlow(object):
+
+    '''
+
+    Description
+    -----------
+    A list of cuts applied one after the other. Each cut is only evaluated on the events that passed the cuts before it,
+    and the number of events each cut was tested on and passed is kept over every call of mask, for the cut flow table.
+
+    Parameters
+    ----------
+    cuts : list of Cuts
+        In the order of the table.
+    order_by_selectivity : bool
+        Evaluate the cuts that remove the most events first, so the later cuts see as few events as possible. The order
+        is estimated once, on up to sample_size events of the first call of mask, and kept after that so the counts of
+        every call (and merged flows) add up. The mask is the same, but each cut's counts are relative to the cuts
+        evaluated before it, so keep False when the counts are needed in the order of cuts.
+    sample_size : int
+        Number of events the pass fraction of each cut is estimated on, with order_by_selectivity.
+
+    Attributes
+    ----------
+    columns : list of str
+        Event columns needed by all the cuts.
+    total : int
+        Number of events given to mask (before keep).
+    tested, passed : lists of ints
+        Number of events each cut was evaluated on, and passed, in the order of cuts.
+    order : list of ints or None
+        Indices of the cuts in the order they are evaluated, None until it is fixed by the first events.
+
+    '''
+
+    def __init__(self, cuts, order_by_selectivity=False, sample_size=1000):
+
+        self.cuts = list(cuts)
+        self.order_by_selectivity = order_by_selectivity
+        self.sample_size = sample_size
+        self.columns = sorted(set(name for cut in self.cuts for name in cut.columns))
+        self.total = 0
+        self.tested = [0] * len(self.cuts)
+        self.passed = [0] * len(self.cuts)
+        self.order = None if order_by_selectivity and len(self.cuts) > 1 else range(len(self.cuts))
+
+    def mask(self, events, keep=None):
+
+        '''
+
+        Description
+        -----------
+        Apply every cut to events.
+
+        Parameters
+        ----------
+        events : dict of numpy arrays or event_cache.EventColumns
+            Has (at least) the columns of the cuts.
+        keep : numpy array of bools or None
+            Events already cut before the flow (not counted in tested), None for none.
+
+        Returns
+        -------
+        passed : numpy array of bools
+            Whether each event passes keep and every cut.
+
+        '''
+
+        nevents = len(keep) if keep is not None else len(events[self.columns[0]])
+        self.total += nevents
+        idx = np.arange(nevents) if keep is None else np.flatnonzero(keep) # events still passing
+
+        for iCut in self.evaluation_order(events, idx) :
+            if len(idx) == nevents :
+                selected = events
+            else :
+                selected = dict((name, events[name][idx]) for name in self.cuts[iCut].columns)
+            cut_passed = self.cuts[iCut].mask(selected)
+            self.tested[iCut] += len(idx)
+            idx = idx[cut_passed]
+            self.passed[iCut] += len(idx)
+
+        passed = np.zeros(nevents, dtype=bool)
+        passed[idx] = True
+        return passed
+
+    def evaluation_order(self, events, idx):
+
+        '''
+        Indices of the cuts in the order they are evaluated, fixed with the events idx (numpy array of ints) of events
+        the first time there are any.
+        '''
+
+        if self.order is not None : return self.order
+        if len(idx) == 0 : return range(len(self.cuts)) # nothing to estimate on, and nothing counted
+
+        sample = idx[:self.sample_size]
+        fraction = []
+        for cut in self.cuts :
+            fraction.append(np.count_nonzero(cut.mask(dict((name, events[name][sample]) for name in cut.columns)))/float(len(sample)))
+        self.order = sorted(range(len(self.cuts)), key=lambda iCut : fraction[iCut]) # stable, ties in the order of cuts
+        return self.order
+
+    def merge(self, other):
+
+        '''
+        Add the counts of other (CutFlow with the same cuts, e.g. from another process) to this one, and return it.
+        '''
+
+        if self.cuts != other.cuts :
+            raise ValueError("Can't merge cut flows with different cuts.")
+        if self.order is None :
+            self.order = other.order
+        elif other.order is not None and other.order != self.order :
+            raise ValueError("Can't merge cut flows whose cuts were evaluated in different orders.")
+        self.total += other.total
+        self.tested = [a + b for a, b in zip(self.tested, other.tested)]
+        self.passed = [a + b for a, b in zip(self.passed, other.passed)]
+        return self
+
+    def count(self, cut):
+
+        '''
+        Number of events that passed cut (one of the Cuts of the flow, or an equal one).
+        '''
+
+        return self.passed[self.cuts.index(cut)]
+
+    def table(self):
+
+        '''
+        [(cut name, events tested, events passed), ...] in the order the cuts are evaluated (the order of cuts unless
+        order_by_selectivity).
+        '''
+
+        order = self.order if self.order is not None else range(len(self.cuts))
+        return [(self.cuts[iCut].name, self.tested[iCut], self.passed[iCut]) for iCut in order]
+
+    def print_table(self, title="Cut flow"):
+
+        '''
+        Print the cut flow table : for each cut the events tested and passed, the fraction passing, and the fraction
+        of all the events left.
+        '''
+
+        print "\n\t%s (%i events)"%(title, self.total)
+        print "\t%-40s %12s %12s %9s %9s"%("cut", "tested", "passed", "pass [%]", "left [%]")
+        for name, tested, passed in self.table() :
+            print "\t%-40s %12i %12i %9.2f %9.2f"%(name, tested, passed, 100.*passed/tested if tested else 0,
+                                                 100.*passed/self.total if self.total else 0)
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def energy_min(ECut):
+
+    '''
+    Cut on the fitted energy, E >= ECut [MeV] (float).
+    '''
+
+    return Cut("E >= %g MeV"%ECut, "energy >= ECut", {"ECut" : ECut})
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def dc_cut(dc_mask):
+
+    '''
+    Data cleaning cut : every check of dc_mask (int bitmask) that was applied must have been passed (flagged).
+    '''
+
+    return Cut("data cleaning", "((dc_applied & dc_mask) & dc_flagged) == (dc_applied & dc_mask)", {"dc_mask" : np.uint64(dc_mask)})
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+retrigger = Cut("re-trigger filter", "iev == 0")           # only the first event of an entry
+valid_position = Cut("valid position", "valid_position")
+valid_energy = Cut("valid energy", "valid_energy")
+fv = Cut("FV", "(r <= R_AV) & (z >= Z_FV_MIN)")          # inside the AV, above the water
+in_av = Cut("inside AV", "in_regions(region, LIQUID)")    # scintillator, water or neck, as av_geometry.classify
@@ -2,12 +2,17 @@
 
 import ROOT
 from rat import dsreader
+from array_hist import ArrayHist1D
+import cuts
+import event_cache
+import fit_scheduler
+import numpy as np
 import math
 import sys
 
 
 # ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
-def histMaker(input_files, delta_r_range, delta_t_range, retriggerfilter):
+def histMaker(input_files, delta_r_range, delta_t_range, retriggerfilter, is_mc=False):
 
     """
 
@@ -23,6 +28,8 @@ def histMaker(input_files, delta_r_range, delta_t_range, retriggerfilter):
         Range to plot on x axis (units of micro s)
     retriggerfilter : bool 
         Whether to only use first event in an entry
+    is_mc : bool
+        Whether the files are MC (the re-trigger filter is only applied to MC)
 
     Returns:
     h_delta_r - the TH1D delta_r histogram
@@ -35,10 +42,8 @@ def histMaker(input_files, delta_r_range, delta_t_range, retriggerfilter):
     nbins = 100
     Counts = [0, 0, 0, 0, 0]        # CountTotal, CountTrigger, CountRadius, CountValid, LowECountFiltered
 
-    h_delta_r = ROOT.TH1D("h_delta_r_name", "#Delta r", nbins, delta_r_range[0], delta_r_range[1])
-    h_delta_r.SetDirectory(0)
-    h_delta_t = ROOT.TH1D("h_delta_t_name", "#Delta t", nbins, delta_t_range[0], delta_t_range[1])
-    h_delta_t.SetDirectory(0)
+    h_delta_r = ArrayHist1D("h_delta_r_name", "#Delta r", nbins, delta_r_range[0], delta_r_range[1])
+    h_delta_t = ArrayHist1D("h_delta_t_name", "#Delta t", nbins, delta_t_range[0], delta_t_range[1])
 
     skip_pair = False
 
@@ -94,23 +99,132 @@ def histMaker(input_files, delta_r_range, delta_t_range, retriggerfilter):
                             break
 
                         Counts[3] += 1 
-                        h_delta_r.Fill(delta_r)
-                        h_delta_t.Fill(delta_t)
+                        h_delta_r.fill(delta_r)
+                        h_delta_t.fill(delta_t)
 
                         break # break iev1 loop, should do anyways but to be safe
                     break # break ds1 loop, back to iev0 loop 
                 break # break iev0 loop and start the cycle again at ds0
 
-    return h_delta_r, h_delta_t
+    return h_delta_r.to_TH1D(), h_delta_t.to_TH1D()
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def histMaker_next(input_files, delta_r_range, delta_t_range, retriggerfilter, k_next=1, use_cache=False, return_delta_t=False):
+
+    """
+
+    Description:
+    Like histMaker, but from the event columns of each file with array operations only: every Bi candidate (valid energy,
+    inside the FV) is paired with each of the k_next events after it in the same file (next_event_pairs), and every pair
+    within delta_t_range is filled, in one call per file. Only events with a valid position are paired, and no entry is
+    skipped after a pair, so with k_next = 1 a Po candidate can also be the Bi of the next pair.
+
+    Parameters:
+    input_files : list of strs
+        root files to extract data from
+    delta_r_range list of floats
+        Range to plot on x axis (units of mm)
+    delta_t_range : list of floats
+        Range to plot on x axis (units of micro s)
+    retriggerfilter : bool 
+        Whether to only use first event in an entry
+    k_next : int
+        Number of following events each Bi candidate is paired with
+    use_cache : bool
+        Read the events through event_cache.py instead of the dsreader (ROOT is only read the first time)
+    return_delta_t : bool
+        Also return the delta t of every pair filled (unbinned, for the lifetime fit of plot_delta_r_t)
+
+    Returns:
+    h_delta_r - the TH1D delta_r histogram
+    h_delta_t - TH1D delta_t histogram
+    Counts    - CountTotal (valid position, after the re-trigger filter), bi invalid energy, bi outside FV, pairs in delta_t_range
+    delta_t   - only with return_delta_t, numpy array of the delta t in h_delta_t (units of micro s)
+
+    """
+
+    fitName = "partialFitter"
+
+    nbins = 100
+    h_delta_r = ArrayHist1D("h_delta_r_name", "#Delta r", nbins, delta_r_range[0], delta_r_range[1])
+    h_delta_t = ArrayHist1D("h_delta_t_name", "#Delta t", nbins, delta_t_range[0], delta_t_range[1], keep_values=return_delta_t)
+
+    paired = cuts.CutFlow(([cuts.retrigger] if retriggerfilter else []) + [cuts.valid_position])
+    bi_cuts = cuts.CutFlow([cuts.valid_energy, cuts.fv])
+    CountPairs = 0
+
+    for fname in input_files :
+
+        events = event_cache.load_events(fname, fitName, use_cache)
+        selected = np.flatnonzero(paired.mask(events))
+        events = dict((name, events[name][selected]) for name in set(bi_cuts.columns + ["x", "y", "z", "time"]))
+
+        delta_r, delta_t = next_event_pairs(events["x"], events["y"], events["z"], events["time"]/1000.0, bi_cuts.mask(events), k_next)
+
+        with np.errstate(invalid="ignore") : # nan past the end of the file
+            in_window = (delta_t >= delta_t_range[0]) & (delta_t <= delta_t_range[1])
+        CountPairs += np.count_nonzero(in_window)
+        h_delta_r.fill_array(delta_r[in_window])
+        h_delta_t.fill_array(delta_t[in_window])
+
+    paired.print_table("Paired events")
+    bi_cuts.print_table("Bi candidate cuts")
+    Counts = [bi_cuts.total, bi_cuts.total - bi_cuts.count(cuts.valid_energy), 
+              bi_cuts.count(cuts.valid_energy) - bi_cuts.count(cuts.fv), CountPairs]
+
+    if return_delta_t :
+        return h_delta_r.to_TH1D(), h_delta_t.to_TH1D(), Counts, h_delta_t.values()
+    return h_delta_r.to_TH1D(), h_delta_t.to_TH1D(), Counts
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def next_event_pairs(x, y, z, t, bi, k_next=1):
+
+    """
+
+    Description:
+    Distance and time from each Bi candidate to each of the k_next events after it, for all of them at once (the
+    candidate index plus 1..k_next picks the following events, so with k_next = 1 it is np.diff of the columns)
+
+    Parameters:
+    x, y, z : numpy arrays of floats
+        Fitted position of every event, in order (units of mm)
+    t : numpy array of floats
+        Time of every event (any unit, delta_t has the same)
+    bi : numpy array of bools
+        Whether each event is a Bi candidate
+    k_next : int
+        Number of following events to pair with
+
+    Returns:
+    delta_r - numpy array of floats, shape (number of Bi candidates, k_next), nan where there is no next event
+    delta_t - same for the time differences
+
+    """
+
+    first = np.flatnonzero(bi)[:, np.newaxis]
+    partner = first + np.arange(1, k_next + 1)[np.newaxis, :]
+    exists = partner < len(t)
+    partner = np.where(exists, partner, first) # any valid index, set to nan below
+
+    delta_t = (t[partner] - t[first]).astype(np.float64)
+    delta_r = np.sqrt((x[partner] - x[first])**2 + (y[partner] - y[first])**2 + (z[partner] - z[first])**2)
+    delta_t[~exists] = np.nan
+    delta_r[~exists] = np.nan
+
+    return delta_r, delta_t
 # ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
 
 # ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
-def plot_delta_r_t(h_delta_r, h_delta_t, Counts, delta_r_range, delta_t_range, outFile):
+def plot_delta_r_t(h_delta_r, h_delta_t, Counts, delta_r_range, delta_t_range, outFile, delta_t=None):
     
     """ 
 
     Description:
     Plot the two input histograms on different pads, export single pdf
+    The lifetime is fitted (lifetime_fit.py, through fit_scheduler.py) as an exponential + flat background over 
+    delta_t_range, to the unbinned delta t if given, otherwise to the bins of h_delta_t
     
     Parameters:
     h_delta_r     - pre-processed data in a histogram labelled "h_delta_r_name"
@@ -120,6 +234,7 @@ def plot_delta_r_t(h_delta_r, h_delta_t, Counts, delta_r_range, delta_t_range, o
     delta_r_range - range to plot on x axis (units of mm)
     delta_t_range - range to plot on x axis (units of ns)
     outFile       - str, name of output pdf
+    delta_t       - numpy array of the delta t in h_delta_t (histMaker_next with return_delta_t) or None
 
     Returns:
     return - The histogram plot TCanvas
@@ -196,16 +311,16 @@ def plot_delta_r_t(h_delta_r, h_delta_t, Counts, delta_r_range, delta_t_range, o
     h_delta_t.GetXaxis().SetTitle("#Delta t [#mus]")
     h_delta_t.GetYaxis().SetRangeUser(0, max_bin_value + 0.1*max_bin_value)
 
-    expoFit1 = ROOT.TF1("expofit", "expo", delta_t_range[0], delta_t_range[1]) # actual exponential fit
-    h_delta_t.Fit(expoFit1, "ERL")
+    fit1 = fit_scheduler.run_fits([fit_scheduler.fit_job(h_delta_t if delta_t is None else delta_t, "lifetime", delta_t_range)])[0]
 
-    fit1 = []
-    fit1.append(expoFit1.GetParameter(0))
-    fit1.append(expoFit1.GetParError(0))
-    fit1.append(expoFit1.GetParameter(1)) # mean0       2
-    fit1.append(expoFit1.GetParError(1))  # mean0error  3
+    width = delta_t_range[1] - delta_t_range[0]
+    events_per_bin = fit1["n_events"]*h_delta_t.GetBinWidth(1)
+    expoFit1 = ROOT.TF1("expofit", "[0]*exp(-(x - %f)/[1]) + [2]"%(delta_t_range[0]), delta_t_range[0], delta_t_range[1]) # exponential + flat fit
+    expoFit1.SetParameters((1 - fit1["background_fraction"])*events_per_bin/(fit1["tau"]*(1 - math.exp(-width/fit1["tau"]))), 
+                           fit1["tau"], fit1["background_fraction"]*events_per_bin/width)
 
     h_delta_t.Draw()
+    expoFit1.Draw("same")
 
     latex_delta_t = ROOT.TLatex()
     latex_delta_t.SetTextFont(62)
@@ -217,7 +332,8 @@ def plot_delta_r_t(h_delta_r, h_delta_t, Counts, delta_r_range, delta_t_range, o
     latex_delta_t.SetTextSize(0.03)
     latex_delta_t.DrawText(xloc, yloc, "%i Entries"%(h_delta_t.GetEntries()))
     latex_delta_t.DrawLatex(xloc, yloc-0.04, "Mean = %.1f #mus"%(h_delta_t.GetMean()))
-    latex_delta_t.DrawLatex(xloc, yloc-0.08, "#tau = %.1f #pm %.1f #mus"%(abs(1/fit1[2]), abs(fit1[3]/fit1[2]**2)))
+    latex_delta_t.DrawLatex(xloc, yloc-0.08, "#tau = %.1f #pm %.1f #mus"%(fit1["tau"], fit1["tau_error"]))
+    latex_delta_t.DrawLatex(xloc, yloc-0.12, "Background = %.1f #pm %.1f %%"%(100*fit1["background_fraction"], 100*fit1["background_fraction_error"]))
 
     # =================================================================
 
@@ -228,4 +344,89 @@ def plot_delta_r_t(h_delta_r, h_delta_t, Counts, delta_r_range, delta_t_range, o
     return canvas
     
     # =================================================================
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+class DeltaRTConsumer(object):
+
+    """
+
+    Description:
+    The histMaker delta r and delta t histograms as a consumer of analysis_runner.run_analysis, so they can be filled in
+    the same pass as the other histograms. Pairs up the first event of consecutive entries the same way histMaker does :
+    a Bi candidate (valid energy, inside the FV) is paired with the first event of the next entry, and the entry after a
+    rejected Bi or an out of range delta t is skipped. Entries carry over from one chunk to the next.
+
+    Parameters:
+    delta_r_range list of floats
+        Range to plot on x axis (units of mm)
+    delta_t_range : list of floats
+        Range to plot on x axis (units of micro s)
+
+    Returns (result):
+    h_delta_r - the TH1D delta_r histogram
+    h_delta_t - TH1D delta_t histogram
+
+    """
+
+    columns = ["iev", "valid_energy", "x", "y", "z", "r", "clock50"]
+    bi_fv = cuts.fv
+
+    def __init__(self, delta_r_range, delta_t_range):
+
+        self.delta_t_range = delta_t_range
+        self.h_delta_r = ArrayHist1D("h_delta_r_name", "#Delta r", 100, delta_r_range[0], delta_r_range[1])
+        self.h_delta_t = ArrayHist1D("h_delta_t_name", "#Delta t", 100, delta_t_range[0], delta_t_range[1])
+        self.Counts = [0, 0, 0, 0]     # CountTotal, CountValid, CountRadius, CountPairs
+        self.skip_pair = False
+        self.bi = None                 # (x, y, z, time [micro s]) of the Bi waiting for the next entry
+
+    def begin_file(self, fname):
+
+        self.bi = None # a Bi at the end of a file has no next entry
+
+    def consume(self, events, keep):
+
+        first = np.flatnonzero(events["iev"] == 0) # the first event of each entry, with or without the shared cuts
+        first_events = dict((name, events[name][first]) for name in self.columns)
+        in_fv = self.bi_fv.mask(first_events)
+        rows = zip(*[first_events[name].tolist() for name in ["valid_energy", "x", "y", "z", "clock50"]] + [in_fv.tolist()])
+
+        for valid_energy, x, y, z, clock50, bi_in_fv in rows :
+
+            if self.skip_pair :
+                self.skip_pair = False
+                continue
+
+            ev_time = clock50*20/1000 # [micro s]
+
+            if self.bi is None :
+                self.Counts[0] += 1                                      # total event count
+                if not valid_energy :
+                    self.Counts[1] += 1                                  # doesn't have valid energy
+                    self.skip_pair = True
+                elif not bi_in_fv :
+                    self.Counts[2] += 1
+                    self.skip_pair = True
+                else :
+                    self.bi = (x, y, z, ev_time)
+                continue
+
+            bi_x, bi_y, bi_z, bi_ev_time = self.bi
+            self.bi = None
+
+            delta_r = math.sqrt((x - bi_x)**2 + (y - bi_y)**2 + (z - bi_z)**2)
+            delta_t = ev_time - bi_ev_time
+
+            if delta_t > self.delta_t_range[1] or delta_t < self.delta_t_range[0] :
+                self.skip_pair = True
+                continue
+
+            self.Counts[3] += 1
+            self.h_delta_r.fill(delta_r)
+            self.h_delta_t.fill(delta_t)
+
+    def result(self, counts):
+
+        return self.h_delta_r.to_TH1D(), self.h_delta_t.to_TH1D()
 # ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
\ No newline at end of file
@@ -0,0 +1,426 @@
+# energy_fit.py
+
+'''
+Unbinned extended maximum likelihood fit of energy peaks : a sum of Gaussians (each truncated to the fit range) plus a
+flat background, fitted directly to the accepted energies instead of to a binned histogram, so the result doesn't depend
+on the bin layout. The negative log likelihood and its gradient are computed analytically with numpy for all events at
+once, and minimised with scipy's L-BFGS-B in a bounded number of iterations; the errors come from the Hessian.
+A histogram can be fitted the same way, as its bin centres weighted by the bin contents. The starting values can come
+from find_peaks, which locates the peaks without hand-picked windows.
+'''
+
+import math
+import numpy as np
+from scipy import optimize, special
+
+SQRT_2PI = math.sqrt(2*math.pi)
+FWHM_PER_SIGMA = 2*math.sqrt(2*math.log(2))
+MIN_DENSITY = 1e-300 # keeps the NLL finite (large) for trial parameters far from the events, so the line search backs off
+FIT_VERSION = 1      # bump when a change to fit_peaks changes its results, so the fits kept by fit_scheduler are redone
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def peak_nll(theta, energies, fit_range, npeaks, background, weights=None):
+
+    '''
+
+    Description
+    -----------
+    Extended negative log likelihood of the peaks + background model, and its gradient.
+
+        lambda(E) = sum_k n_k G(E; mu_k, sigma_k) / Z_k + n_b / (hi - lo)
+        NLL = sum_k n_k + n_b - sum_i w_i log lambda(E_i)
+
+    with G the normal pdf and Z_k its integral over the fit range [lo, hi].
+
+    Parameters
+    ----------
+    theta : numpy array of floats
+        [n_1, mu_1, sigma_1, ..., n_K, mu_K, sigma_K(, n_b)] : number of events [], mean and sigma [MeV] of each peak,
+        then the number of background events if background.
+    energies : numpy array of floats
+        Energies in the fit range [MeV].
+    fit_range : list of floats
+        [lo, hi] [MeV]
+    npeaks : int
+    background : bool
+    weights : numpy array of floats or None
+        w_i of each energy (e.g. bin contents, with the bin centres as energies), None for 1.
+
+    Returns (all in a tuple)
+    -------
+    nll : float
+    grad : numpy array of floats
+        d nll / d theta
+
+    '''
+
+    lo, hi = fit_range
+    n = theta[0:3*npeaks:3]
+    mu = theta[1:3*npeaks:3]
+    sigma = theta[2:3*npeaks:3]
+    n_b = theta[3*npeaks] if background else 0.0
+
+    a = (lo - mu)/sigma
+    b = (hi - mu)/sigma
+    norm = special.ndtr(b) - special.ndtr(a)                    # Z_k
+    phi_a = np.exp(-0.5*a*a)/SQRT_2PI
+    phi_b = np.exp(-0.5*b*b)/SQRT_2PI
+
+    z = (energies[np.newaxis, :] - mu[:, np.newaxis])/sigma[:, np.newaxis] # (peak, event)
+    g = np.exp(-0.5*z*z)/(SQRT_2PI*sigma*norm)[:, np.newaxis]  # normalised peak shapes
+    lam = np.maximum(n.dot(g) + n_b/(hi - lo), MIN_DENSITY)
+
+    if weights is None : weights = np.ones(len(energies))
+    nll = n.sum() + n_b - (weights*np.log(lam)).sum()
+
+    w = g*(weights/lam)                                         # w_i d log lambda / d n_k, per event
+    nw = n[:, np.newaxis]*w
+    dlognorm_dmu = (phi_a - phi_b)/(sigma*norm)
+    dlognorm_dsigma = (a*phi_a - b*phi_b)/(sigma*norm)
+
+    grad = np.empty(len(theta))
+    grad[0:3*npeaks:3] = 1 - w.sum(axis=1)
+    grad[1:3*npeaks:3] = -((nw*z).sum(axis=1)/sigma - nw.sum(axis=1)*dlognorm_dmu)
+    grad[2:3*npeaks:3] = -((nw*(z*z - 1)).sum(axis=1)/sigma - nw.sum(axis=1)*dlognorm_dsigma)
+    if background :
+        grad[3*npeaks] = 1 - (weights/((hi - lo)*lam)).sum()
+
+    return nll, grad
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def seeds_from_ranges(energies, ranges, weights=None):
+
+    '''
+    Starting (mean, sigma) [MeV] of each peak from the mean and standard deviation of the energies (array-like, with
+    weights : array-like or None) in each of ranges (list of [lo, hi] [MeV]), like the first "temp fit" over a hardcoded
+    range.
+    '''
+
+    energies = np.asarray(energies, dtype=np.float64)
+    weights = np.ones(len(energies)) if weights is None else np.asarray(weights, dtype=np.float64)
+    seeds = []
+    for lo, hi in ranges :
+        in_range = (energies >= lo) & (energies <= hi)
+        if weights[in_range].sum() > 1 :
+            mean = np.average(energies[in_range], weights=weights[in_range])
+            spread = np.sqrt(np.average((energies[in_range] - mean)**2, weights=weights[in_range]))
+            seeds.append((mean, max(spread, 1e-3*(hi - lo))))
+        else :
+            seeds.append((0.5*(lo + hi), 0.25*(hi - lo)))
+    return seeds
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def find_peaks(energies, search_range, npeaks=2, nbins=200, smoothing=2.0, weights=None):
+
+    '''
+
+    Description
+    -----------
+    Find the npeaks most prominent peaks of the energies, to start fit_peaks from, without hand-picked windows: the
+    energies are binned and smoothed with a Gaussian kernel of smoothing bins (the spectrum reflected at the ends, so a
+    falling spectrum has no maximum at the edge), and the peaks are the maxima of the smoothed spectrum (where its slope
+    turns negative, refined with a parabola through the 3 bins around), most prominent first. The prominence of a
+    maximum is its height above the higher of the minima on either side of it, each taken up to the nearest higher
+    point (or the end of the spectrum), so a peak on a falling background or on the tail of another peak is measured
+    from the valley between them. The sigma comes from the full width at half prominence, found between those minima,
+    with the smoothing taken out. A maximum no wider than a bin once the smoothing is taken out is a fluctuation, and one
+    within 2 sigma of a more prominent one is a bump on the same peak; both are skipped.
+
+    Parameters
+    ----------
+    energies : array-like of floats
+        Accepted energies [MeV].
+    search_range : list of floats
+        [lo, hi] [MeV] to look for the peaks in.
+    npeaks : int
+        Number of peaks wanted.
+    nbins : int
+        Number of bins over search_range. Not used with weights.
+    smoothing : float
+        Sigma of the smoothing kernel [bins].
+    weights : array-like of floats or None
+        As for fit_peaks, with weights the energies are the (increasing, equally spaced) centres of histogram bins and
+        weights the bin contents, and those bins are used.
+
+    Returns
+    -------
+    seeds : list of tuples
+        (mean, sigma) [MeV] of each peak found, in increasing energy. Fewer than npeaks if there aren't that many maxima.
+
+    '''
+
+    lo, hi = search_range
+    energies = np.asarray(energies, dtype=np.float64)
+    if weights is None :
+        edges = np.linspace(lo, hi, nbins + 1)
+        centres = 0.5*(edges[1:] + edges[:-1])
+        counts = np.histogram(energies, edges)[0].astype(np.float64)
+    else :
+        in_range = (energies >= lo) & (energies <= hi)
+        centres, counts = energies[in_range], np.asarray(weights, dtype=np.float64)[in_range]
+
+    halfwidth = int(4*smoothing) + 1
+    if len(centres) < 2*halfwidth + 1 : return []
+    bin_width = (centres[-1] - centres[0])/(len(centres) - 1)
+
+    kernel = np.exp(-0.5*(np.arange(-halfwidth, halfwidth + 1)/float(smoothing))**2)
+    padded = np.pad(counts, halfwidth, mode="reflect") # zero padding would make the ends of the spectrum fall off
+    smooth = np.convolve(padded, kernel/kernel.sum(), mode="valid")
+
+    slope = np.diff(smooth)
+    maxima = np.flatnonzero((slope[:-1] > 0) & (slope[1:] <= 0)) + 1
+
+    peaks = [] # (prominence, iMax, left, right), left and right the half prominence crossings [bins]
+    for iMax in maxima :
+        higher = np.flatnonzero(smooth > smooth[iMax])
+        iLeft = higher[higher < iMax][-1] + 1 if np.any(higher < iMax) else 0                # the side of the
+        iRight = higher[higher > iMax][0] if np.any(higher > iMax) else len(smooth)          # peak, up to a higher point
+        iLeft += np.argmin(smooth[iLeft:iMax])                                               # then its minimum
+        iRight = iMax + 1 + np.argmin(smooth[iMax + 1:iRight])
+        prominence = smooth[iMax] - max(smooth[iLeft], smooth[iRight])
+
+        half = smooth[iMax] - 0.5*prominence # both minima are at or below half, so both sides cross it
+        below_left = iLeft + np.flatnonzero(smooth[iLeft:iMax] <= half)[-1]
+        below_right = iMax + np.flatnonzero(smooth[iMax:iRight + 1] <= half)[0]
+        left = below_left + (half - smooth[below_left])/(smooth[below_left + 1] - smooth[below_left])      # linear
+        right = below_right - (half - smooth[below_right])/(smooth[below_right - 1] - smooth[below_right]) # interpolation
+        peaks.append((prominence, iMax, left, right))
+
+    seeds = []
+    for prominence, iMax, left, right in sorted(peaks, key=lambda peak : -peak[0]) : # stable, ties in energy order
+        smooth_sigma = (right - left)*bin_width/FWHM_PER_SIGMA
+        if smooth_sigma**2 - (smoothing*bin_width)**2 < bin_width**2 : continue # no wider than 1 bin once unsmoothed, a fluctuation
+        sigma = math.sqrt(smooth_sigma**2 - (smoothing*bin_width)**2)
+
+        curvature = smooth[iMax - 1] - 2*smooth[iMax] + smooth[iMax + 1]
+        offset = 0.5*(smooth[iMax - 1] - smooth[iMax + 1])/curvature if curvature < 0 else 0.0 # [bins]
+        mean = centres[iMax] + offset*bin_width
+
+        if any(abs(mean - found_mean) < 2*max(sigma, found_sigma) for found_mean, found_sigma in seeds) : continue
+        seeds.append((mean, sigma))
+        if len(seeds) == npeaks : break
+
+    return sorted(seeds)
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def seeds_range(seeds, limits, nsigma=3.0):
+
+    '''
+    [lo, hi] [MeV] covering nsigma (float) around every seed ((mean, sigma) tuples [MeV]), within limits ([lo, hi] [MeV]),
+    to fit the peaks found by find_peaks in.
+    '''
+
+    return [max(limits[0], min(mean - nsigma*sigma for mean, sigma in seeds)),
+            min(limits[1], max(mean + nsigma*sigma for mean, sigma in seeds))]
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def fit_peaks(energies, fit_range, seeds, background=True, nbins=100, maxiter=200, weights=None):
+
+    '''
+
+    Description
+    -----------
+    Fit Gaussian peaks (+ flat background) to the unbinned energies in fit_range.
+
+    Parameters
+    ----------
+    energies : array-like of floats
+        Accepted energies [MeV], the ones outside fit_range are ignored.
+    fit_range : list of floats
+        [lo, hi] [MeV]
+    seeds : list of tuples
+        Starting (mean, sigma) [MeV] of each peak, e.g. from find_peaks or seeds_from_ranges.
+    background : bool
+        Include the flat background.
+    nbins : int
+        Number of bins of the goodness of fit chi2 (the fit itself is unbinned). Not used with weights.
+    maxiter : int
+        Maximum number of L-BFGS-B iterations.
+    weights : array-like of floats or None
+        Weight of each energy, None for 1. Meant for the contents of histogram bins given as their (increasing) bin
+        centres, the bins then being used for the goodness of fit.
+
+    Returns
+    -------
+    fit : dict
+        "mean", "mean_error", "sigma", "sigma_error", "yield", "yield_error" : lists of floats, one per peak [MeV], []
+        "background", "background_error" : floats, number of background events (0 without background)
+        "nll" : float, negative log likelihood at the minimum
+        "chi2", "ndf" : float, int, Pearson chi2 of the nbins binned energies against the fitted model
+        "n_events" : float, number (sum of weights) of energies in the fit range
+        "converged" : bool
+        "n_evaluations" : int, number of NLL evaluations
+
+    '''
+
+    lo, hi = fit_range
+    energies = np.asarray(energies, dtype=np.float64)
+    binned = weights is not None
+    weights = np.asarray(weights, dtype=np.float64) if binned else np.ones(len(energies))
+    in_range = (energies >= lo) & (energies <= hi)
+    energies, weights = energies[in_range], weights[in_range]
+    nevents = weights.sum()
+    npeaks = len(seeds)
+
+    # start with the events within 2 sigma of each seed in the peaks, the rest in the background
+    theta0 = []
+    bounds = []
+    for mean, sigma in seeds :
+        near = weights[np.abs(energies - mean) < 2*sigma].sum()
+        theta0 += [max(near, 1.0), mean, sigma]
+        bounds += [(0.0, None), (lo, hi), (1e-3*(hi - lo), hi - lo)]
+    if background :
+        theta0.append(max(nevents - sum(theta0[0::3]), 0.1*nevents, 1.0))
+        bounds.append((0.0, None))
+
+    # the numbers of events are fitted as fractions of nevents, so every parameter is of order 1
+    scale = np.ones(len(theta0))
+    scale[0:3*npeaks:3] = max(nevents, 1)
+    if background : scale[-1] = max(nevents, 1)
+
+    def objective(x) :
+        nll, grad = peak_nll(x*scale, energies, fit_range, npeaks, background, weights)
+        return nll, grad*scale
+
+    scaled_bounds = [(None if low is None else low/s, None if high is None else high/s) for (low, high), s in zip(bounds, scale)]
+    with np.errstate(divide="ignore", invalid="ignore") :
+        result = optimize.minimize(objective, np.array(theta0)/scale, jac=True, method="L-BFGS-B", bounds=scaled_bounds,
+                                   options={"maxiter" : maxiter})
+    theta = result.x*scale
+
+    errors = parameter_errors(theta, energies, fit_range, npeaks, background, weights)
+
+    fit = {"mean" : list(theta[1:3*npeaks:3]), "mean_error" : list(errors[1:3*npeaks:3]),
+           "sigma" : list(theta[2:3*npeaks:3]), "sigma_error" : list(errors[2:3*npeaks:3]),
+           "yield" : list(theta[0:3*npeaks:3]), "yield_error" : list(errors[0:3*npeaks:3]),
+           "background" : theta[3*npeaks] if background else 0.0, "background_error" : errors[3*npeaks] if background else 0.0,
+           "nll" : float(result.fun), "n_events" : float(nevents), "converged" : bool(result.success), "n_evaluations" : int(result.nfev)}
+    fit["chi2"], fit["ndf"] = goodness_of_fit(theta, energies, fit_range, npeaks, background, nbins, weights if binned else None)
+    return fit
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def parameter_errors(theta, energies, fit_range, npeaks, background, weights=None):
+
+    '''
+    Standard errors of theta (numpy array, see peak_nll) from the inverse of the Hessian of the NLL, by central differences
+    of the analytic gradient (2 gradient evaluations per parameter). nan if the Hessian can't be inverted.
+    '''
+
+    step = 1e-5*np.maximum(np.abs(theta), 1e-3)
+    hessian = np.empty((len(theta), len(theta)))
+    for i in range(len(theta)) :
+        up = theta.copy()
+        down = theta.copy()
+        up[i] += step[i]
+        down[i] -= step[i]
+        hessian[i] = (peak_nll(up, energies, fit_range, npeaks, background, weights)[1] - peak_nll(down, energies, fit_range, npeaks, background, weights)[1])/(2*step[i])
+    hessian = 0.5*(hessian + hessian.T)
+
+    try :
+        variance = np.diag(np.linalg.inv(hessian))
+    except np.linalg.LinAlgError :
+        return np.repeat(np.nan, len(theta))
+    with np.errstate(invalid="ignore") :
+        return np.where(variance >= 0, np.sqrt(np.abs(variance)), np.nan)
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def goodness_of_fit(theta, energies, fit_range, npeaks, background, nbins, weights=None):
+
+    '''
+    (chi2, ndf) : Pearson chi2 of the energies binned in nbins bins over fit_range against the expected counts of the
+    model theta (see peak_nll), and the number of bins with expected counts minus the number of parameters. With weights,
+    energies are bin centres and weights the contents, and those bins are used instead.
+    '''
+
+    lo, hi = fit_range
+    if weights is None :
+        edges = np.linspace(lo, hi, nbins + 1)
+        observed = np.histogram(energies, edges)[0]
+    elif len(energies) > 1 : # bin edges half way between the centres
+        half = 0.5*np.diff(energies)
+        edges = np.clip(np.concatenate([energies[:1] - half[:1], energies[:-1] + half, energies[-1:] + half[-1:]]), lo, hi)
+        observed = weights
+    else :
+        return 0.0, 0
+
+    expected = np.zeros(len(edges) - 1)
+    for iPeak in range(npeaks) :
+        n, mu, sigma = theta[3*iPeak:3*iPeak + 3]
+        cdf = special.ndtr((edges - mu)/sigma)
+        norm = special.ndtr((hi - mu)/sigma) - special.ndtr((lo - mu)/sigma)
+        expected += n*np.diff(cdf)/norm
+    if background :
+        expected += theta[3*npeaks]*np.diff(edges)/(hi - lo)
+
+    used = expected > 0
+    chi2 = (((observed - expected)**2)[used]/expected[used]).sum()
+    return float(chi2), int(np.count_nonzero(used) - len(theta))
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def fit_mc_and_data(energies_MC, energies_data, fit_range_MC, fit_range_data, seeds_MC, seeds_data, background=True, nbins=100):
+
+    '''
+
+    Description
+    -----------
+    Fit the same peaks in MC and data in one call (fit_peaks for each).
+
+    Parameters
+    ----------
+    energies_MC, energies_data : array-likes of floats
+        Accepted energies [MeV].
+    fit_range_MC, fit_range_data : lists of floats
+        [lo, hi] [MeV]
+    seeds_MC, seeds_data : lists of tuples
+        Starting (mean, sigma) [MeV] of each peak.
+    background : bool
+    nbins : int
+        Number of bins of the goodness of fit chi2.
+
+    Returns (all in a tuple)
+    -------
+    fit_MC, fit_data : dicts
+        See fit_peaks.
+
+    '''
+
+    return (fit_peaks(energies_MC, fit_range_MC, seeds_MC, background, nbins),
+            fit_peaks(energies_data, fit_range_data, seeds_data, background, nbins))
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def gaus_parameters(fit, iPeak, bin_width, fit_range):
+
+    '''
+    [constant, mean, sigma] of a ROOT "gaus" TF1 drawing peak iPeak (int) of fit (dict, from fit_peaks) over a histogram
+    with bins of bin_width [MeV], for the fit_range ([lo, hi] [MeV]) it was fitted in.
+    '''
+
+    mean, sigma = fit["mean"][iPeak], fit["sigma"][iPeak]
+    norm = special.ndtr((fit_range[1] - mean)/sigma) - special.ndtr((fit_range[0] - mean)/sigma)
+    return [fit["yield"][iPeak]*bin_width/(SQRT_2PI*sigma*norm), mean, sigma]
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
@@ -0,0 +1,387 @@
+# event_cache.py
+
+'''
+On-disk cache of the per-event quantities the analysis modules use, per (input file, fit name). The first time a file
+is asked for it is read with the dsreader; after that the columns are loaded from the cache without touching ROOT, until
+the input file changes (size or modification time).
+
+Two layouts (cache_layout) : "npz", one compressed file loaded whole, or "flat", one .npy file per column that is
+memory-mapped read-only and only opened when the column is used (EventColumns), so any number of files can be open at
+once and a histogram only reads the pages of the columns it needs. iter_chunks walks either in fixed size blocks.
+'''
+
+import hashlib
+import os
+import shutil
+import numpy as np
+from rat import dsreader
+from event_view import EventView
+import av_geometry
+import tagger_settings
+
+cache_dir = tagger_settings.cache_dir # str
+cache_layout = tagger_settings.cache_layout # str
+
+EVENT_COLUMNS = [("entry", np.int64), ("iev", np.int32), ("gtid", np.int64), ("clock50", np.int64),
+                 ("valid_position", bool), ("valid_energy", bool), ("valid_time", bool),
+                 ("x", np.float64), ("y", np.float64), ("z", np.float64), ("energy", np.float64), # [mm], [MeV]
+                 ("fit_time", np.float64), ("pos_energy_error", np.float64),                     # [ns], [MeV]
+                 ("default_energy", np.float64),                                                 # [MeV], default fit
+                 ("nhits", np.int32), ("nhits_cleaned", np.int32), ("total_charge", np.float64),
+                 ("dc_applied", np.uint64), ("dc_flagged", np.uint64),                           # data only, 0 for MC
+                 ("mc_x", np.float64), ("mc_y", np.float64), ("mc_z", np.float64)]               # MC only, nan for data
+
+DERIVED_COLUMNS = {"time" : (["clock50"], lambda cols : cols["clock50"]*20),                          # clock time [ns]
+                   "rho" : (["x", "y"], lambda cols : np.sqrt(cols["x"]**2 + cols["y"]**2)),          # [mm]
+                   "r" : (["x", "y", "z"], lambda cols : np.sqrt(cols["x"]**2 + cols["y"]**2 + cols["z"]**2)),
+                   "region" : (["x", "y", "z"], lambda cols : av_geometry.classify(cols["x"], cols["y"], cols["z"]))} # av_geometry code
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def cache_file_name(fname, fitName):
+
+    '''
+    Full path to the cache of fname (str, full path to the .root file) for the fit fitName (str).
+    '''
+
+    path_hash = hashlib.md5(os.path.abspath(fname)).hexdigest()[:12] # same name in different directories
+    cacheFile = os.path.join(cache_dir, "%s.%s.%s"%(os.path.basename(fname), fitName, path_hash))
+    if cache_layout == "flat" : return cacheFile # a directory
+    return cacheFile + ".npz"
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def file_fingerprint(fname):
+
+    '''
+    [size, modification time] of fname (str) as a numpy array, None if it doesn't exist.
+    '''
+
+    try :
+        stat = os.stat(fname)
+    except OSError :
+        return None
+    return np.array([stat.st_size, stat.st_mtime], dtype=np.float64)
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def load_events(fname, fitName, use_cache=True):
+
+    '''
+
+    Description
+    -----------
+    Get the EVENT_COLUMNS of every event in a RAT DS file, from the cache if it is up to date, otherwise by reading the
+    file (and then caching them in cache_layout).
+
+    Parameters
+    ----------
+    fname : str
+        full path to the RAT DS .root file.
+    fitName : str
+        Fit result the fit columns are read from, e.g. "partialFitter".
+    use_cache : bool
+        Whether to use (and write) the cache at all.
+
+    Returns
+    -------
+    events : dict of numpy arrays, or EventColumns for the "flat" layout
+        One element per event, in file order. EVENT_COLUMNS plus "time" (clock time [ns]), "r" and "rho" [mm].
+        Fit columns are nan when the matching valid_* is False.
+
+    '''
+
+    fingerprint = file_fingerprint(fname)
+    cacheFile = cache_file_name(fname, fitName)
+
+    if use_cache and fingerprint is not None and os.path.exists(cacheFile) :
+        try :
+            if cache_layout == "flat" :
+                if np.array_equal(np.load(os.path.join(cacheFile, "fingerprint.npy")), fingerprint) \
+                   and all(os.path.isfile(os.path.join(cacheFile, name + ".npy")) for name, dtype in EVENT_COLUMNS) :
+                    return EventColumns(cacheFile)
+            else :
+                with np.load(cacheFile) as cached :
+                    if np.array_equal(cached["fingerprint"], fingerprint) and all(name in cached for name, dtype in EVENT_COLUMNS) :
+                        return add_derived_columns(dict((name, cached[name]) for name, dtype in EVENT_COLUMNS))
+        except Exception : # unreadable (e.g. partly written), make it again
+            pass
+        print "\tCache of", fname, "is out of date."
+
+    events = extract_events(fname, fitName)
+
+    if use_cache and fingerprint is not None :
+        if not os.path.isdir(cache_dir) : os.makedirs(cache_dir)
+        if cache_layout == "flat" :
+            dump_flat_columns(events, cacheFile, fingerprint)
+            print "\tCached", fname, "to", cacheFile
+            return EventColumns(cacheFile)
+        tmpFile = cacheFile + ".tmp"
+        with open(tmpFile, 'wb') as fo :
+            np.savez_compressed(fo, fingerprint=fingerprint, **events)
+        os.rename(tmpFile, cacheFile) # so an interrupted write never looks like a valid cache
+        print "\tCached", fname, "to", cacheFile
+
+    return add_derived_columns(events)
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def extract_events(fname, fitName):
+
+    '''
+
+    Description
+    -----------
+    Read the EVENT_COLUMNS of every event in a RAT DS file with the dsreader.
+
+    Parameters
+    ----------
+    fname : str
+        full path to the RAT DS .root file.
+    fitName : str
+        Fit result the fit columns are read from.
+
+    Returns
+    -------
+    events : dict of numpy arrays
+        EVENT_COLUMNS, one element per event.
+
+    '''
+
+    return next(read_event_chunks(fname, fitName))
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def read_event_chunks(fname, fitName, chunk_size=None):
+
+    '''
+
+    Description
+    -----------
+    Read the EVENT_COLUMNS of a RAT DS file with the dsreader, chunk_size events at a time (whole entries, so a chunk 
+    can be a little longer).
+
+    Parameters
+    ----------
+    fname : str
+        full path to the RAT DS .root file.
+    fitName : str
+        Fit result the fit columns are read from.
+    chunk_size : int or None
+        Number of events per chunk, None for the whole file in one chunk.
+
+    Yields
+    ------
+    chunk : dict of numpy arrays
+        EVENT_COLUMNS, one element per event, in file order. At least one (possibly empty) chunk is yielded.
+
+    '''
+
+    to_arrays = lambda lists : dict((name, np.array(lists[name], dtype=dtype)) for name, dtype in EVENT_COLUMNS)
+    lists = dict((name, []) for name, dtype in EVENT_COLUMNS)
+    nan = float("nan")
+
+    iEntry = -1
+    for ds, run in dsreader(fname) :
+
+        iEntry += 1
+        if iEntry % 1000 == 0 : print "Entry #", iEntry # print every thousand entries
+
+        is_mc = ds.MCExists()
+        mc_pos = (nan, nan, nan)
+        if is_mc and ds.GetMC().GetMCParticleCount() > 0 :
+            PosMC = ds.GetMC().GetMCParticle(0).GetPosition()
+            mc_pos = (PosMC.X(), PosMC.Y(), PosMC.Z())
+
+        for iev in range(0, ds.GetEVCount()) :
+
+            ev = ds.GetEV(iev)
+            view = EventView(ev, fitName, dc=not is_mc) # the data cleaning words are only filled in data
+
+            lists["entry"].append(iEntry)
+            lists["iev"].append(iev)
+            lists["gtid"].append(view.gtid)
+            lists["clock50"].append(view.clock50)
+            lists["valid_position"].append(view.valid_position)
+            lists["valid_energy"].append(view.valid_energy)
+            lists["valid_time"].append(view.valid_time)
+            lists["x"].append(view.x)
+            lists["y"].append(view.y)
+            lists["z"].append(view.z)
+            lists["energy"].append(view.energy)
+            lists["fit_time"].append(view.fit_time)
+            lists["pos_energy_error"].append(view.vertex.GetPositiveEnergyError() if view.valid_energy else nan)
+            lists["default_energy"].append(view.default_energy)
+            lists["nhits"].append(view.nhits)
+            lists["nhits_cleaned"].append(view.nhits_cleaned)
+            lists["total_charge"].append(ev.GetTotalCharge())
+            lists["dc_applied"].append(view.dc_applied)
+            lists["dc_flagged"].append(view.dc_flagged)
+            lists["mc_x"].append(mc_pos[0])
+            lists["mc_y"].append(mc_pos[1])
+            lists["mc_z"].append(mc_pos[2])
+
+        if chunk_size is not None and len(lists["entry"]) >= chunk_size :
+            yield to_arrays(lists)
+            lists = dict((name, []) for name, dtype in EVENT_COLUMNS)
+
+    if chunk_size is None or lists["entry"] or iEntry < 0 : # the rest, or the empty file
+        yield to_arrays(lists)
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def add_derived_columns(events):
+
+    '''
+    Add "time" (clock time [ns]), "r", "rho" [mm] and "region" (av_geometry code) to events (dict of numpy arrays,
+    EVENT_COLUMNS), and return it.
+    '''
+
+    for name in DERIVED_COLUMNS :
+        events[name] = DERIVED_COLUMNS[name][1](events)
+    return events
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def dump_flat_columns(events, flatDir, fingerprint=None):
+
+    '''
+
+    Description
+    -----------
+    Save events in the "flat" layout : a directory with one .npy file per column, readable with EventColumns.
+
+    Parameters
+    ----------
+    events : dict of numpy arrays
+        EVENT_COLUMNS (derived columns are not saved).
+    flatDir : str
+        full path to the output directory, replaced if it exists.
+    fingerprint : numpy array or None
+        file_fingerprint of the input file, saved as fingerprint.npy.
+
+    '''
+
+    tmpDir = flatDir + ".tmp"
+    if os.path.isdir(tmpDir) : shutil.rmtree(tmpDir)
+    os.makedirs(tmpDir)
+
+    for name, dtype in EVENT_COLUMNS :
+        np.save(os.path.join(tmpDir, name + ".npy"), np.asarray(events[name], dtype=dtype))
+    if fingerprint is not None :
+        np.save(os.path.join(tmpDir, "fingerprint.npy"), fingerprint) # written last, marks the columns as complete
+
+    if os.path.isdir(flatDir) : shutil.rmtree(flatDir)
+    os.rename(tmpDir, flatDir) # so an interrupted write never looks like a valid cache
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+class EventColumns(object):
+
+    '''
+
+    Description
+    -----------
+    Read-only view of a "flat" layout directory (dump_flat_columns). Indexing by column name, like the dict from 
+    load_events, returns a numpy memmap of that column's .npy file; each file is only opened the first time its column 
+    is used, and only the pages that are read are loaded into memory. Derived columns ("time", "r", "rho") are computed 
+    from their memmaps on each access, so prefer iter_chunks for those on large files.
+
+    Parameters
+    ----------
+    flatDir : str
+        full path to the directory.
+
+    '''
+
+    def __init__(self, flatDir):
+
+        self.flatDir = flatDir
+        self.columns = {} # name -> memmap, of the columns used so far
+
+    def __len__(self):
+
+        return len(self["entry"]) # number of events
+
+    def __contains__(self, name):
+
+        return name in DERIVED_COLUMNS or name in dict(EVENT_COLUMNS)
+
+    def keys(self):
+
+        return [name for name, dtype in EVENT_COLUMNS] + sorted(DERIVED_COLUMNS)
+
+    def __getitem__(self, name):
+
+        if name in DERIVED_COLUMNS :
+            return self.get_slice(name, 0, len(self))
+        if name not in self.columns :
+            if name not in self : raise KeyError(name)
+            self.columns[name] = np.load(os.path.join(self.flatDir, name + ".npy"), mmap_mode="r")
+        return self.columns[name]
+
+    def get_slice(self, name, start, stop):
+
+        '''
+        Elements start to stop of column name, derived columns computed for just that range.
+        '''
+
+        if name in DERIVED_COLUMNS :
+            sources, derive = DERIVED_COLUMNS[name]
+            return derive(dict((source, self[source][start:stop]) for source in sources))
+        return self[name][start:stop]
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def iter_chunks(events, columns=None, chunk_size=1000000):
+
+    '''
+
+    Description
+    -----------
+    Walk through events chunk_size events at a time, so memory use doesn't grow with the size of the file.
+
+    Parameters
+    ----------
+    events : dict of numpy arrays or EventColumns
+        From load_events.
+    columns : list of str or None
+        Columns to include in each chunk, defaults to all of them. With EventColumns only these are read.
+    chunk_size : int
+        Number of events per chunk.
+
+    Yields
+    ------
+    chunk : dict of numpy arrays
+        The columns for the next (up to) chunk_size events, in file order.
+
+    '''
+
+    if columns is None : columns = events.keys()
+    if isinstance(events, EventColumns) :
+        get_slice = events.get_slice
+    else :
+        get_slice = lambda name, start, stop : events[name][start:stop]
+
+    nevents = len(events["entry"])
+    for start in range(0, nevents, chunk_size) :
+        stop = min(start + chunk_size, nevents)
+        yield dict((name, get_slice(name, start, stop)) for name in columns)
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
\ No newline at end of file
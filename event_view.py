@@ -0,0 +1,207 @@
+# event_view.py
+
+'''
+Read what the analysis cuts need from a RAT event at most once, instead of going back through
+ev.GetFitResult(fitName).GetVertex(0) for every cut, and only when a cut asks for it.
+'''
+
+import math
+
+nan = float("nan")
+UNREAD = object() # value of an EventView slot that hasn't been read from the event yet
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+class EventView(object):
+
+    '''
+
+    Description
+    -----------
+    The per-event quantities of a rat.RAT::DS::EV and vertex 0 of one of its fit results. Each quantity is read from the
+    event the first time it is used and kept, so a loop only pays for the cuts an event actually gets to : an event
+    that fails the valid position cut never has its energy or time read. The fit result is looked up once, and each
+    Contains* is checked before the matching Valid*/Get* so missing quantities never throw.
+    Anything read from the event has to be read before the dsreader moves on to another entry; with minimal, what the
+    tagger uses is read at once, so those views stay correct after that.
+
+    Parameters
+    ----------
+    ev : rat.RAT::DS::EV
+        Event to read.
+    fitName : str
+        Fit result to read the vertex from, e.g. "partialFitter".
+    dc : bool
+        Whether the event has data cleaning words (data only, they are 0 otherwise).
+    minimal : bool
+        Read what the BiPo tagger uses now (gtid, clock50, nhits_cleaned, the position and, with a valid position,
+        valid_time), and never read the rest : nhits, energy and fit_time are 0, nan and nan, and valid_energy False.
+
+    Attributes
+    ----------
+    gtid, clock50, nhits, nhits_cleaned : ints
+    time : int
+        Clock time [ns] (clock50*20), to compare different events (the fitted time is within the event window).
+    vertex : rat.RAT::DS::FitVertex or None
+        The vertex itself, for anything else. None if the fit result doesn't exist.
+    valid_position, valid_energy, valid_time : bools
+        Whether the vertex contains a valid position/energy/time.
+    x, y, z, r, rho : floats
+        Fitted position [mm], nan if not valid_position.
+    energy : float
+        Fitted energy [MeV], nan if not valid_energy.
+    default_energy : float
+        Energy [MeV] of the default fit vertex, nan if it has none.
+    fit_time : float
+        Fitted time [ns], nan if not valid_time.
+    dc_applied, dc_flagged : ints
+        Data cleaning words of the latest pass (read through dc_words).
+
+    '''
+
+    __slots__ = ("ev", "fitName", "dc", "dc_read", "_gtid", "_clock50", "_nhits", "_nhits_cleaned", "_vertex",
+                 "_valid_position", "_position", "_valid_energy", "_energy", "_default_energy", "_valid_time", "_fit_time")
+
+    def __init__(self, ev, fitName, dc=False, minimal=False):
+
+        self.ev = ev
+        self.fitName = fitName
+        self.dc = dc
+        self.dc_read = None # (applied, flagged) once read
+
+        self._gtid = self._clock50 = self._nhits = self._nhits_cleaned = self._vertex = UNREAD
+        self._valid_position = self._position = self._valid_energy = self._energy = self._default_energy = UNREAD
+        self._valid_time = self._fit_time = UNREAD
+
+        if minimal :
+            self._nhits, self._valid_energy, self._energy, self._fit_time = 0, False, nan, nan
+            if not self.valid_position : self._valid_time = False
+            for name in ("gtid", "clock50", "nhits_cleaned", "x", "valid_time") : getattr(self, name) # read now, before the dsreader moves on
+
+    @property
+    def gtid(self):
+        if self._gtid is UNREAD : self._gtid = self.ev.GetGTID()
+        return self._gtid
+
+    @property
+    def clock50(self):
+        if self._clock50 is UNREAD : self._clock50 = self.ev.GetClockCount50()
+        return self._clock50
+
+    @property
+    def time(self):
+        return self.clock50*20 # [ns]
+
+    @property
+    def nhits(self):
+        if self._nhits is UNREAD : self._nhits = self.ev.GetNhits()
+        return self._nhits
+
+    @property
+    def nhits_cleaned(self):
+        if self._nhits_cleaned is UNREAD : self._nhits_cleaned = self.ev.GetNhitsCleaned()
+        return self._nhits_cleaned
+
+    @property
+    def vertex(self):
+        if self._vertex is UNREAD :
+            self._vertex = self.ev.GetFitResult(self.fitName).GetVertex(0) if self.ev.FitResultExists(self.fitName) else None
+        return self._vertex
+
+    @property
+    def valid_position(self):
+        if self._valid_position is UNREAD :
+            fVertex = self.vertex
+            self._valid_position = fVertex is not None and fVertex.ContainsPosition() and fVertex.ValidPosition()
+        return self._valid_position
+
+    def position(self):
+
+        '''
+        (x, y, z, r, rho) [mm], read with the first of them used.
+        '''
+
+        if self._position is UNREAD :
+            if self.valid_position :
+                fit_pos = self.vertex.GetPosition()
+                x, y, z = fit_pos.X(), fit_pos.Y(), fit_pos.Z()
+                self._position = (x, y, z, math.sqrt(x**2 + y**2 + z**2), math.sqrt(x**2 + y**2))
+            else :
+                self._position = (nan, nan, nan, nan, nan)
+        return self._position
+
+    @property
+    def x(self):
+        return self.position()[0]
+
+    @property
+    def y(self):
+        return self.position()[1]
+
+    @property
+    def z(self):
+        return self.position()[2]
+
+    @property
+    def r(self):
+        return self.position()[3]
+
+    @property
+    def rho(self):
+        return self.position()[4]
+
+    @property
+    def valid_energy(self):
+        if self._valid_energy is UNREAD :
+            fVertex = self.vertex
+            self._valid_energy = fVertex is not None and fVertex.ContainsEnergy() and fVertex.ValidEnergy()
+        return self._valid_energy
+
+    @property
+    def energy(self):
+        if self._energy is UNREAD : self._energy = self.vertex.GetEnergy() if self.valid_energy else nan
+        return self._energy
+
+    @property
+    def default_energy(self):
+        if self._default_energy is UNREAD :
+            defaultVertex = self.ev.GetDefaultFitVertex() if self.ev.DefaultFitVertexExists() else None
+            self._default_energy = defaultVertex.GetEnergy() if defaultVertex and defaultVertex.ContainsEnergy() else nan
+        return self._default_energy
+
+    @property
+    def valid_time(self):
+        if self._valid_time is UNREAD :
+            fVertex = self.vertex
+            self._valid_time = fVertex is not None and fVertex.ContainsTime() and fVertex.ValidTime()
+        return self._valid_time
+
+    @property
+    def fit_time(self):
+        if self._fit_time is UNREAD : self._fit_time = self.vertex.GetTime() if self.valid_time else nan
+        return self._fit_time
+
+    def dc_words(self):
+
+        '''
+        (applied, flagged) data cleaning words (ints) of the latest pass, (0, 0) without dc. Read from the event the
+        first time, so call it before the dsreader moves on to another entry.
+        '''
+
+        if self.dc_read is None :
+            if self.dc :
+                dcFlags = self.ev.GetDataCleaningFlags()
+                latestPass = dcFlags.GetLatestPass()
+                self.dc_read = (dcFlags.GetApplied(latestPass).GetULong64_t(0), dcFlags.GetFlags(latestPass).GetULong64_t(0))
+            else :
+                self.dc_read = (0, 0)
+        return self.dc_read
+
+    @property
+    def dc_applied(self):
+        return self.dc_words()[0]
+
+    @property
+    def dc_flagged(self):
+        return self.dc_words()[1]
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
@@ -0,0 +1,218 @@
+# fit_scheduler.py
+
+'''
+Run batches of independent fits (e.g. the MC and data peaks of EFit.plot_dual_multiple_fit_E, or one spectrum per run)
+in a process pool. Each result is kept on disk under a hash of the fitted values, model (and its MODEL_VERSIONS), range
+and options, so redrawing a plot whose inputs haven't changed doesn't refit anything, e.g.
+
+    jobs = [fit_scheduler.fit_job(energies_MC, "peaks", [0.5, 2.2], seeds=seeds_MC),
+            fit_scheduler.fit_job(h_energy_data, "peaks", [0.5, 2.2], seeds=seeds_data)]
+    fitMC, fitData = fit_scheduler.run_fits(jobs, n_workers=2)
+
+A job fits either an array of values (unbinned) or a histogram (ROOT TH1D or array_hist.ArrayHist1D). A histogram is
+fitted as its bin centres, weighted by the bin contents.
+'''
+
+import cPickle as pickle
+import hashlib
+import multiprocessing
+import os
+import numpy as np
+import energy_fit
+import lifetime_fit
+import tagger_settings
+
+store_dir = tagger_settings.fit_store_dir # str, "" to always refit
+
+MODELS = {"peaks" : energy_fit.fit_peaks, "lifetime" : lifetime_fit.fit_lifetime} # name : function(values, fit_range, weights=..., **options), returning a picklable result
+MODEL_VERSIONS = {"peaks" : energy_fit.FIT_VERSION, "lifetime" : lifetime_fit.FIT_VERSION} # name : version of the fit code, part of the job hash
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def fit_job(data, model, fit_range, **options):
+
+    '''
+
+    Description
+    -----------
+    Describe one fit for run_fits.
+
+    Parameters
+    ----------
+    data : array-like of floats, ROOT TH1D or array_hist.ArrayHist1D
+        Values to fit (unbinned), or histogram whose bin contents are fitted.
+    model : str
+        One of MODELS : "peaks" (energy_fit.fit_peaks) or "lifetime" (lifetime_fit.fit_lifetime).
+    fit_range : list of floats
+        [lo, hi]
+    options : keyword arguments
+        Other arguments of the model function, e.g. seeds=[(0.8, 0.1)], background=False. Part of the job's hash, so use
+        values with a stable repr (numbers, strs, lists and tuples of them).
+
+    Returns
+    -------
+    job : tuple
+        (model, values, weights, fit_range, options), picklable. weights is None for unbinned values.
+
+    '''
+
+    if model not in MODELS :
+        raise ValueError("Unknown fit model %r, use one of %s."%(model, sorted(MODELS)))
+
+    if hasattr(data, "sumw") or hasattr(data, "GetNbinsX") :
+        values, weights = histogram_arrays(data)
+    else :
+        values, weights = np.asarray(data, dtype=np.float64), None
+
+    return (model, values, weights, [float(fit_range[0]), float(fit_range[1])], options)
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def histogram_arrays(hist):
+
+    '''
+    (bin centres, bin contents) of the bins in range of hist (ROOT TH1D or array_hist.ArrayHist1D), numpy arrays of floats.
+    '''
+
+    if hasattr(hist, "sumw") : # ArrayHist1D
+        hist.flush()
+        width = (hist.hi - hist.lo)/hist.nbins
+        return hist.lo + width*(np.arange(hist.nbins) + 0.5), hist.sumw[1:-1].copy()
+
+    nbins = hist.GetNbinsX()
+    centres = np.array([hist.GetBinCenter(iBin) for iBin in range(1, nbins + 1)], dtype=np.float64)
+    contents = np.array([hist.GetBinContent(iBin) for iBin in range(1, nbins + 1)], dtype=np.float64)
+    return centres, contents
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def job_key(job):
+
+    '''
+    Hash (str) of everything the result of job (tuple, from fit_job) depends on, including the version of the fit code.
+    '''
+
+    model, values, weights, fit_range, options = job
+    key = hashlib.md5(repr((model, MODEL_VERSIONS[model], fit_range, sorted(options.items()))))
+    key.update(values.tobytes())
+    if weights is not None : key.update(weights.tobytes())
+    return key.hexdigest()
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def run_fit(job):
+
+    '''
+    Do the fit of job (tuple, from fit_job), in a worker process. Returns what the model function returns.
+    '''
+
+    model, values, weights, fit_range, options = job
+    return MODELS[model](values, fit_range, weights=weights, **options)
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def load_fit(key):
+
+    '''
+    The stored result of the job with hash key (str), or None.
+    '''
+
+    if not store_dir : return None
+    storeFile = os.path.join(store_dir, key + ".pkl")
+    if not os.path.exists(storeFile) : return None
+
+    try :
+        with open(storeFile, 'rb') as fi :
+            return pickle.load(fi)
+    except Exception : # unreadable (e.g. partly written), fit again
+        return None
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def save_fit(key, result):
+
+    '''
+    Store result (picklable) as the result of the job with hash key (str).
+    '''
+
+    if not store_dir : return
+
+    if not os.path.isdir(store_dir) : os.makedirs(store_dir)
+    storeFile = os.path.join(store_dir, key + ".pkl")
+    tmpFile = storeFile + ".tmp"
+    with open(tmpFile, 'wb') as fo :
+        pickle.dump(result, fo, pickle.HIGHEST_PROTOCOL)
+    os.rename(tmpFile, storeFile) # so an interrupted write never looks like a valid result
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def run_fits(jobs, n_workers=1, use_store=True):
+
+    '''
+
+    Description
+    -----------
+    Do every fit in jobs : the ones done before (same hash) are taken from the store, identical jobs are only fitted
+    once, and the rest are shared between n_workers processes and stored.
+
+    Parameters
+    ----------
+    jobs : list of tuples
+        From fit_job.
+    n_workers : int
+        Number of processes, 1 to fit everything in this one.
+    use_store : bool
+        Take and keep the results in store_dir.
+
+    Returns
+    -------
+    results : list
+        The result of each job (see MODELS), in the order of jobs.
+
+    '''
+
+    keys = [job_key(job) for job in jobs]
+
+    results = {}
+    if use_store :
+        for key in set(keys) :
+            result = load_fit(key)
+            if result is not None : results[key] = result
+
+    nstored = len([key for key in keys if key in results])
+    todo_keys = []
+    todo_jobs = []
+    for key, job in zip(keys, jobs) :
+        if key not in results and key not in todo_keys :
+            todo_keys.append(key)
+            todo_jobs.append(job)
+    print "\t%i of %i fit(s) taken from the fit store, %i to run."%(nstored, len(keys), len(todo_keys))
+
+    if n_workers <= 1 or len(todo_jobs) <= 1 :
+        new_results = [run_fit(job) for job in todo_jobs]
+    else :
+        pool = multiprocessing.Pool(min(n_workers, len(todo_jobs)))
+        try :
+            new_results = pool.map(run_fit, todo_jobs, chunksize=1)
+        finally :
+            pool.close()
+            pool.join()
+
+    for key, result in zip(todo_keys, new_results) :
+        results[key] = result
+        if use_store : save_fit(key, result)
+
+    return [results[key] for key in keys]
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
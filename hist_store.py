@@ -0,0 +1,131 @@
+# hist_store.py
+
+'''
+Keep the per-file partial results of the histogram makers (EFit.EHistPartial, Nhits_totcharge.histPartial, 
+posFit.PosHistPartial : array_hist histograms and counters) on disk, keyed by input file, maker, arguments and cut values, 
+so a rerun over a growing list of runs only processes the files that are new or have changed since (size or modification 
+time), and merges them with the stored partials of the others.
+'''
+
+import cPickle as pickle
+import hashlib
+import os
+import analysis_runner
+import cuts
+import event_cache
+import tagger_settings
+
+store_dir = tagger_settings.hist_store_dir # str
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def get_store_settings(file_func, args):
+
+    '''
+    What a stored partial of file_func (function) depends on besides the input file : the maker, its arguments (tuple)
+    and the shared cut values and AV cut of cuts.py, as a str.
+    '''
+
+    cut_values = (cuts.R_AV, cuts.Z_FV_MIN, cuts.Z_NECK, cuts.RHO_NECK, cuts.in_av.expr)
+    return repr((file_func.__module__, file_func.__name__, args, cut_values))
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def store_file_name(fname, settings):
+
+    '''
+    Full path to the stored partial of fname (str, full path to the .root file) for settings (str, get_store_settings).
+    '''
+
+    key = hashlib.md5(os.path.abspath(fname) + settings).hexdigest()[:12] # same name in different directories
+    return os.path.join(store_dir, "%s.%s.pkl"%(os.path.basename(fname), key))
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def load_partial(fname, settings):
+
+    '''
+    The stored partial of fname for settings if it is up to date, otherwise None.
+    '''
+
+    storeFile = store_file_name(fname, settings)
+    fingerprint = event_cache.file_fingerprint(fname)
+    if fingerprint is None or not os.path.exists(storeFile) : return None
+
+    try :
+        with open(storeFile, 'rb') as fi :
+            stored = pickle.load(fi)
+    except Exception : # unreadable (e.g. partly written), make it again
+        return None
+
+    if stored["settings"] != settings or list(stored["fingerprint"]) != list(fingerprint) : return None
+    return stored["partial"]
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def save_partial(fname, settings, partial):
+
+    '''
+    Store partial (picklable) as the result of fname (str) for settings (str).
+    '''
+
+    fingerprint = event_cache.file_fingerprint(fname)
+    if fingerprint is None : return
+
+    if not os.path.isdir(store_dir) : os.makedirs(store_dir)
+    storeFile = store_file_name(fname, settings)
+    tmpFile = storeFile + ".tmp"
+    with open(tmpFile, 'wb') as fo :
+        pickle.dump({"settings" : settings, "fingerprint" : list(fingerprint), "partial" : partial}, fo, pickle.HIGHEST_PROTOCOL)
+    os.rename(tmpFile, storeFile) # so an interrupted write never looks like a valid partial
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def map_files_stored(file_func, input_files, args=(), n_workers=1):
+
+    '''
+
+    Description
+    -----------
+    Same as analysis_runner.map_files, but the partial of each file is taken from the store when it is up to date. Only
+    the other files are processed (in n_workers processes), and their partials are stored for next time.
+
+    Parameters
+    ----------
+    file_func : function
+        Module level function taking a list of input files, then args, returning a picklable partial result.
+    input_files : list of str
+        RAT DS files to process.
+    args : tuple
+        Other arguments of file_func (part of the store key, so use values with a stable repr).
+    n_workers : int
+        Number of processes for the files that have to be processed.
+
+    Returns
+    -------
+    partials : list
+        The partial result of each file, in the order of input_files.
+
+    '''
+
+    settings = get_store_settings(file_func, args)
+
+    partials = [load_partial(fname, settings) for fname in input_files]
+    todo = [fname for fname, partial in zip(input_files, partials) if partial is None]
+    print "\t%i of %i file(s) taken from the histogram store, %i to process."%(len(input_files) - len(todo), len(input_files), len(todo))
+
+    new_partials = analysis_runner.map_files(file_func, todo, args, n_workers)
+    for fname, partial in zip(todo, new_partials) :
+        save_partial(fname, settings, partial)
+
+    new_partials = iter(new_partials)
+    return [next(new_partials) if partial is None else partial for partial in partials]
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
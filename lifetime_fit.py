@@ -0,0 +1,158 @@
+# lifetime_fit.py
+
+'''
+Unbinned maximum likelihood fit of the delta t distribution of the pairs : an exponential (the Po decay) plus a flat
+background of accidental pairs, both normalised to the delta t window, so the result depends neither on the binning nor
+(beyond the statistics) on the window. Like energy_fit.py, the NLL and its gradient are analytic numpy expressions over
+all the pairs at once, minimised with scipy's L-BFGS-B, and the covariance comes from the Hessian.
+'''
+
+import numpy as np
+from scipy import optimize
+
+FIT_VERSION = 1 # bump when a change to fit_lifetime changes its results, so the fits kept by fit_scheduler are redone
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def lifetime_nll(theta, delta_t, t_range, weights=None):
+
+    '''
+
+    Description
+    -----------
+    Negative log likelihood of the exponential + flat model, and its gradient.
+
+        p(t) = (1 - f) exp(-(t - lo)/tau) / (tau (1 - exp(-(hi - lo)/tau))) + f / (hi - lo)
+        NLL = - sum_i w_i log p(t_i)
+
+    Parameters
+    ----------
+    theta : numpy array of floats
+        [tau, f] : lifetime (units of delta_t) and background fraction.
+    delta_t : numpy array of floats
+        Delta t of each pair, within t_range.
+    t_range : list of floats
+        [lo, hi] of the delta t window.
+    weights : numpy array of floats or None
+        w_i of each delta t (e.g. bin contents, with the bin centres as delta_t), None for 1.
+
+    Returns (all in a tuple)
+    -------
+    nll : float
+    grad : numpy array of floats
+        d nll / d theta
+
+    '''
+
+    lo, hi = t_range
+    tau, f = theta
+    width = hi - lo
+
+    tail = np.exp(-width/tau)
+    norm = tau*(1 - tail)                             # integral of exp(-(t - lo)/tau) over the window
+    dnorm_dtau = (1 - tail) - (width/tau)*tail
+
+    u = delta_t - lo
+    signal = np.exp(-u/tau)/norm
+    p = np.maximum((1 - f)*signal + f/width, 1e-300)  # stays finite for trial parameters far from the pairs
+
+    if weights is None : weights = np.ones(len(delta_t))
+    nll = -(weights*np.log(p)).sum()
+
+    wp = weights/p
+    dsignal_dtau = signal*(u/tau**2 - dnorm_dtau/norm)
+    grad = np.array([-((1 - f)*dsignal_dtau*wp).sum(), -((1.0/width - signal)*wp).sum()])
+
+    return nll, grad
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def fit_lifetime(delta_t, t_range, weights=None, maxiter=200):
+
+    '''
+
+    Description
+    -----------
+    Fit the lifetime and background fraction to the unbinned delta t of the pairs in t_range.
+
+    Parameters
+    ----------
+    delta_t : array-like of floats
+        Delta t of each pair, e.g. [micro s] from delta_r_t.histMaker_next. The ones outside t_range are ignored.
+    t_range : list of floats
+        [lo, hi] of the delta t window the pairs were selected in.
+    weights : array-like of floats or None
+        Weight of each delta t, e.g. the contents of histogram bins given as their bin centres. None for 1.
+    maxiter : int
+        Maximum number of L-BFGS-B iterations.
+
+    Returns
+    -------
+    fit : dict
+        "tau", "tau_error" : floats, lifetime (units of delta_t)
+        "background_fraction", "background_fraction_error" : floats
+        "covariance" : 2x2 list of floats, of (tau, background fraction), nan if the Hessian can't be inverted
+        "nll" : float, negative log likelihood at the minimum
+        "n_events" : float, number (sum of weights) of pairs in t_range
+        "converged" : bool
+        "n_evaluations" : int, number of NLL evaluations
+
+    '''
+
+    lo, hi = t_range
+    delta_t = np.asarray(delta_t, dtype=np.float64)
+    weights = np.ones(len(delta_t)) if weights is None else np.asarray(weights, dtype=np.float64)
+    in_range = (delta_t >= lo) & (delta_t <= hi)
+    delta_t, weights = delta_t[in_range], weights[in_range]
+    nevents = weights.sum()
+
+    # start from the mean delta t (the lifetime without background, for a window much longer than it)
+    tau0 = max(np.average(delta_t - lo, weights=weights) if nevents > 0 else 0.5*(hi - lo), 1e-3*(hi - lo))
+    scale = np.array([tau0, 1.0]) # so both parameters are of order 1
+
+    def objective(x) :
+        nll, grad = lifetime_nll(x*scale, delta_t, t_range, weights)
+        return nll, grad*scale
+
+    bounds = [(1e-4*(hi - lo)/tau0, 1e3*(hi - lo)/tau0), (0.0, 1.0)]
+    with np.errstate(over="ignore", divide="ignore", invalid="ignore") :
+        result = optimize.minimize(objective, np.array([1.0, 0.1]), jac=True, method="L-BFGS-B", bounds=bounds,
+                                   options={"maxiter" : maxiter})
+    theta = result.x*scale
+
+    covariance = lifetime_covariance(theta, delta_t, t_range, weights)
+
+    return {"tau" : theta[0], "tau_error" : np.sqrt(covariance[0, 0]),
+            "background_fraction" : theta[1], "background_fraction_error" : np.sqrt(covariance[1, 1]),
+            "covariance" : covariance.tolist(), "nll" : float(result.fun), "n_events" : float(nevents),
+            "converged" : bool(result.success), "n_evaluations" : int(result.nfev)}
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def lifetime_covariance(theta, delta_t, t_range, weights):
+
+    '''
+    Covariance (2x2 numpy array) of theta ([tau, f], see lifetime_nll) from the inverse of the Hessian of the NLL, by
+    central differences of the analytic gradient. nan if it can't be inverted.
+    '''
+
+    step = 1e-5*np.maximum(np.abs(theta), [1e-3*(t_range[1] - t_range[0]), 1e-3])
+    hessian = np.empty((2, 2))
+    for i in range(2) :
+        up = theta.copy()
+        down = theta.copy()
+        up[i] += step[i]
+        down[i] -= step[i]
+        hessian[i] = (lifetime_nll(up, delta_t, t_range, weights)[1] - lifetime_nll(down, delta_t, t_range, weights)[1])/(2*step[i])
+    hessian = 0.5*(hessian + hessian.T)
+
+    try :
+        covariance = np.linalg.inv(hessian)
+    except np.linalg.LinAlgError :
+        return np.full((2, 2), np.nan)
+    if covariance[0, 0] < 0 or covariance[1, 1] < 0 : return np.full((2, 2), np.nan)
+    return covariance
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
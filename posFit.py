@@ -6,12 +6,20 @@
 
 import ROOT
 from rat import dsreader
+from event_view import EventView
+from array_hist import ArrayHist2D
+import event_cache
+import cuts
+import av_geometry
+import analysis_runner
+import hist_store
+import numpy as np
 import sys
 import math
 from array import array
 
 # ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
-def ZRHO_in_AV(file_name):
+def ZRHO_in_AV(file_name, use_cache=False):
     """ 
     Description:
     Plot the Z vs Rho for MC and Fitted events THAT ARE INSIDE THE ACRYLIC ITSELF
@@ -20,110 +28,36 @@ def ZRHO_in_AV(file_name):
 
     Parameters: 
     file_name - Path to the RAT DS file to play around with
+    use_cache - Read the events through event_cache.py instead of the dsreader (ROOT is only read the first time)
     Return: nothing
     """
 
     fitName = "partialFitter"
-    CountEV = 0
-    just_compare_neck = False
 
     # ======================================================================= for z vs rho
 
-    ArrayRho_EV = array("d")
-    ArrayZ_EV = array("d")
+    events = load_event_positions([file_name], fitName, use_cache)
 
-    ArrayRho_EVO = array("d")
-    ArrayZ_EVO = array("d")
-
-    ArrayRho_MC = array("d")
-    ArrayZ_MC = array("d")
-
-    ArrayRho_MCO = array("d")
-    ArrayZ_MCO = array("d")
-
-    # ======================================================================= 
-
-    AVCountMC = 0
-    AVCountEV = 0
-    OCountEV = 0
-    OCountMC = 0
     filtercuts = [0, 0, 0, 0] # total fit count, retrigger filtered, posvalid, Evalid
 
-    for ds, run in dsreader(file_name):
-
-        for iev in range(0, ds.GetEVCount()): # ds is an entry, multiple EV events in one MC event possible so loop through them
-            
-            filtercuts[0] += 1
-            if iev > 0: # retrigger filter
-                continue
-
-            ev = ds.GetEV(iev) # single EV event
-
-            filtercuts[1] += 1
-
-            if not ev.FitResultExists(fitName) or not ev.GetFitResult(fitName).GetVertex(0).ContainsPosition() or not ev.GetFitResult(fitName).GetVertex(0).ValidPosition() :
-                continue # valid position filter
-
-            filtercuts[2] += 1
-
-            fVertex = ev.GetFitResult(fitName).GetVertex(0)     
-            PosEV = fVertex.GetPosition()                  # get position vector 
-            REV = PosEV.Mag()                              # and radius
-            RhoEV = math.sqrt(PosEV.X()**2 + PosEV.Y()**2)
-
-            mc = ds.GetMC() # individual MC event
-
-            PosMC = mc.GetMCParticle(0).GetPosition() # get position vector and radius 
-            RMC = PosMC.Mag()
-            RhoMC = math.sqrt(PosMC.X()**2 + PosMC.Y()**2)
-
-            if PosEV.Z() > 6000 and RhoEV > 730 and RhoEV < 785 :
-                in_AV = True
-            elif PosEV.Z() > 0 and RhoEV > 785 and REV > 6000 and REV < 6055 :
-                in_AV = True  
-            elif PosEV.Z() < 0 and REV > 6000 and REV < 6055 :
-                in_AV = True  
-            else :
-                in_AV = False
+    filtercuts[0] = len(events["iev"])
+    first = events["iev"] == 0 # retrigger filter
+    filtercuts[1] = np.count_nonzero(first)
+    valid = first & events["valid_position"] # valid position filter
+    filtercuts[2] = np.count_nonzero(valid)
 
-            if PosEV.Z() >= 6055 and RhoEV >= 755 :
-                out_AV = True
-            elif PosEV.Z() < 6055 and REV > 6055 :
-                out_AV = True
-            else:
-                out_AV = False
+    in_AV = valid & (events["region"] == av_geometry.AV_SHELL) # fitted into the acrylic
+    out_AV = valid & (events["region"] == av_geometry.OUTSIDE)
+    filtercuts[3] = np.count_nonzero((in_AV | out_AV) & events["valid_energy"])
 
-            if in_AV :
+    # store values in arrays for plotting
+    ArrayRho_EV, ArrayZ_EV = array("d", events["rho"][in_AV]), array("d", events["z"][in_AV])
+    ArrayRho_MC, ArrayZ_MC = array("d", events["mc_rho"][in_AV]), array("d", events["mc_z"][in_AV])
+    ArrayRho_EVO, ArrayZ_EVO = array("d", events["rho"][out_AV]), array("d", events["z"][out_AV])
+    ArrayRho_MCO, ArrayZ_MCO = array("d", events["mc_rho"][out_AV]), array("d", events["mc_z"][out_AV])
 
-                # store values in arrays for plotting
-                ArrayZ_EV.append(PosEV.Z()) 
-                ArrayRho_EV.append(RhoEV)
-                AVCountEV += 1  
-
-                # store values in arrays for plotting
-                ArrayZ_MC.append(PosMC.Z())
-                ArrayRho_MC.append(RhoMC)
-                AVCountMC += 1 # keep count of mc events
-
-                if not fVertex.ValidEnergy():
-                    continue          
-                filtercuts[3] += 1  
-
-            if out_AV :
-
-                # store values in arrays for plotting
-                ArrayZ_EVO.append(PosEV.Z()) 
-                ArrayRho_EVO.append(RhoEV)
-                OCountEV += 1  
-
-                # store values in arrays for plotting
-                ArrayZ_MCO.append(PosMC.Z())
-                ArrayRho_MCO.append(RhoMC)
-                OCountMC += 1
-
-                if not fVertex.ValidEnergy():
-                    continue           
-                filtercuts[3] += 1  
+    AVCountEV = AVCountMC = len(ArrayZ_EV) # keep count of mc events
+    OCountEV = OCountMC = len(ArrayZ_EVO)
 
     # =======================================================================
     
@@ -162,14 +96,14 @@ def ZRHO_in_AV(file_name):
     ZRhoPlotMCO.SetFillStyle(0)
     ZRhoPlotMCO.Draw()
 
-    r = 6000 # save to file eventually
+    r = av_geometry.R_AV # save to file eventually
     theta = -math.pi/2
     x, y = array("d"), array("d")
     for i in range(100):
         x.append(r*math.cos(theta)), y.append(r*math.sin(theta))
         theta += 0.0302
     for i in range(50):
-        x.append(730), y.append(6000+i*140)
+        x.append(av_geometry.RHO_NECK), y.append(av_geometry.Z_NECK+i*140)
     boundaryplot = ROOT.TGraph(150, x, y)
     boundaryplot.SetTitle("Inner AV")
     boundaryplot.SetLineStyle(3)
@@ -177,7 +111,7 @@ def ZRHO_in_AV(file_name):
     boundaryplot.SetFillStyle(0)
     boundaryplot.Draw()
     
-    lineplot = ROOT.TGraph(2, array("d", [0, 8000]), array("d", [747.5, 747.5])) # a line at Z = 747.5 mm to tell where scint ends
+    lineplot = ROOT.TGraph(2, array("d", [0, 8000]), array("d", [av_geometry.Z_FV_MIN, av_geometry.Z_FV_MIN])) # a line at Z = 747.5 mm to tell where scint ends
     lineplot.SetTitle("747.5 mm")
     lineplot.SetMarkerStyle(0)
     lineplot.SetLineStyle(7)
@@ -216,7 +150,7 @@ def ZRHO_in_AV(file_name):
 # ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
 
 # ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
-def CompareMCValidInvalidFitsECut(input_files, ECut):
+def CompareMCValidInvalidFitsECut(input_files, ECut, use_cache=False):
     """ 
 
     Description:
@@ -224,103 +158,43 @@ def CompareMCValidInvalidFitsECut(input_files, ECut):
     Destinguish between MC events that are fitted inside and outside the AV
     
     Parameters: 
-    file_name - Path to the RAT DS file to play around with
+    input_files - Paths to the RAT DS files to play around with
+    ECut - Lowest energy [MeV] of the events plotted
+    use_cache - Read the events through event_cache.py instead of the dsreader (ROOT is only read the first time)
     Return: nothing
 
     """
 
     fitName = "partialFitter"
-    CountEV = 0
-    just_compare_neck = False
 
     # ======================================================================= for z vs rho
 
-    ArrayRho_EV = array("d")
-    ArrayZ_EV = array("d")
-
-    ArrayRho_EVO = array("d")
-    ArrayZ_EVO = array("d")
-
-    ArrayRho_MC = array("d")
-    ArrayZ_MC = array("d")
+    events = load_event_positions(input_files, fitName, use_cache)
 
-    ArrayRho_MCO = array("d")
-    ArrayZ_MCO = array("d")
-
-    # ======================================================================= 
-
-    AVCountMC = 0
-    AVCountEV = 0
-    OCountEV = 0
-    OCountMC = 0
     filtercuts = [0, 0, 0, 0] # total fit count, retrigger filtered, posvalid, Evalid
 
-    for file_name in input_files :
-
-        for ds, run in dsreader(file_name):
-
-            for iev in range(0, ds.GetEVCount()): # ds is an entry, multiple EV events in one MC event possible so loop through them
-                
-                filtercuts[0] += 1
-                if iev > 0: # retrigger filter
-                    continue
-
-                ev = ds.GetEV(iev) # single EV event
-                fVertex = ev.GetFitResult(fitName).GetVertex(0)     
-
-                filtercuts[1] += 1
-
-                if not ev.FitResultExists(fitName) or not ev.GetFitResult(fitName).GetVertex(0).ContainsPosition() or not ev.GetFitResult(fitName).GetVertex(0).ValidPosition() :
-                    continue # valid position filter
-                else:
-                    filtercuts[2] += 1
-                if not fVertex.ValidEnergy():
-                    continue          
-                filtercuts[3] += 1  
-   
-                PosEV = fVertex.GetPosition()                  # get position vector 
-                REV = PosEV.Mag()                              # and radius
-                RhoEV = math.sqrt(PosEV.X()**2 + PosEV.Y()**2)
-
-                mc = ds.GetMC() # individual MC event
-
-                PosMC = mc.GetMCParticle(0).GetPosition() # get position vector and radius 
-                RMC = PosMC.Mag()
-                RhoMC = math.sqrt(PosMC.X()**2 + PosMC.Y()**2)
-
-                if PosEV.Z() >= 6000 and RhoEV >= 730 :    
-                    in_AV = False         
-                    out_AV = True
-                elif PosEV.Z() < 6000 and REV > 6000 :
-                    in_AV = False
-                    out_AV = True
-                else :
-                    in_AV = True
-                    out_AV = False
-
-                if in_AV and fVertex.GetEnergy() > ECut:
-
-                    # store values in arrays for plotting
-                    ArrayZ_EV.append(PosEV.Z()) 
-                    ArrayRho_EV.append(RhoEV)
-                    AVCountEV += 1  
-
-                    # store values in arrays for plotting
-                    ArrayZ_MC.append(PosMC.Z())
-                    ArrayRho_MC.append(RhoMC)
-                    AVCountMC += 1 # keep count of mc events
-
-                elif out_AV and fVertex.GetEnergy() > ECut:
-
-                    # store values in arrays for plotting
-                    ArrayZ_EVO.append(PosEV.Z()) 
-                    ArrayRho_EVO.append(RhoEV)
-                    OCountEV += 1  
-
-                    # store values in arrays for plotting
-                    ArrayZ_MCO.append(PosMC.Z())
-                    ArrayRho_MCO.append(RhoMC)
-                    OCountMC += 1  
+    filtercuts[0] = len(events["iev"])
+    first = events["iev"] == 0 # retrigger filter
+    filtercuts[1] = np.count_nonzero(first)
+    valid = first & events["valid_position"] # valid position filter
+    filtercuts[2] = np.count_nonzero(valid)
+    valid &= events["valid_energy"]
+    filtercuts[3] = np.count_nonzero(valid)
+
+    with np.errstate(invalid="ignore") :
+        above = valid & (events["energy"] > ECut)
+    liquid = av_geometry.in_regions(events["region"], av_geometry.LIQUID) # inside the AV, including the neck
+    in_AV = above & liquid
+    out_AV = above & ~liquid
+
+    # store values in arrays for plotting
+    ArrayRho_EV, ArrayZ_EV = array("d", events["rho"][in_AV]), array("d", events["z"][in_AV])
+    ArrayRho_MC, ArrayZ_MC = array("d", events["mc_rho"][in_AV]), array("d", events["mc_z"][in_AV])
+    ArrayRho_EVO, ArrayZ_EVO = array("d", events["rho"][out_AV]), array("d", events["z"][out_AV])
+    ArrayRho_MCO, ArrayZ_MCO = array("d", events["mc_rho"][out_AV]), array("d", events["mc_z"][out_AV])
+
+    AVCountEV = AVCountMC = len(ArrayZ_EV) # keep count of mc events
+    OCountEV = OCountMC = len(ArrayZ_EVO)
 
     # =======================================================================
     
@@ -359,14 +233,14 @@ def CompareMCValidInvalidFitsECut(input_files, ECut):
     ZRhoPlotMCO.SetFillStyle(0)
     ZRhoPlotMCO.Draw()
 
-    r = 6000 # save to file eventually
+    r = av_geometry.R_AV # save to file eventually
     theta = -math.pi/2
     x, y = array("d"), array("d")
     for i in range(100):
         x.append(r*math.cos(theta)), y.append(r*math.sin(theta))
         theta += 0.0302
     for i in range(50):
-        x.append(730), y.append(6000+i*140)
+        x.append(av_geometry.RHO_NECK), y.append(av_geometry.Z_NECK+i*140)
     boundaryplot = ROOT.TGraph(150, x, y)
     boundaryplot.SetTitle("Inner AV")
     boundaryplot.SetLineStyle(3)
@@ -374,7 +248,7 @@ def CompareMCValidInvalidFitsECut(input_files, ECut):
     boundaryplot.SetFillStyle(0)
     boundaryplot.Draw()
     
-    lineplot = ROOT.TGraph(2, array("d", [0, 8000]), array("d", [747.5, 747.5])) # a line at Z = 747.5 mm to tell where scint ends
+    lineplot = ROOT.TGraph(2, array("d", [0, 8000]), array("d", [av_geometry.Z_FV_MIN, av_geometry.Z_FV_MIN])) # a line at Z = 747.5 mm to tell where scint ends
     lineplot.SetTitle("747.5 mm")
     lineplot.SetMarkerStyle(0)
     lineplot.SetLineStyle(7)
@@ -413,7 +287,7 @@ def CompareMCValidInvalidFitsECut(input_files, ECut):
 # ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
 
 # ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
-def CompareMCValidInvalidFits(input_files):
+def CompareMCValidInvalidFits(input_files, use_cache=False):
 
     """ 
 
@@ -422,104 +296,50 @@ def CompareMCValidInvalidFits(input_files):
     Compare valid energy and invalid energy events
 
     Parameters: 
-    file_name - Path to the RAT DS file to play around with
+    input_files - Paths to the RAT DS files to play around with
+    use_cache - Read the events through event_cache.py instead of the dsreader (ROOT is only read the first time)
     Return: nothing
 
     """
 
     fitName = "partialFitter"
-    CountEV = 0
-    CountMC = 0
-    just_compare_neck = False
 
     # ======================================================================= for z vs rho
 
-    ArrayRho_EV = array("d")
-    ArrayZ_EV = array("d")
-
-    ArrayRho_F = array("d")
-    ArrayZ_F = array("d")
-
-    ArrayRho_MC = array("d")
-    ArrayZ_MC = array("d")
+    events = load_event_positions(input_files, fitName, use_cache)
 
-    # ======================================================================= 
-
-    FitBelowCount = 0 # keep track of fitted events below 747.5 mm
-    OutsideEV = 0
-    NeckCountMC = 0
-    NeckCountEV = 0
-    outsideradius = 0
     filtercuts = [0, 0, 0, 0] # total fit count, retrigger filtered, posvalid, Evalid
 
-    for file_name in input_files :
-
-        for ds, run in dsreader(file_name):
-
-            mc = ds.GetMC() # individual MC event
-            CountMC += 1 # keep count of mc events
-
-            PosMC = mc.GetMCParticle(0).GetPosition() # get position vector and radius 
-            RMC = PosMC.Mag()
-            RhoMC = math.sqrt(PosMC.X()**2 + PosMC.Y()**2)
-
-            if RMC > 6000 and RhoMC < 730 :
-                NeckCountMC += 1
+    mc = events["iev"] == 0 # the MC event of each entry, once
+    CountMC = np.count_nonzero(mc) # keep count of mc events
+    NeckCountMC = np.count_nonzero(mc & (events["mc_region"] == av_geometry.NECK))
 
-            # store values in arrays for plotting
-            ArrayZ_MC.append(PosMC.Z())
-            ArrayRho_MC.append(RhoMC)
+    # store values in arrays for plotting
+    ArrayRho_MC, ArrayZ_MC = array("d", events["mc_rho"][mc]), array("d", events["mc_z"][mc])
 
-            for iev in range(0, ds.GetEVCount()): # ds is an entry, multiple EV events in one MC event possible so loop through them
-                filtercuts[0] += 1
-
-                #if iev > 0: # retrigger filter
-                #    continue
+    filtercuts[0] = len(events["iev"])
+    filtercuts[1] = filtercuts[0] # no retrigger filter
+    valid = events["valid_position"].copy() # valid position filter
+    filtercuts[2] = np.count_nonzero(valid) # keep count of valid pos fitted events
 
-                ev = ds.GetEV(iev) # single EV event
+    with np.errstate(invalid="ignore") :
+        FitBelowCount = np.count_nonzero(valid & (events["z"] < av_geometry.Z_FV_MIN)) # keep track of fitted events below 747.5 mm
+        outsideradius = np.count_nonzero(valid & (events["r"] > av_geometry.R_AV))
+    NeckCountEV = np.count_nonzero(valid & (events["region"] == av_geometry.NECK))
+    OutsideEV = np.count_nonzero(valid & av_geometry.in_regions(events["region"], (av_geometry.AV_SHELL, av_geometry.OUTSIDE)))
 
-                filtercuts[1] += 1
-
-                if not ev.FitResultExists(fitName) or not ev.GetFitResult(fitName).GetVertex(0).ContainsPosition() or not ev.GetFitResult(fitName).GetVertex(0).ValidPosition() :
-                    continue # valid position filter
-
-                filtercuts[2] += 1 # keep count of valid pos fitted events
-
-                fVertex = ev.GetFitResult(fitName).GetVertex(0)     
-                    
-                PosEV = fVertex.GetPosition()                  # get position vector 
-                REV = PosEV.Mag()                              # and radius
-                RhoEV = math.sqrt(PosEV.X()**2 + PosEV.Y()**2)
-
-                if PosEV.Z() < 747.5 :
-                    FitBelowCount += 1
-
-                if PosEV.Z() > 6000 and RhoEV < 730 :
-                    NeckCountEV += 1
-                
-                if PosEV.Z() >= 6000 and RhoEV >= 730 :
-                    OutsideEV += 1
-                if PosEV.Z() < 6000 and REV > 6000 :
-                    OutsideEV += 1
-                if REV > 6000 :
-                    outsideradius += 1
-
-                # store values in arrays for plotting
-                ArrayZ_EV.append(PosEV.Z()) 
-                ArrayRho_EV.append(RhoEV)
-
-                if not fVertex.ValidEnergy():
-                    continue      
-                ArrayZ_F.append(PosEV.Z()) 
-                ArrayRho_F.append(RhoEV)      
-                filtercuts[3] += 1   # valid pos and energy
+    # store values in arrays for plotting
+    ArrayRho_EV, ArrayZ_EV = array("d", events["rho"][valid]), array("d", events["z"][valid])
+    valid &= events["valid_energy"]
+    ArrayRho_F, ArrayZ_F = array("d", events["rho"][valid]), array("d", events["z"][valid])
+    filtercuts[3] = np.count_nonzero(valid) # valid pos and energy
 
     # =======================================================================
     
     canvas1 = ROOT.TCanvas("canvas1") # make canvas
     canvas1.cd()
 
-    ZRhoPlotMC = ROOT.TGraph(NeckCountMC, ArrayRho_MC, ArrayZ_MC) # make and format TGraph for Fitted events
+    ZRhoPlotMC = ROOT.TGraph(CountMC, ArrayRho_MC, ArrayZ_MC) # make and format TGraph for Fitted events
     ZRhoPlotMC.SetTitle("MC Events")
     ZRhoPlotMC.SetMarkerStyle(6)
     ZRhoPlotMC.SetMarkerColorAlpha(ROOT.kRed, 1)
@@ -543,14 +363,14 @@ def CompareMCValidInvalidFits(input_files):
     ZRhoPlotF.SetFillStyle(0)
     ZRhoPlotF.Draw()
 
-    r = 6000 # save to file eventually
+    r = av_geometry.R_AV # save to file eventually
     theta = -math.pi/2
     x, y = array("d"), array("d")
     for i in range(100):
         x.append(r*math.cos(theta)), y.append(r*math.sin(theta))
         theta += 0.0302
     for i in range(50):
-        x.append(730), y.append(6000+i*140)
+        x.append(av_geometry.RHO_NECK), y.append(av_geometry.Z_NECK+i*140)
     boundaryplot = ROOT.TGraph(150, x, y)
     boundaryplot.SetTitle("Inner AV")
     boundaryplot.SetLineStyle(3)
@@ -558,7 +378,7 @@ def CompareMCValidInvalidFits(input_files):
     boundaryplot.SetFillStyle(0)
     boundaryplot.Draw()
     
-    lineplot = ROOT.TGraph(2, array("d", [0, 8000]), array("d", [747.5, 747.5])) # a line at Z = 747.5 mm to tell where scint ends
+    lineplot = ROOT.TGraph(2, array("d", [0, 8000]), array("d", [av_geometry.Z_FV_MIN, av_geometry.Z_FV_MIN])) # a line at Z = 747.5 mm to tell where scint ends
     lineplot.SetTitle("747.5 mm")
     lineplot.SetMarkerStyle(0)
     lineplot.SetLineStyle(7)
@@ -600,7 +420,7 @@ def CompareMCValidInvalidFits(input_files):
 # ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
 
 # ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
-def NeckEventPositions(input_files):
+def NeckEventPositions(input_files, use_cache=False):
     """ 
     Description:
     Plot the Z vs Rho for MC and Fitted 
@@ -608,142 +428,49 @@ def NeckEventPositions(input_files):
     Compare valid energy and valid position fits
 
     Parameters: 
-    file_name - Path to the RAT DS file to play around with
+    input_files - Paths to the RAT DS files to play around with
+    use_cache - Read the events through event_cache.py instead of the dsreader (ROOT is only read the first time)
     Return: nothing
     """
 
     fitName = "partialFitter"
-    CountEV = 0
-    CountMC = 0
     just_compare_neck = True
 
     # ======================================================================= for z vs rho
 
-    ArrayRho_EV = array("d")
-    ArrayZ_EV = array("d")
-
-    ArrayRho_F = array("d")
-    ArrayZ_F = array("d")
+    events = load_event_positions(input_files, fitName, use_cache)
 
-    ArrayRho_MC = array("d")
-    ArrayZ_MC = array("d")
-
-    # ======================================================================= 
-
-    FitBelowCount = 0 # keep track of fitted events below 747.5 mm
-    OutsideEV = 0
-    NeckCountMC = 0
-    NeckCountEV = 0
-    outsideradius = 0
     filtercuts = [0, 0, 0, 0] # total fit count, retrigger filtered, posvalid, Evalid
 
-    for file_name in input_files:
-        for ds, run in dsreader(file_name):
-
-            mc = ds.GetMC() # individual MC event
-            CountMC += 1 # keep count of mc events
-
-            PosMC = mc.GetMCParticle(0).GetPosition() # get position vector and radius 
-            RMC = PosMC.Mag()
-            RhoMC = math.sqrt(PosMC.X()**2 + PosMC.Y()**2)
-
-            if RMC > 6000 and RhoMC < 730 and PosMC.Z() < 8000: # "and PosMC.Z() < 8000" added just to see bottom of neck
-                NeckCountMC += 1
-
-                # store values in arrays for plotting
-                ArrayZ_MC.append(PosMC.Z())
-                ArrayRho_MC.append(RhoMC)
-
-                if just_compare_neck :
-
-                    for iev in range(0, ds.GetEVCount()): # ds is an entry, multiple EV events in one MC event possible so loop through them
-                        filtercuts[0] += 1
-                        if iev > 0: # retrigger filter
-                            continue
-
-                        ev = ds.GetEV(iev) # single EV event
-
-                        filtercuts[1] += 1
-
-                        if not ev.FitResultExists(fitName) or not ev.GetFitResult(fitName).GetVertex(0).ContainsPosition() or not ev.GetFitResult(fitName).GetVertex(0).ValidPosition() :
-                            continue # valid position filter
-
-                        filtercuts[2] += 1
-
-                        fVertex = ev.GetFitResult(fitName).GetVertex(0)     
-                            
-                        PosEV = fVertex.GetPosition()                  # get position vector 
-                        REV = PosEV.Mag()                              # and radius
-                        RhoEV = math.sqrt(PosEV.X()**2 + PosEV.Y()**2)
-
-                        if PosEV.Z() < 747.5 :
-                            FitBelowCount += 1
-
-                        if PosEV.Z() > 6000 and RhoEV < 730 :
-                            NeckCountEV += 1
-                        
-                        if PosEV.Z() >= 6000 and RhoEV >= 730 :
-                            OutsideEV += 1
-                        elif PosEV.Z() < 6000 and REV > 6000 :
-                            OutsideEV += 1
-                        if REV > 6000 :
-                            outsideradius += 1
-
-                        # store values in arrays for plotting
-                        ArrayZ_EV.append(PosEV.Z()) 
-                        ArrayRho_EV.append(RhoEV)
-                        CountEV += 1 # keep count of fitted events
-
-                        if not fVertex.ValidEnergy():
-                            continue      
-                        ArrayZ_F.append(PosEV.Z()) 
-                        ArrayRho_F.append(RhoEV)      
-                        filtercuts[3] += 1  
-
-            if not just_compare_neck :
+    with np.errstate(invalid="ignore") : # "and mc_z < 8000" added just to see bottom of neck
+        mc_neck = (events["mc_region"] == av_geometry.NECK) & (events["mc_z"] < 8000) # same for every event of an entry
 
-                for iev in range(0, ds.GetEVCount()): # ds is an entry, multiple EV events in one MC event possible so loop through them
-                    filtercuts[0] += 1
-                    if iev > 0: # retrigger filter
-                        continue
+    mc = events["iev"] == 0 # the MC event of each entry, once
+    CountMC = np.count_nonzero(mc) # keep count of mc events
+    NeckCountMC = np.count_nonzero(mc & mc_neck)
 
-                    ev = ds.GetEV(iev) # single EV event
+    # store values in arrays for plotting
+    ArrayRho_MC, ArrayZ_MC = array("d", events["mc_rho"][mc & mc_neck]), array("d", events["mc_z"][mc & mc_neck])
 
-                    filtercuts[1] += 1
+    compared = mc_neck if just_compare_neck else np.ones(len(mc_neck), dtype=bool)
+    filtercuts[0] = np.count_nonzero(compared)
+    first = compared & (events["iev"] == 0) # retrigger filter
+    filtercuts[1] = np.count_nonzero(first)
+    valid = first & events["valid_position"] # valid position filter
+    filtercuts[2] = np.count_nonzero(valid) # keep count of valid pos fitted events
 
-                    if not ev.FitResultExists(fitName) or not ev.GetFitResult(fitName).GetVertex(0).ContainsPosition() or not ev.GetFitResult(fitName).GetVertex(0).ValidPosition() :
-                        continue # valid position filter
+    with np.errstate(invalid="ignore") :
+        FitBelowCount = np.count_nonzero(valid & (events["z"] < av_geometry.Z_FV_MIN)) # keep track of fitted events below 747.5 mm
+        outsideradius = np.count_nonzero(valid & (events["r"] > av_geometry.R_AV))
+    NeckCountEV = np.count_nonzero(valid & (events["region"] == av_geometry.NECK))
+    OutsideEV = np.count_nonzero(valid & av_geometry.in_regions(events["region"], (av_geometry.AV_SHELL, av_geometry.OUTSIDE)))
 
-                    filtercuts[2] += 1 # keep count of valid pos fitted events
-
-                    fVertex = ev.GetFitResult(fitName).GetVertex(0)     
-                        
-                    PosEV = fVertex.GetPosition()                  # get position vector 
-                    REV = PosEV.Mag()                              # and radius
-                    RhoEV = math.sqrt(PosEV.X()**2 + PosEV.Y()**2)
-
-                    if PosEV.Z() < 747.5 :
-                        FitBelowCount += 1
-
-                    if PosEV.Z() > 6000 and RhoEV < 730 :
-                        NeckCountEV += 1
-                    
-                    if PosEV.Z() >= 6000 and RhoEV >= 730 :
-                        OutsideEV += 1
-                    if PosEV.Z() < 6000 and REV > 6000 :
-                        OutsideEV += 1
-                    if REV > 6000 :
-                        outsideradius += 1
-
-                    # store values in arrays for plotting
-                    ArrayZ_EV.append(PosEV.Z()) 
-                    ArrayRho_EV.append(RhoEV)
-
-                    if not fVertex.ValidEnergy():
-                        continue      
-                    ArrayZ_F.append(PosEV.Z()) 
-                    ArrayRho_F.append(RhoEV)      
-                    filtercuts[3] += 1   # valid pos and energy
+    # store values in arrays for plotting
+    ArrayRho_EV, ArrayZ_EV = array("d", events["rho"][valid]), array("d", events["z"][valid])
+    valid &= events["valid_energy"]
+    ArrayRho_F, ArrayZ_F = array("d", events["rho"][valid]), array("d", events["z"][valid])
+    filtercuts[3] = np.count_nonzero(valid) # valid pos and energy
+    CountEV = len(ArrayZ_EV) # keep count of fitted events
 
     # =======================================================================
     
@@ -774,14 +501,14 @@ def NeckEventPositions(input_files):
     ZRhoPlotF.SetFillStyle(0)
     ZRhoPlotF.Draw()
 
-    r = 6000 # save to file eventually
+    r = av_geometry.R_AV # save to file eventually
     theta = -math.pi/2
     x, y = array("d"), array("d")
     for i in range(100):
         x.append(r*math.cos(theta)), y.append(r*math.sin(theta))
         theta += 0.0302
     for i in range(50):
-        x.append(730), y.append(6000+i*140)
+        x.append(av_geometry.RHO_NECK), y.append(av_geometry.Z_NECK+i*140)
     boundaryplot = ROOT.TGraph(150, x, y)
     boundaryplot.SetTitle("Inner AV")
     boundaryplot.SetLineStyle(3)
@@ -789,7 +516,7 @@ def NeckEventPositions(input_files):
     boundaryplot.SetFillStyle(0)
     boundaryplot.Draw()
     
-    lineplot = ROOT.TGraph(2, array("d", [0, 8000]), array("d", [747.5, 747.5])) # a line at Z = 747.5 mm to tell where scint ends
+    lineplot = ROOT.TGraph(2, array("d", [0, 8000]), array("d", [av_geometry.Z_FV_MIN, av_geometry.Z_FV_MIN])) # a line at Z = 747.5 mm to tell where scint ends
     lineplot.SetTitle("747.5 mm")
     lineplot.SetMarkerStyle(0)
     lineplot.SetLineStyle(7)
@@ -832,7 +559,46 @@ def NeckEventPositions(input_files):
 # ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
 
 # ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
-def PlotDataPosHist(input_files, retriggerfilter, is_mc):
+def load_event_positions(input_files, fitName, use_cache=False):
+
+    """ 
+
+    Description
+    -----------
+    The event_cache columns the Z vs Rho comparisons use, for every event of the input files (concatenated in file 
+    order), with the rho and av_geometry region of the fitted and MC positions
+
+    Parameters
+    ----------
+    input_files : list of str 
+        Path to the RAT DS file(s) to play around with
+    fitName : str
+        Fit result to use
+    use_cache : bool
+        Read the events through event_cache.py instead of the dsreader (ROOT is only read the first time)
+
+    Returns
+    -------
+    events : dict of numpy arrays
+        "iev", "valid_position", "valid_energy", "energy", "x", "y", "z", "r", "rho", "region", "mc_x", "mc_y", "mc_z"
+        (as event_cache), "mc_rho", and "mc_region" (av_geometry.classify code, INVALID without a position).
+        The MC position of an entry is repeated in each of its events, so entries without events are not included
+
+    """
+
+    columns = ["iev", "valid_position", "valid_energy", "energy", "x", "y", "z", "r", "rho", "region", "mc_x", "mc_y", "mc_z"]
+
+    files = [event_cache.load_events(file_name, fitName, use_cache) for file_name in input_files]
+    events = dict((name, np.concatenate([np.asarray(cols[name]) for cols in files])) for name in columns)
+
+    events["mc_rho"] = np.sqrt(events["mc_x"]**2 + events["mc_y"]**2)
+    events["mc_region"] = av_geometry.classify(events["mc_x"], events["mc_y"], events["mc_z"])
+
+    return events
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def PlotDataPosHist(input_files, retriggerfilter, is_mc, use_cache=False, n_workers=1, use_store=False):
 
     """ 
 
@@ -844,24 +610,98 @@ def PlotDataPosHist(input_files, retriggerfilter, is_mc):
     ----------
     input_files : list of str 
         Path to the RAT DS file(s) to play around with
+    use_cache : bool
+        Read the events through event_cache.py instead of the dsreader (ROOT is only read the first time)
+    n_workers : int
+        Number of processes the files are shared between (PosHistPartial for each, merged in file order)
+    use_store : bool
+        Take the partial histogram of each unchanged file from hist_store.py, only processing new or changed files
     
 
     """
 
-    fitName = "partialFitter"
-
     # ======================================================================= for z vs rho
 
-    ZRhoPlotEV = ROOT.TH2D("hist", "hist", 100, 0, 8000, 100, -8000, 8000)
-    ZRhoPlotEV.SetDirectory(0)
+    args = (retriggerfilter, use_cache)
+    map_files = hist_store.map_files_stored if use_store else analysis_runner.map_files
+    partials = map_files(PosHistPartial, input_files, args, n_workers)
+    ZRhoPlotEV, filtercuts = analysis_runner.merge_partials([PosHistPartial([], *args)] + partials) # starting from empty
+
+    ZRhoPlotEV = ZRhoPlotEV.to_TH2D()
     ZRhoPlotEV.SetStats(0)
 
-    # ======================================================================= 
+    # =======================================================================
+    
+    canvas1 = ROOT.TCanvas("canvas1") # make canvas
+    canvas1.cd()
+
+    if is_mc :
+        ZRhoPlotEV.SetTitle("Z vs. Rho for BiPo214 MC")
+    else :
+        ZRhoPlotEV.SetTitle("Z vs. Rho for BiPo214 Data")
+    ZRhoPlotEV.GetYaxis().SetTitleOffset(1.2)
+    ZRhoPlotEV.GetXaxis().SetTitle("Rho [mm]")
+    ZRhoPlotEV.GetYaxis().SetTitle("Z [mm]")
+
+    try:
+        ZRhoPlotEV.Draw("COLZ")
+    except:
+        print "'COLZ' failed."
+        ZRhoPlotEV.Draw("COL")
+
+
+
+    latex = ROOT.TLatex() # write messages
+    latex.SetTextFont(62)
+    latex.SetNDC()
+    latex.SetTextSize(0.02)
+    xloc = 0.75
+    yloc = 0.8
+    latex.DrawText(xloc-0.01, yloc+0.04, "Re-trigger filtered Events") 
+    latex.SetTextSize(0.015)
+    latex.DrawText(xloc, yloc, "%i Entries"%(ZRhoPlotEV.GetEntries()))
+    
+    canvas1.Print(outDir + outFileName) # save pdf
+    
+    print filtercuts, " total fit count, retrigger filtered, posvalid, Evalid"
+    # =======================================================================
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def PosHistPartial(input_files, retriggerfilter, use_cache):
+
+    """ 
+
+    Description
+    -----------
+    The PlotDataPosHist loop, returning the (picklable, mergeable) ArrayHist2D and counts instead of plotting
+
+    Returns (all in a tuple)
+    -------
+    ZRhoPlotEV : ArrayHist2D
+        Rho [mm] on x, Z [mm] on y
+    filtercuts : list
+        total fit count, retrigger filtered, posvalid, Evalid
+
+    """
+
+    fitName = "partialFitter"
+
+    ZRhoPlotEV = ArrayHist2D("hist", "hist", 100, 0, 8000, 100, -8000, 8000)
 
     filtercuts = [0, 0, 0, 0] # total fit count, retrigger filtered, posvalid, Evalid
 
+    gauntlet = cuts.CutFlow(([cuts.retrigger] if retriggerfilter else []) + [cuts.valid_position, cuts.valid_energy, cuts.energy_min(0.5), cuts.fv])
+
     for file_name in input_files :
 
+        if use_cache : # same gauntlet on the cached columns, a chunk at a time
+            for events in event_cache.iter_chunks(event_cache.load_events(file_name, fitName), gauntlet.columns + ["rho"]) :
+                keep = gauntlet.mask(events)
+                ZRhoPlotEV.fill_array(events["rho"][keep], events["z"][keep])
+            continue
+
         dsread = dsreader(file_name)
         print "\n\tSuccessfully ran dsreader(", file_name, ")\n"
 
@@ -875,70 +715,77 @@ def PlotDataPosHist(input_files, retriggerfilter, is_mc):
                 if retriggerfilter and iev > 0: # retrigger filter
                     continue
 
-                ev = ds.GetEV(iev) # single EV event
+                ev = EventView(ds.GetEV(iev), fitName) # single EV event, fit result read once
 
                 filtercuts[1] += 1
 
-                if not ev.FitResultExists(fitName) or not ev.GetFitResult(fitName).GetVertex(0).ContainsPosition() or not ev.GetFitResult(fitName).GetVertex(0).ValidPosition() :
+                if not ev.valid_position :
                     continue # valid position filter
 
 
                 filtercuts[2] += 1 # keep count of valid pos fitted events
 
-                fVertex = ev.GetFitResult(fitName).GetVertex(0)    
-
-                if not fVertex.ValidEnergy():
+                if not ev.valid_energy:
                     continue 
-                if fVertex.GetEnergy() < 0.5 : continue
+                if ev.energy < 0.5 : continue
                     
-                PosEV = fVertex.GetPosition()                  # get position vector 
-                PosEV_Z = PosEV.Z()
-                REV = PosEV.Mag()                              # and radius
-                RhoEV = math.sqrt(PosEV.X()**2 + PosEV.Y()**2)
+                PosEV_Z = ev.z
+                REV = ev.r                                     # radius
+                RhoEV = ev.rho
 
            
                 if REV > 6000 or PosEV_Z < 747.5:
                     continue
 
                 # plot in hist
-                ZRhoPlotEV.Fill(RhoEV, PosEV_Z)
-        
+                ZRhoPlotEV.fill(RhoEV, PosEV_Z)
 
+    if use_cache :
+        filtercuts[0] = gauntlet.total
+        filtercuts[1] = gauntlet.count(cuts.retrigger) if retriggerfilter else gauntlet.total
+        filtercuts[2] = gauntlet.count(cuts.valid_position) # keep count of valid pos fitted events
+        gauntlet.print_table("Position cuts")
 
+    return ZRhoPlotEV, filtercuts
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
 
-    # =======================================================================
-    
-    canvas1 = ROOT.TCanvas("canvas1") # make canvas
-    canvas1.cd()
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+class ZRhoConsumer(object):
 
-    if is_mc :
-        ZRhoPlotEV.SetTitle("Z vs. Rho for BiPo214 MC")
-    else :
-        ZRhoPlotEV.SetTitle("Z vs. Rho for BiPo214 Data")
-    ZRhoPlotEV.GetYaxis().SetTitleOffset(1.2)
-    ZRhoPlotEV.GetXaxis().SetTitle("Rho [mm]")
-    ZRhoPlotEV.GetYaxis().SetTitle("Z [mm]")
+    """ 
 
-    try:
-        ZRhoPlotEV.Draw("COLZ")
-    except:
-        print "'COLZ' failed."
-        ZRhoPlotEV.Draw("COL")
+    Description
+    -----------
+    The PlotDataPosHist Z vs Rho histogram as a consumer of analysis_runner.run_analysis, so it can be filled in the
+    same pass as the other histograms. Plotting is left to the caller.
 
+    Returns (result)
+    -------
+    ZRhoPlotEV : TH2D
+        Rho [mm] on x, Z [mm] on y
+    filtercuts : list
+        total fit count, retrigger filtered, posvalid, Evalid (as PlotDataPosHist)
 
+    """
 
-    latex = ROOT.TLatex() # write messages
-    latex.SetTextFont(62)
-    latex.SetNDC()
-    latex.SetTextSize(0.02)
-    xloc = 0.75
-    yloc = 0.8
-    latex.DrawText(xloc-0.01, yloc+0.04, "Re-trigger filtered Events") 
-    latex.SetTextSize(0.015)
-    latex.DrawText(xloc, yloc, "%i Entries"%(ZRhoPlotEV.GetEntries()))
-    
-    canvas1.Print(outDir + outFileName) # save pdf
-    
-    print filtercuts, " total fit count, retrigger filtered, posvalid, Evalid"
-    # =======================================================================
+    def __init__(self):
+
+        self.ZRhoPlotEV = ArrayHist2D("hist", "hist", 100, 0, 8000, 100, -8000, 8000)
+        self.gauntlet = cuts.CutFlow([cuts.valid_energy, cuts.energy_min(0.5), cuts.fv])
+        self.columns = self.gauntlet.columns + ["rho"]
+
+    def begin_file(self, fname):
+        pass
+
+    def consume(self, events, keep):
+
+        keep = self.gauntlet.mask(events, keep)
+        self.ZRhoPlotEV.fill_array(events["rho"][keep], events["z"][keep])
+
+    def result(self, counts):
+
+        self.gauntlet.print_table("Position cuts")
+        ZRhoPlotEV = self.ZRhoPlotEV.to_TH2D()
+        ZRhoPlotEV.SetStats(0)
+        return ZRhoPlotEV, [counts[0], counts[0] - counts[1], counts[2], 0]
 # ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
\ No newline at end of file
@@ -40,9 +40,18 @@ if __name__ == "__main__":
     is_mc = tagger_settings.is_mc     # bool
     fitName = tagger_settings.fitName # str
     counts = tagger_settings.counts   # list of ints
+    tagger_mode = tagger_settings.tagger_mode # str
+    n_workers = tagger_settings.n_workers     # int
+    n_shards = tagger_settings.n_shards       # int
 
     #tagger_functions.bipo214_comb(is_mc, data_file_arr) # bool, list of strs
     #tagger_functions3.bipo214_comb(is_mc, new_data_file_arr) # bool, list of strs
-    tagger_functions3.bipo214_comb(is_mc, mc_file_arr)
+    tagger_functions3.bipo214_comb(is_mc, mc_file_arr, n_workers)
+    #tagger_functions3.bipo214_skim(mc_file_arr) # after tagging, copy the tagged entries into small _skim.root files
+    #tagger_functions3.bipo214_scan(mc_file_arr, tagger_functions3.make_cut_grid({"bi_r_max" : [5000.0, 5500.0, 6000.0], "bipo_delta_r_max" : [600.0, 800.0, 1000.0]}))
     
-    # bipo214_comb() --> build_bipo214_results --> is_bipo214_beta()   
\ No newline at end of file
+    # bipo214_comb() --> build_bipo214_results --> is_bipo214_beta()                      (tagger_mode = "legacy")
+    # bipo214_comb() --> build_bipo214_results_window --> find_bipo214_pairs_window()   (tagger_mode = "window")
+    # bipo214_comb() --> build_bipo214_results_columns --> extract_bipo214_columns(), match_bipo214_columns() (tagger_mode = "columns")
+    # bipo214_skim() --> bipo_pairs.load_pairs(), skim_entries() on the .pairs files from bipo214_comb()
+    # bipo214_scan() --> extract_bipo214_columns() once per file --> match_bipo214_columns() once per grid point   
\ No newline at end of file
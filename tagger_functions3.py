@@ -3,11 +3,24 @@
 # Aidan Patton, 07-2020
 
 '''
-Apply cuts to isolate BiPo214 coincidence events, save entry ids to newline separated .txt file.
+Apply cuts to isolate BiPo214 coincidence events, save entry ids to newline separated .txt file
+(and optionally the full pair records to a binary .pairs file, see bipo_pairs.py).
 '''
 
 import ROOT
 import rat 
+import collections
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import numpy as np
+import bipo_pairs
+import bipo_spatial
+import cuts as event_cuts
+import event_cache
+import event_view
 import tagger_settings
 
 ev_dir = tagger_settings.ev_dir   # str
@@ -35,6 +48,19 @@ bipo_delta_t_max = tagger_settings.bipo_delta_t_max # [ns] # float
 is_mc = tagger_settings.is_mc     # bool
 fitName = tagger_settings.fitName # str
 counts = tagger_settings.counts   # list of ints
+tagger_mode = tagger_settings.tagger_mode # str
+max_pairs_per_block = tagger_settings.max_pairs_per_block # int
+use_spatial_index = tagger_settings.use_spatial_index # bool
+bipo_match = tagger_settings.bipo_match # str
+bipo_rank = tagger_settings.bipo_rank   # str
+n_shards = tagger_settings.n_shards     # int
+manifest_file = tagger_settings.manifest_file # str
+offtime_windows = tagger_settings.offtime_windows # list of [t_min, t_max] [ns]
+offtime_counts = [0] * len(offtime_windows) # count in each off-time window, in single file (most recent)
+pair_output = tagger_settings.pair_output # bool
+use_event_cache = tagger_settings.use_event_cache # bool
+
+dc_mask = 0x210000000242 # data cleaning bitmask applied to both Bi and Po in data
 
 
 
@@ -56,7 +82,7 @@ def write_out(saveFile, input_list) :
 
 
 # ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
-def bipo214_comb(is_mc, in_files): # main function to call
+def bipo214_comb(is_mc, in_files, n_workers=None): # main function to call
 
     ''' 
     Description
@@ -71,6 +97,13 @@ def bipo214_comb(is_mc, in_files): # main function to call
     in_files : list
         List of input root files to search through. Full path and file-type NOT included (must be .root)
         Requires PMT-level data, so ntuples have NOT been made acceptable 
+    n_workers : int
+        Number of worker processes to tag the files with, defaults to tagger_settings.n_workers. With more than one, 
+        each worker loads the DB once and then takes the next file off the queue as it finishes one; the results are 
+        collected in file order, so the summary is the same for any number of workers.
+
+    Progress is recorded file by file in the manifest (tagger_settings.manifest_file), so a rerun only tags the files that 
+    are new, changed, unfinished or were tagged with different settings; the totals for the others come from the manifest.
     
     Returns
     -------
@@ -81,9 +114,8 @@ def bipo214_comb(is_mc, in_files): # main function to call
     if in_files in ("", None, [], [""]) or type(in_files) is not list :
         print "Invalid input files. Must be a list of strings."
         return 
-    
-    # First load all the utilities: PMT information, lightpath calculator. Without this call the calculated time residual will be BIASED at the first call of the corresponding lightpath and group velocity calculations 
-    rat.utility().Get().LoadDBAndBeginRun() 
+
+    if n_workers is None : n_workers = tagger_settings.n_workers
 
     # just do one for now: FIXME
     #in_files = [in_files.pop(0)]
@@ -92,27 +124,287 @@ def bipo214_comb(is_mc, in_files): # main function to call
     fname_count = 0 # counter (starts at 1) for what file is being analysed
     nfiles = len(in_files) # total number of files 
     coincicount = [0] * nfiles # to count of number of bipo beta events found in each file.
+    offtime_total = [0] * len(offtime_windows) # off-time window counts across all files
+
+    # files already tagged with the same settings (and unchanged since) are taken from the manifest instead of being read again
+    manifest = load_manifest(manifest_file)
+    tag_settings = get_tag_settings()
+    todo = [fname for fname in in_files if not is_tagged(manifest, fname, tag_settings)]
+
+    pool = None
+    if n_workers > 1 and todo :
+        pool = multiprocessing.Pool(n_workers, initializer=init_tagger_worker)
+        results = pool.imap(tag_file, todo) # in order of todo, whichever worker did them
+    else :
+        if todo : init_tagger_worker()
+        results = (tag_file(fname) for fname in todo) # lazy, so each file's summary is printed as soon as it is done
     
-    for fname in in_files :
+    try :
+        for fname in in_files :
+
+            fname_count += 1
+
+            if fname not in todo :
+                entry = manifest[fname]
+                result = (entry["coincicount"], entry["nevents"], entry["saveFile"], entry["offtime_counts"])
+                counts[1] += entry["nevents"]
+                print "\n\t", fname, "was already tagged, using the manifest."
+            else :
+                result = next(results)
+                if result is None : continue # skipped
+                if n_workers > 1 : counts[1] += result[1] # the workers only add to their own copy
+
+                complete = result[0] is not None # False if the file couldn't be read, so it is retried next time
+                if not complete : result = (0,) + result[1:]
+                manifest[fname] = {"fingerprint" : file_fingerprint(data_dir + fname + ".root"), "settings" : tag_settings, 
+                                   "coincicount" : result[0], "nevents" : result[1], "saveFile" : result[2], 
+                                   "offtime_counts" : result[3], "complete" : complete}
+                save_manifest(manifest_file, manifest)
+                if not complete :
+                    print "\n\t", fname, "could not be read, it will be tagged again on the next run."
+
+            coincicount[fname_count-1], nevents, saveFile, file_offtime_counts = result
+            for i in range(len(offtime_total)) : offtime_total[i] += file_offtime_counts[i]
+
+            print "\n\t", nevents, "events were analysed in this file."
+            print "\n\tFinal coincidence event count for file", fname_count, "/", nfiles, ":", coincicount[fname_count-1]
+            print_accidentals(coincicount[fname_count-1], file_offtime_counts)
+            print "\tSaved to", saveFile
+    except :
+        if pool is not None : pool.terminate() # a worker raised, don't wait for the files still queued
+        raise
+    finally :
+        if pool is not None :
+            pool.close()
+            pool.join()
+
+    print "\n\n\tTotal Bi event count across all", nfiles, "file(s):", counts[1], "events."
+    print "\n\tFinal coincidence event count for all", nfiles, "file(s):", sum(coincicount), "coincidence events."
+    print_accidentals(sum(coincicount), offtime_total)
+    print "\n"
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
 
-        fname_count += 1
 
-        if ".ntuple" in fname :
-            print "\n", fname, "is an invalid input file."
-            print "ROOT ntuples are not acceptable input as they do not contain PMT-level data. Skipping."
-            continue # skip to next file  
 
-        saveFile = ev_dir + fname + ".txt"
-        fname = data_dir + fname + ".root"
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def get_tag_settings():
 
-        counts[0] = 0 # reset individual-file event counter
-        coincicount[fname_count-1] = build_bipo214_results(fname, saveFile) # main functionality
+    '''
+    Return everything that changes the output of the tagger (cuts, engine, fitter...) as a dict, to compare runs with.
+    '''
 
-        print "\n\t", counts[0], "events were analysed in this file."
-        print "\n\tFinal coincidence event count for file", fname_count, "/", nfiles, ":", coincicount[fname_count-1]
+    tag_settings = get_cut_settings()
+    tag_settings.update({"is_mc" : is_mc, "fitName" : fitName, "tagger_mode" : tagger_mode, "bipo_match" : bipo_match, 
+                         "bipo_rank" : bipo_rank, "offtime_windows" : [list(window) for window in offtime_windows], 
+                         "pair_output" : pair_output})
+    return tag_settings
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
 
-    print "\n\n\tTotal Bi event count across all", nfiles, "file(s):", counts[1], "events."
-    print "\n\tFinal coincidence event count for all", nfiles, "file(s):", sum(coincicount), "coincidence events.\n\n"
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def file_fingerprint(fname):
+
+    '''
+    Return [size, modification time] of fname (str), or None if it doesn't exist.
+    '''
+
+    if not os.path.isfile(fname) : return None
+    stat = os.stat(fname)
+    return [stat.st_size, stat.st_mtime]
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def load_manifest(manifest_file):
+
+    '''
+
+    Description
+    -----------
+    Load the tagging manifest, a json file with one entry per input file name (as in bipo214_comb's in_files):
+    {"fingerprint" : [size, mtime], "settings" : get_tag_settings(), "coincicount" : int, "nevents" : int, 
+    "saveFile" : str, "offtime_counts" : list of ints, "complete" : bool}
+
+    Parameters
+    ----------
+    manifest_file : str
+        full path to the manifest. If "" the manifest isn't used.
+
+    Returns
+    -------
+    manifest : dict
+        Empty if there is no manifest yet.
+
+    '''
+
+    if not manifest_file or not os.path.isfile(manifest_file) : return {}
+
+    with open(manifest_file, 'r') as fi :
+        return json.load(fi)
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def save_manifest(manifest_file, manifest):
+
+    '''
+    Save manifest (dict) to manifest_file (str, full path), replacing the old one only once it is fully written.
+    '''
+
+    if not manifest_file : return
+
+    with open(manifest_file + ".tmp", 'w') as fo :
+        json.dump(manifest, fo, indent=1, sort_keys=True)
+    os.rename(manifest_file + ".tmp", manifest_file)
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def is_tagged(manifest, fname, tag_settings):
+
+    '''
+    Whether fname (str, as in bipo214_comb's in_files) was completely tagged with tag_settings (dict) according to 
+    manifest (dict), and neither it nor its output have changed since.
+    '''
+
+    entry = manifest.get(fname)
+    if entry is None or not entry["complete"] : return False
+    if entry["settings"] != tag_settings : return False
+
+    if pair_output and tagger_mode != "legacy" and not os.path.isfile(pair_file_name(fname)) : return False # not written in legacy mode
+
+    fingerprint = file_fingerprint(data_dir + fname + ".root")
+    return fingerprint is not None and entry["fingerprint"] == fingerprint and os.path.isfile(entry["saveFile"])
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def init_tagger_worker():
+
+    '''
+    Load all the utilities: PMT information, lightpath calculator. Run once per process before any file is tagged.
+    '''
+
+    # Without this call the calculated time residual will be BIASED at the first call of the corresponding lightpath and group velocity calculations 
+    rat.utility().Get().LoadDBAndBeginRun() 
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def pair_file_name(fname):
+
+    '''
+    Full path to the bipo_pairs output of fname (str, as in bipo214_comb's in_files).
+    '''
+
+    return ev_dir + fname + ".pairs"
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def tag_file(fname):
+
+    '''
+
+    Description
+    -----------
+    Find the BiPo214 coincidences in a single input file with the engine chosen by tagger_mode.
+
+    Parameters
+    ----------
+    fname : str
+        Input root file, full path and file-type NOT included (as in bipo214_comb's in_files).
+
+    Returns
+    -------
+    result : tuple or None
+        (coincicount, number of events analysed, output .txt file, off-time window counts), None if the file was skipped.
+        coincicount is None if the file couldn't be read.
+
+    '''
+
+    if ".ntuple" in fname :
+        print "\n", fname, "is an invalid input file."
+        print "ROOT ntuples are not acceptable input as they do not contain PMT-level data. Skipping."
+        return None # skip to next file  
+
+    saveFile = ev_dir + fname + ".txt"
+    pair_writer = None
+    if pair_output and tagger_mode != "legacy" :
+        pair_writer = bipo_pairs.PairWriter(pair_file_name(fname), bipo_pairs.file_id(fname))
+    fname = data_dir + fname + ".root"
+
+    counts[0] = 0 # reset individual-file event counter
+    offtime_counts[:] = [0] * len(offtime_windows)
+    if tagger_mode == "legacy" :
+        if offtime_windows : print "Off-time windows are not counted in legacy mode."
+        if pair_output : print "Pair records are not written in legacy mode."
+        coincicount = build_bipo214_results(fname, saveFile) # main functionality
+    elif tagger_mode == "columns" :
+        coincicount = build_bipo214_results_columns(fname, saveFile, pair_writer)
+    elif n_shards > 1 :
+        coincicount = build_bipo214_results_sharded(fname, saveFile, n_shards, pair_writer)
+    else :
+        coincicount = build_bipo214_results_window(fname, saveFile, pair_writer)
+
+    if pair_writer is not None : pair_writer.close()
+
+    return (coincicount, counts[0], saveFile, list(offtime_counts))
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def accidental_estimate(offtime):
+
+    '''
+
+    Description
+    -----------
+    Estimate the number of accidental coincidences in the signal window from the off-time window counts: each off-time 
+    count is scaled by the ratio of the signal and off-time window widths, then the estimates are averaged.
+
+    Parameters
+    ----------
+    offtime : list of ints
+        Counts in each of offtime_windows.
+
+    Returns
+    -------
+    accidentals : float
+        Estimated accidental coincidences in the signal window, 0 if there are no off-time windows.
+
+    '''
+
+    if not offtime_windows : return 0.0
+
+    signal_width = bipo_delta_t_max - bipo_delta_t_min
+    estimates = [offtime[i]*signal_width/float(offtime_windows[i][1] - offtime_windows[i][0]) for i in range(len(offtime_windows))]
+    return sum(estimates)/len(estimates)
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def print_accidentals(signal, offtime):
+
+    '''
+    Print the signal (int), off-time window counts (list of ints), accidental estimate and background subtracted count.
+    Nothing is printed if no off-time windows were counted (none set, or legacy mode).
+    '''
+
+    if not offtime_windows or tagger_mode == "legacy" : return
+
+    accidentals = accidental_estimate(offtime)
+    print "\tOff-time window counts :", ", ".join("%i in (%.0f, %.0f) ns"%(offtime[i], offtime_windows[i][0], offtime_windows[i][1]) for i in range(len(offtime_windows)))
+    print "\tSignal : %i, accidentals : %.2f, background subtracted : %.2f"%(signal, accidentals, signal - accidentals)
 # ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
 
 
@@ -135,8 +427,8 @@ def build_bipo214_results(fname, saveFile):
 
     Returns
     -------
-    coincicount : int
-        number of BiPo coincidences found in the file.
+    coincicount : int or None
+        number of BiPo coincidences found in the file, None if it is unable to be read.
 
     '''
 
@@ -147,7 +439,7 @@ def build_bipo214_results(fname, saveFile):
         print "\n\tAnalysing file", fname, "\n"
     except :
         print fname, "is unable to be read by the dsreader. Skipping this file."
-        return 0 # 0 coincident events found in this file because it is unreadable
+        return None # unreadable, not 0 coincidences, so the file is tagged again on the next run
 
     iEntryBi   = -1 # counting entries 
     coincicount = 0 # count of bipo214 coincidence events
@@ -218,29 +510,17 @@ def is_bipo214_beta(dsRead, bi_ev, iEntryBi):
     counts[1] += 1 # counter for all events across ALL files 
     PoGTID = 0 # dummy value
 
-    if not bi_ev.FitResultExists(fitName) or not bi_ev.GetFitResult(fitName).GetVertex(0).ValidPosition() or not bi_ev.GetFitResult(fitName).GetVertex(0).ValidTime() :
+    bi = bipo_event_view(bi_ev) # a copy, so still the Bi after dsRead moves on to the Po entries
+    if not has_bipo_fit(bi) :
         return (False, PoGTID, iEntryBi) # must have valid fit otherwise we cannot extract the necessary information to apply cuts
 
     quit_search = False        # redefine upon each opening of the function, for breaking loops
     is_bipo214_beta_ev = False # False by default : bool of whether the Bi event is a BiPo214 coincidence event
 
-    bi_fit_pos = bi_ev.GetFitResult(fitName).GetVertex(0).GetPosition()
-    bi_ev_time = bi_ev.GetClockCount50()*20 # to search between different events we have to use the clk not the fitted time (fit time is within the event window (0, 400) [ns])
-
-    # Bi position
-    bi_z = bi_fit_pos.Z()
-    bi_r = bi_fit_pos.Mag()
+    # to search between different events we have to use the clk (bi.time) not the fitted time (fit time is within the event window (0, 400) [ns])
 
     """ Apply Cuts """
-    if bi_z < bi_z_min : return (False, PoGTID, iEntryBi)                               # FV cut (in scintillator cap)
-    if bi_r < bi_r_min or bi_r > bi_r_max : return (False, PoGTID, iEntryBi)            # FV cut (Bi  2m < R < 6 m)
-    if bi_ev.GetNhitsCleaned() < bi_nhit_cleaned_min : return (False, PoGTID, iEntryBi) # Bi nhitsCleaned cut 
-    if is_mc == False : # the data cleaning (dc) cuts are only used for data 
-        latestPass = bi_ev.GetDataCleaningFlags().GetLatestPass()
-        bi_dcApplied = bi_ev.GetDataCleaningFlags().GetApplied(latestPass).GetULong64_t(0)
-        bi_dcFlagged = bi_ev.GetDataCleaningFlags().GetFlags(latestPass).GetULong64_t(0) 
-        if ((bi_dcApplied & 0x210000000242) & bi_dcFlagged) != (bi_dcApplied & 0x210000000242) : # dc bitmask 
-            return (False, PoGTID, iEntryBi)
+    if not passes_bi_cuts(bi) : return (False, PoGTID, iEntryBi)
     """ All Bi Cuts Successful! """
 
     print "Entry #", iEntryBi # to make it clear when a potential Bi candidate is found
@@ -250,39 +530,23 @@ def is_bipo214_beta(dsRead, bi_ev, iEntryBi):
         iEntryPo += 1
         for iev1 in range(0, ds1.GetEVCount()) :
 
-            po_ev = ds1.GetEV(iev1)
-
-            if not po_ev.FitResultExists(fitName) or not po_ev.GetFitResult(fitName).GetVertex(0).ValidPosition() or not po_ev.GetFitResult(fitName).GetVertex(0).ValidTime() :
+            po = bipo_event_view(ds1.GetEV(iev1))
+            if not has_bipo_fit(po) :
                 continue
 
-            po_fit_pos = po_ev.GetFitResult(fitName).GetVertex(0).GetPosition()
-            po_ev_time = po_ev.GetClockCount50()*20 
-
-            # Po position
-            po_z = po_fit_pos.Z()
-            po_r = po_fit_pos.Mag()
-
             ''' Apply Po Cuts '''
-            if po_z < po_z_min : continue # Po z > 0.85 m (in scintillator cap)
-            if po_r > po_r_max : continue # po  R < 6 m
-            if po_ev.GetNhitsCleaned() < po_nhit_cleaned_min or po_ev.GetNhitsCleaned() > po_nhit_cleaned_max : continue # nhits cut
-            if is_mc == False : # unnecessary to apply data cleaning bitmask to MC
-                latestPass = po_ev.GetDataCleaningFlags().GetLatestPass()
-                po_dcApplied = po_ev.GetDataCleaningFlags().GetApplied(latestPass).GetULong64_t(0)
-                po_dcFlagged = po_ev.GetDataCleaningFlags().GetFlags(latestPass).GetULong64_t(0) 
-                if ((po_dcApplied & 0x210000000242) & po_dcFlagged) != (po_dcApplied & 0x210000000242) : # dc bitmask
-                    continue
+            if not passes_po_cuts(po) : continue
             ''' All Po Cuts Passed! '''
 
             # final cuts
-            delta_r = (po_fit_pos - bi_fit_pos).Mag()
+            delta_r = math.sqrt((po.x - bi.x)**2 + (po.y - bi.y)**2 + (po.z - bi.z)**2)
             delta_r_cut = delta_r < bipo_delta_r_max
-            delta_t = po_ev_time - bi_ev_time
+            delta_t = po.time - bi.time
             delta_t_cut = delta_t > bipo_delta_t_min and delta_t < bipo_delta_t_max # coincidence decay time + some flat bkg
 
             if delta_r_cut and delta_t_cut : 
                 is_bipo214_beta_ev = True # else stays False
-                PoGTID = po_ev.GetGTID()
+                PoGTID = po.gtid
                 print "\n\n\tIs BiPo214! iEntryBi =", iEntryBi, "iEntryPo =", iEntryPo
             
             if is_bipo214_beta_ev == True or delta_t > bipo_delta_t_max : # quit search if found coincidence 
@@ -292,4 +556,1020 @@ def is_bipo214_beta(dsRead, bi_ev, iEntryBi):
         if quit_search == True : break # breaks for ds1, run in dsReader
 
     return (is_bipo214_beta_ev, PoGTID, iEntryPo) 
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def bipo_event_view(ev):
+
+    '''
+    event_view.EventView of ev (rat.RAT::DS::EV) with the fitName fit, with only what the tagger uses. The data cleaning
+    words (data only) are read by passes_dc_cut, once the other cuts have passed.
+    '''
+
+    return event_view.EventView(ev, fitName, dc=not is_mc, minimal=True)
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def has_bipo_fit(view):
+
+    '''
+    Whether view (event_view.EventView) has a valid fit position and time, needed to be either a Bi or a Po.
+    '''
+
+    return view.valid_position and view.valid_time
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def passes_dc_cut(view):
+
+    '''
+    Apply the data cleaning bitmask dc_mask to view (event_view.EventView). Always passes for MC.
+    '''
+
+    if is_mc : return True # the data cleaning (dc) cuts are only used for data 
+
+    dc_applied, dc_flagged = view.dc_words() # read now, only for the events that passed the other cuts
+    return ((dc_applied & dc_mask) & dc_flagged) == (dc_applied & dc_mask)
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def passes_bi_cuts(view):
+
+    '''
+    Whether view (event_view.EventView, with a valid fit) passes all the Bi cuts.
+    '''
+
+    if view.z < bi_z_min : return False                               # FV cut (in scintillator cap)
+    if view.r < bi_r_min or view.r > bi_r_max : return False          # FV cut (Bi  2m < R < 6 m)
+    if view.nhits_cleaned < bi_nhit_cleaned_min : return False        # Bi nhitsCleaned cut 
+    return passes_dc_cut(view)
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def passes_po_cuts(view):
+
+    '''
+    Whether view (event_view.EventView, with a valid fit) passes all the Po cuts.
+    '''
+
+    if view.z < po_z_min : return False # Po z > 0.85 m (in scintillator cap)
+    if view.r > po_r_max : return False # po  R < 6 m
+    if view.nhits_cleaned < po_nhit_cleaned_min or view.nhits_cleaned > po_nhit_cleaned_max : return False # nhits cut
+    return passes_dc_cut(view)
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def build_bipo214_results_window(fname, saveFile, pair_writer=None):
+
+    '''
+
+    Description
+    -----------
+    Same as build_bipo214_results, but the file is read only once using find_bipo214_pairs_window, 
+    so no Bi candidates are lost to the Po search.
+
+    Parameters
+    ----------
+    fname : str
+        full path to RAT data to access with the dsReader.
+    saveFile : str
+        full path to output .txt file storing entry ids
+    pair_writer : bipo_pairs.PairWriter or None
+        If given, the full pair records are also streamed to it while tagging.
+
+    Returns
+    -------
+    coincicount : int or None
+        number of BiPo coincidences found in the file, None if it is unable to be read.
+
+    '''
+
+    ev_id_list = []
+
+    try : # If this fails for any reason, we want to avoid corrupting the TFile, so exit the function.
+        dsRead = rat.dsreader(fname) 
+        print "\n\tAnalysing file", fname, "\n"
+    except :
+        print fname, "is unable to be read by the dsreader. Skipping this file."
+        return None # unreadable, not 0 coincidences, so the file is tagged again on the next run
+
+    pairs = find_bipo214_pairs_window(dsRead, pair_writer=pair_writer)
+
+    for pair in pairs :
+        BiGTID, PoGTID = pair[2], pair[5]
+        ev_id_list.append(BiGTID) # same ordering as build_bipo214_results : Bi then its Po, in order of the Bi
+        ev_id_list.append(PoGTID)
+
+    write_out(saveFile, ev_id_list)
+    return len(pairs)
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def find_bipo214_pairs_window(dsRead, iEntryStart=0, iEntryBiStop=None, pair_writer=None):
+
+    '''
+
+    Description
+    -----------
+    Find all BiPo214 coincidences in a single pass over dsRead. 
+    A window of open Bi candidates is kept, oldest first; candidates leave the window once the clock has moved more 
+    than bipo_delta_t_max past them (or once matched, if bipo_match == "first"). Every event is first tested as the Po 
+    of the open candidates, then as a Bi candidate itself, so each event is read once and none are skipped: O(N) per file.
+
+    With use_spatial_index the open candidates are also kept in a bipo_spatial.VoxelHash, so a Po is only compared 
+    to the candidates within bipo_delta_r_max of it rather than to the whole window.
+
+    With bipo_match == "first" the cuts and the first-match behaviour are the same as is_bipo214_beta: a Bi is paired 
+    with the first event in a later entry that passes the Po cuts, delta r and delta t cuts. With bipo_match == "all" 
+    every matching Po is kept, ranked by bipo_rank ("delta_r" or "delta_t").
+
+    The same candidates are also matched in each of the offtime_windows (delta t windows well after the BiPo214 decay), 
+    which are only counted, in offtime_counts, for the accidental coincidence estimate. The window then has to hold 
+    candidates for the latest off-time window rather than bipo_delta_t_max.
+
+    Parameters
+    ----------
+    dsRead : rat.RAT::DU::DSReader generator
+        RAT data accessed with the dsReader, iterated through exactly once.
+    iEntryStart : int
+        Entry index of the first entry yielded by dsRead.
+    iEntryBiStop : int or None
+        If given, only entries before iEntryBiStop are Bi candidates (and counted in counts). Entries after it are 
+        only read as a halo, until every open candidate is matched or too old for any window, then reading stops.
+    pair_writer : bipo_pairs.PairWriter or None
+        If given, the pairs of each Bi are written to it as soon as the Bi leaves the window (so still in order of the Bi).
+
+    Returns
+    -------
+    pairs : list of tuples
+        (iEntryBi, iEvBi, BiGTID, iEntryPo, iEvPo, PoGTID, delta_r [mm], delta_t [ns], (Bi x, y, z) [mm], 
+        (Po x, y, z) [mm], Bi nhits cleaned, Po nhits cleaned) for each coincidence, sorted in order of the Bi event, 
+        then by rank.
+
+    '''
+
+    windows = [(bipo_delta_t_min, bipo_delta_t_max)] + [tuple(window) for window in offtime_windows] # signal window first
+    delta_t_keep = max(window[1] for window in windows)
+
+    open_bi = collections.deque() # (iEntry, iev, GTID, (x, y, z), clock time [ns], nhits cleaned) of Bi candidates, oldest first
+    matched = {}                  # (iEntry, iev) -> set of the windows a candidate has already been matched in
+    closed = set()                # (iEntry, iev) of candidates already matched in every window but still in open_bi
+    bi_pairs = {}                 # (iEntry, iev) -> pairs found so far for a candidate still in open_bi
+    index = bipo_spatial.VoxelHash(bipo_delta_r_max) if use_spatial_index else None
+    pairs = []
+    nfound = 0
+
+    if bipo_rank == "delta_t" :
+        rank = lambda pair : (pair[7], pair[6])
+    else :
+        rank = lambda pair : (pair[6], pair[7])
+
+    def finish_bi(bi) : # no more pairs possible for this candidate, report them
+        found = bi_pairs.pop((bi[0], bi[1]), None)
+        if not found : return
+        found.sort(key=rank)
+        pairs.extend(found)
+        if pair_writer is not None : pair_writer.write(found)
+
+    iEntry = iEntryStart - 1
+    for ds, run in dsRead : 
+
+        iEntry += 1
+        if iEntry % 1000 == 0 : print "Entry #", iEntry # print every thousand entries
+
+        in_halo = iEntryBiStop is not None and iEntry >= iEntryBiStop
+        if in_halo and len(open_bi) == len(closed) : break # nothing left that a Po could match
+
+        for iev in range(0, ds.GetEVCount()) :
+
+            view = bipo_event_view(ds.GetEV(iev))
+            if not in_halo :
+                counts[0] += 1 # counter for all events that are are tested in THIS file
+                counts[1] += 1 # counter for all events across ALL files 
+
+            ev_time = view.time # [ns]
+
+            # candidates this old can't be matched by this or any later event
+            while open_bi and ev_time - open_bi[0][4] >= delta_t_keep :
+                bi = open_bi.popleft()
+                finish_bi(bi)
+                matched.pop((bi[0], bi[1]), None)
+                closed.discard((bi[0], bi[1]))
+                if index is not None : index.remove((bi[0], bi[1]))
+
+            if not has_bipo_fit(view) : continue # must have valid fit to be either a Bi or a Po
+
+            x, y, z = view.x, view.y, view.z
+
+            # test as the Po of the open Bi candidates
+            if len(open_bi) > len(closed) and passes_po_cuts(view) :
+
+                if index is not None :
+                    nearby = index.query(x, y, z, bipo_delta_r_max)
+                else :
+                    nearby = []
+                    for bi in open_bi :
+                        if (bi[0], bi[1]) in closed : continue
+                        delta_r = math.sqrt((x - bi[3][0])**2 + (y - bi[3][1])**2 + (z - bi[3][2])**2)
+                        if delta_r < bipo_delta_r_max : nearby.append((delta_r, (bi[0], bi[1]), bi))
+
+                for delta_r, key, bi in nearby :
+
+                    if bi[0] >= iEntry : continue # Po must be in a later entry
+                    delta_t = ev_time - bi[4]
+
+                    for iWindow in range(len(windows)) :
+
+                        if delta_t <= windows[iWindow][0] or delta_t >= windows[iWindow][1] : continue
+                        if bipo_match == "first" and iWindow in matched.get(key, ()) : continue
+
+                        if iWindow == 0 :
+                            bi_pairs.setdefault(key, []).append((bi[0], bi[1], bi[2], iEntry, iev, view.gtid, delta_r, delta_t, 
+                                                                 bi[3], (x, y, z), bi[5], view.nhits_cleaned))
+                            nfound += 1
+                            print "\n\n\tIs BiPo214! iEntryBi =", bi[0], "iEntryPo =", iEntry
+                            print "\tBiGTID =", bi[2], "PoGTID =", view.gtid
+                            print "\t", nfound, "coincidence event(s)!\n\n"
+                        else :
+                            offtime_counts[iWindow-1] += 1
+
+                        if bipo_match == "first" : # this Po is the first match in this window, stop looking for others
+                            matched.setdefault(key, set()).add(iWindow)
+                            if len(matched[key]) == len(windows) :
+                                closed.add(key)
+                                if index is not None : index.remove(key)
+
+            # then as a Bi candidate
+            if not in_halo and passes_bi_cuts(view) :
+                bi = (iEntry, iev, view.gtid, (x, y, z), ev_time, view.nhits_cleaned)
+                open_bi.append(bi)
+                if index is not None : index.insert((iEntry, iev), x, y, z, bi)
+
+    for bi in open_bi : # end of file (or halo)
+        finish_bi(bi)
+
+    return pairs
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def dsreader_range(fname, iEntryStart, iEntryStop=None):
+
+    '''
+
+    Description
+    -----------
+    Like rat.dsreader, but starting from entry iEntryStart instead of the beginning of the file.
+
+    Parameters
+    ----------
+    fname : str
+        full path to RAT data.
+    iEntryStart : int
+        First entry to yield.
+    iEntryStop : int or None
+        Entry to stop before, defaults to the end of the file.
+
+    Yields
+    ------
+    (ds, run) : (rat.RAT::DS::Entry, rat.RAT::DS::Run)
+
+    '''
+
+    reader = ROOT.RAT.DU.DSReader(fname)
+    if iEntryStop is None : iEntryStop = reader.GetEntryCount()
+
+    for iEntry in range(iEntryStart, iEntryStop) :
+        yield reader.GetEntry(iEntry), reader.GetRun()
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def tag_shard(shard):
+
+    '''
+
+    Description
+    -----------
+    Run find_bipo214_pairs_window on one entry range of a file, reading past its end as far as needed (the halo).
+
+    Parameters
+    ----------
+    shard : tuple
+        (fname, iEntryStart, iEntryStop) : full path to RAT data and the range of entries whose events are Bi candidates.
+
+    Returns (all in a tuple)
+    -------
+    pairs : list of tuples
+        Output of find_bipo214_pairs_window.
+    nevents : int
+        Number of events analysed in the shard, not including the halo.
+    shard_offtime_counts : list of ints
+        Off-time window counts for the Bi candidates of the shard.
+
+    '''
+
+    fname, iEntryStart, iEntryStop = shard
+
+    nevents_before = counts[0]
+    offtime_before = list(offtime_counts)
+    pairs = find_bipo214_pairs_window(dsreader_range(fname, iEntryStart), iEntryStart, iEntryStop)
+    return pairs, counts[0] - nevents_before, [offtime_counts[i] - offtime_before[i] for i in range(len(offtime_counts))]
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def build_bipo214_results_sharded(fname, saveFile, n_shards, pair_writer=None):
+
+    '''
+
+    Description
+    -----------
+    Same as build_bipo214_results_window, but the file is split into n_shards entry ranges tagged by separate processes. 
+    Each shard keeps reading past its last entry until no Po could still match one of its Bi candidates, so no pairs 
+    are lost at the shard boundaries. The shards are merged in entry order and any pair found twice is dropped, 
+    so the output is the same as with one shard.
+
+    Parameters
+    ----------
+    fname : str
+        full path to RAT data.
+    saveFile : str
+        full path to output .txt file storing entry ids
+    n_shards : int
+        Number of entry ranges (and processes) to split the file into.
+    pair_writer : bipo_pairs.PairWriter or None
+        If given, the merged pair records are also written to it.
+
+    Returns
+    -------
+    coincicount : int or None
+        number of BiPo coincidences found in the file, None if it is unable to be read.
+
+    '''
+
+    try : # If this fails for any reason, we want to avoid corrupting the TFile, so exit the function.
+        nentries = ROOT.RAT.DU.DSReader(fname).GetEntryCount()
+        print "\n\tAnalysing file", fname, "in", n_shards, "shards\n"
+    except :
+        print fname, "is unable to be read by the dsreader. Skipping this file."
+        return None # unreadable, not 0 coincidences, so the file is tagged again on the next run
+
+    bounds = [nentries*i//n_shards for i in range(n_shards + 1)]
+    shards = [(fname, bounds[i], bounds[i+1]) for i in range(n_shards) if bounds[i] < bounds[i+1]]
+
+    if multiprocessing.current_process().daemon : # already inside a bipo214_comb worker, which can't have its own pool
+        results = [tag_shard(shard) for shard in shards]
+    else :
+        pool = multiprocessing.Pool(min(n_shards, len(shards)) or 1, initializer=init_tagger_worker)
+        try :
+            results = pool.map(tag_shard, shards)
+        except :
+            pool.terminate() # a shard raised, don't wait for the others
+            raise
+        finally :
+            pool.close()
+            pool.join()
+        for shard_pairs, nevents, shard_offtime_counts in results : # the workers only add to their own copy
+            counts[0] += nevents
+            counts[1] += nevents
+            for i in range(len(offtime_counts)) : offtime_counts[i] += shard_offtime_counts[i]
+
+    # merge : shards are in entry order, so only drop pairs already seen
+    pairs = []
+    seen = set()
+    for shard_pairs, nevents, shard_offtime_counts in results :
+        for pair in shard_pairs :
+            key = (pair[0], pair[1], pair[3], pair[4]) # Bi and Po (entry, sub-event)
+            if key in seen : continue
+            seen.add(key)
+            pairs.append(pair)
+
+    if pair_writer is not None : pair_writer.write(pairs)
+
+    ev_id_list = []
+    for pair in pairs :
+        ev_id_list.append(pair[2]) # Bi then its Po, in order of the Bi
+        ev_id_list.append(pair[5])
+
+    write_out(saveFile, ev_id_list)
+    return len(pairs)
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def get_cut_settings():
+
+    '''
+    Return the current Bi, Po and BiPo cut values as a dict keyed by their tagger_settings names.
+    '''
+
+    return {"bi_z_min" : bi_z_min, "bi_r_min" : bi_r_min, "bi_r_max" : bi_r_max, "bi_nhit_cleaned_min" : bi_nhit_cleaned_min,
+            "po_z_min" : po_z_min, "po_r_max" : po_r_max, "po_nhit_cleaned_min" : po_nhit_cleaned_min, "po_nhit_cleaned_max" : po_nhit_cleaned_max,
+            "bipo_delta_r_max" : bipo_delta_r_max, "bipo_delta_t_min" : bipo_delta_t_min, "bipo_delta_t_max" : bipo_delta_t_max}
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def build_bipo214_results_columns(fname, saveFile, pair_writer=None):
+
+    '''
+
+    Description
+    -----------
+    Same as build_bipo214_results, but in two phases: the per-event quantities the cuts need are extracted into 
+    arrays in a single pass (extract_bipo214_columns), then all the cuts and the coincidence search are done as 
+    array operations (match_bipo214_columns).
+
+    Parameters
+    ----------
+    fname : str
+        full path to RAT data to access with the dsReader.
+    saveFile : str
+        full path to output .txt file storing entry ids
+    pair_writer : bipo_pairs.PairWriter or None
+        If given, the full pair records are also written to it.
+
+    Returns
+    -------
+    coincicount : int or None
+        number of BiPo coincidences found in the file, None if it is unable to be read.
+
+    '''
+
+    cols = read_bipo214_columns(fname)
+    if cols is None :
+        return None # unreadable, not 0 coincidences, so the file is tagged again on the next run
+
+    counts[0] += len(cols["gtid"]) # every event is tested
+    counts[1] += len(cols["gtid"])
+
+    flows = bipo214_cut_flows()
+    bi_idx, po_idx = match_bipo214_columns(cols, flows=flows)
+    flows[0].print_table("Bi cuts")
+    flows[1].print_table("Po cuts")
+
+    for iWindow in range(len(offtime_windows)) : # same columns, just a later delta t window
+        offtime_cuts = get_cut_settings()
+        offtime_cuts["bipo_delta_t_min"], offtime_cuts["bipo_delta_t_max"] = offtime_windows[iWindow]
+        offtime_counts[iWindow] += len(match_bipo214_columns(cols, offtime_cuts)[0])
+
+    ev_id_list = np.empty(2*len(bi_idx), dtype=np.int64)
+    ev_id_list[0::2] = cols["gtid"][bi_idx] # Bi then its Po, in order of the Bi
+    ev_id_list[1::2] = cols["gtid"][po_idx]
+
+    for i in range(len(bi_idx)) :
+        print "\tBiGTID =", cols["gtid"][bi_idx[i]], "PoGTID =", cols["gtid"][po_idx[i]], "iEntryBi =", cols["entry"][bi_idx[i]], "iEntryPo =", cols["entry"][po_idx[i]]
+
+    if pair_writer is not None : pair_writer.write_records(column_pair_records(cols, bi_idx, po_idx, pair_writer.fid))
+
+    write_out(saveFile, ev_id_list)
+    return len(bi_idx)
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def column_pair_records(cols, bi_idx, po_idx, fid):
+
+    '''
+
+    Description
+    -----------
+    Build the bipo_pairs.PAIR_DTYPE records of the pairs found by match_bipo214_columns.
+
+    Parameters
+    ----------
+    cols : dict of numpy arrays
+        Output of extract_bipo214_columns.
+    bi_idx, po_idx : numpy arrays of ints
+        Output of match_bipo214_columns.
+    fid : int
+        bipo_pairs.file_id of the input file.
+
+    Returns
+    -------
+    records : numpy record array of bipo_pairs.PAIR_DTYPE
+
+    '''
+
+    records = np.zeros(len(bi_idx), dtype=bipo_pairs.PAIR_DTYPE)
+    records["file_id"] = fid
+    for name, idx in (("bi", bi_idx), ("po", po_idx)) :
+        records[name + "_entry"] = cols["entry"][idx]
+        records[name + "_iev"] = cols["iev"][idx]
+        records[name + "_gtid"] = cols["gtid"][idx]
+        records[name + "_x"] = cols["x"][idx]
+        records[name + "_y"] = cols["y"][idx]
+        records[name + "_z"] = cols["z"][idx]
+        records[name + "_nhits_cleaned"] = cols["nhits_cleaned"][idx]
+    records["delta_r"] = np.sqrt((records["po_x"] - records["bi_x"])**2 + (records["po_y"] - records["bi_y"])**2 + (records["po_z"] - records["bi_z"])**2)
+    records["delta_t"] = cols["time"][po_idx] - cols["time"][bi_idx]
+    return records
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def read_bipo214_columns(fname):
+
+    '''
+
+    Description
+    -----------
+    extract_bipo214_columns for a whole file, taken from the event cache (event_cache.py) if use_event_cache.
+
+    Parameters
+    ----------
+    fname : str
+        full path to RAT data.
+
+    Returns
+    -------
+    cols : dict of numpy arrays or None
+        As extract_bipo214_columns, None if the file is unable to be read.
+
+    '''
+
+    try : # If this fails for any reason, we want to avoid corrupting the TFile, so exit the function.
+        if use_event_cache :
+            events = event_cache.load_events(fname, fitName)
+        else :
+            dsRead = rat.dsreader(fname) 
+        print "\n\tAnalysing file", fname, "\n"
+    except :
+        print fname, "is unable to be read by the dsreader. Skipping this file."
+        return None
+
+    if use_event_cache :
+        return bipo214_columns_from_events(events)
+    return extract_bipo214_columns(dsRead)
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def bipo214_columns_from_events(events):
+
+    '''
+    Convert events (dict of numpy arrays, from event_cache.load_events) to the columns of extract_bipo214_columns.
+    '''
+
+    valid = events["valid_position"] & events["valid_time"]
+    nan = float("nan")
+    return {"entry" : events["entry"], "iev" : events["iev"], "gtid" : events["gtid"], "time" : events["time"], 
+            "valid" : valid, "x" : np.where(valid, events["x"], nan), "y" : np.where(valid, events["y"], nan), 
+            "z" : np.where(valid, events["z"], nan), "nhits_cleaned" : events["nhits_cleaned"], 
+            "dc_applied" : events["dc_applied"], "dc_flagged" : events["dc_flagged"]}
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def extract_bipo214_columns(dsRead):
+
+    '''
+
+    Description
+    -----------
+    Read every event in dsRead once and store the scalars the BiPo cuts use in arrays, one element per event.
+
+    Parameters
+    ----------
+    dsRead : rat.RAT::DU::DSReader generator
+        RAT data accessed with the dsReader.
+
+    Returns
+    -------
+    cols : dict of numpy arrays
+        "entry", "iev", "gtid", "time" (clock time [ns]), "valid" (valid position and time fit), "x", "y", "z" [mm] 
+        (nan if not valid), "nhits_cleaned", "dc_applied" and "dc_flagged" (data cleaning words of the latest pass, 
+        0 for MC and events that are not valid).
+
+    '''
+
+    entry, iev_l, gtid, time, valid = [], [], [], [], []
+    x, y, z, nhits_cleaned, dc_applied, dc_flagged = [], [], [], [], [], []
+    nan = float("nan")
+
+    iEntry = -1
+    for ds, run in dsRead :
+
+        iEntry += 1
+        if iEntry % 1000 == 0 : print "Entry #", iEntry # print every thousand entries
+
+        for iev in range(0, ds.GetEVCount()) :
+
+            view = bipo_event_view(ds.GetEV(iev))
+
+            entry.append(iEntry)
+            iev_l.append(iev)
+            gtid.append(view.gtid)
+            time.append(view.time)
+            nhits_cleaned.append(view.nhits_cleaned)
+
+            if has_bipo_fit(view) :
+                valid.append(True)
+                x.append(view.x), y.append(view.y), z.append(view.z)
+            else :
+                valid.append(False)
+                x.append(nan), y.append(nan), z.append(nan)
+
+            dc_applied.append(view.dc_applied if valid[-1] else 0), dc_flagged.append(view.dc_flagged if valid[-1] else 0) # no use without a fit
+
+    return {"entry" : np.array(entry, dtype=np.int64), "iev" : np.array(iev_l, dtype=np.int32), 
+            "gtid" : np.array(gtid, dtype=np.int64), "time" : np.array(time, dtype=np.int64), 
+            "valid" : np.array(valid, dtype=bool), "x" : np.array(x, dtype=np.float64), "y" : np.array(y, dtype=np.float64), 
+            "z" : np.array(z, dtype=np.float64), "nhits_cleaned" : np.array(nhits_cleaned, dtype=np.int32), 
+            "dc_applied" : np.array(dc_applied, dtype=np.uint64), "dc_flagged" : np.array(dc_flagged, dtype=np.uint64)}
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def bipo214_cut_flows(cuts=None):
+
+    '''
+
+    Description
+    -----------
+    The Bi and Po cuts as cuts.CutFlows over the columns of extract_bipo214_columns, for bipo214_column_masks. The 
+    flows keep counting over every call they are passed to, for a cut flow table (bi_flow.print_table()).
+
+    Parameters
+    ----------
+    cuts : dict
+        Cut values, structured like get_cut_settings(). Defaults to the current tagger_settings.
+
+    Returns (all in a tuple)
+    -------
+    bi_flow, po_flow : cuts.CutFlow
+
+    '''
+
+    if cuts is None : cuts = get_cut_settings()
+
+    valid = event_cuts.Cut("valid fit", "valid")
+    dc = [] if is_mc else [event_cuts.dc_cut(dc_mask)] # the data cleaning (dc) cuts are only used for data
+    r = "sqrt(x**2 + y**2 + z**2)"
+
+    bi_flow = event_cuts.CutFlow([valid, 
+                                  event_cuts.Cut("Bi z", "z >= bi_z_min", cuts),                                   # FV cut (in scintillator cap)
+                                  event_cuts.Cut("Bi R", "(%s >= bi_r_min) & (%s <= bi_r_max)"%(r, r), cuts),      # FV cut (Bi  2m < R < 6 m)
+                                  event_cuts.Cut("Bi nhits cleaned", "nhits_cleaned >= bi_nhit_cleaned_min", cuts)] + dc, 
+                                 order_by_selectivity=True)
+    po_flow = event_cuts.CutFlow([valid, 
+                                  event_cuts.Cut("Po z", "z >= po_z_min", cuts),                                   # Po z > 0.85 m (in scintillator cap)
+                                  event_cuts.Cut("Po R", "%s <= po_r_max"%r, cuts),                                # po  R < 6 m
+                                  event_cuts.Cut("Po nhits cleaned", "(nhits_cleaned >= po_nhit_cleaned_min) & (nhits_cleaned <= po_nhit_cleaned_max)", cuts)] + dc, 
+                                 order_by_selectivity=True)
+    return bi_flow, po_flow
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def bipo214_column_masks(cols, cuts=None, flows=None):
+
+    '''
+
+    Description
+    -----------
+    Apply the Bi and Po cuts to every event at once.
+
+    Parameters
+    ----------
+    cols : dict of numpy arrays
+        Output of extract_bipo214_columns.
+    cuts : dict
+        Cut values, structured like get_cut_settings(). Defaults to the current tagger_settings.
+    flows : tuple of cuts.CutFlow
+        (bi_flow, po_flow) from bipo214_cut_flows(cuts), that count the events of cols. Built for this call if None.
+
+    Returns (all in a tuple)
+    -------
+    bi_mask : numpy array of bools
+        Whether each event passes the Bi cuts.
+    po_mask : numpy array of bools
+        Whether each event passes the Po cuts.
+
+    '''
+
+    bi_flow, po_flow = flows if flows is not None else bipo214_cut_flows(cuts)
+    return bi_flow.mask(cols), po_flow.mask(cols)
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def match_bipo214_columns(cols, cuts=None, flows=None):
+
+    '''
+
+    Description
+    -----------
+    Find BiPo214 coincidences with array operations only. The Po candidates are sorted by clock time, so the delta t 
+    window of every Bi candidate is found at once with np.searchsorted; the delta r and later entry cuts are then 
+    applied to every (Bi, Po) pair in the windows, and each Bi keeps its first matching Po (as in is_bipo214_beta), 
+    or all of them ranked by bipo_rank if bipo_match == "all".
+
+    Parameters
+    ----------
+    cols : dict of numpy arrays
+        Output of extract_bipo214_columns.
+    cuts : dict
+        Cut values, structured like get_cut_settings(). Defaults to the current tagger_settings.
+    flows : tuple of cuts.CutFlow
+        (bi_flow, po_flow) from bipo214_cut_flows(cuts), passed on to bipo214_column_masks.
+
+    Returns (all in a tuple)
+    -------
+    bi_idx : numpy array of ints
+        Index in cols of the Bi event of each coincidence, in increasing order (repeated for each match if bipo_match == "all").
+    po_idx : numpy array of ints
+        Index in cols of the matching Po event.
+
+    '''
+
+    if cuts is None : cuts = get_cut_settings()
+
+    bi_mask, po_mask = bipo214_column_masks(cols, cuts, flows)
+    bi = np.flatnonzero(bi_mask)
+    po = np.flatnonzero(po_mask)
+    po = po[np.argsort(cols["time"][po], kind="mergesort")] # stable, so ties stay in event order
+
+    bi_time = cols["time"][bi]
+    po_time = cols["time"][po]
+    lo = np.searchsorted(po_time, bi_time + cuts["bipo_delta_t_min"], side="right") # delta_t > bipo_delta_t_min
+    hi = np.searchsorted(po_time, bi_time + cuts["bipo_delta_t_max"], side="left")  # delta_t < bipo_delta_t_max
+    n_window = hi - lo
+
+    bi_matched = []
+    po_matched = []
+
+    # (Bi, Po) pairs in the time windows are built a block of Bi at a time to keep memory bounded
+    ends = np.cumsum(n_window)
+    iBi = 0
+    while iBi < len(bi) :
+
+        start = ends[iBi] - n_window[iBi]
+        iBiStop = max(iBi + 1, np.searchsorted(ends, start + max_pairs_per_block, side="right"))
+        n = n_window[iBi:iBiStop]
+
+        pair_bi = np.repeat(np.arange(iBi, iBiStop), n)
+        pair_po = np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n) + np.repeat(lo[iBi:iBiStop], n)
+
+        b = bi[pair_bi]
+        p = po[pair_po]
+        delta_r = np.sqrt((cols["x"][p] - cols["x"][b])**2 + (cols["y"][p] - cols["y"][b])**2 + (cols["z"][p] - cols["z"][b])**2)
+        keep = (delta_r < cuts["bipo_delta_r_max"]) & (cols["entry"][p] > cols["entry"][b])
+
+        pair_bi = pair_bi[keep]
+        pair_po = pair_po[keep]
+        if bipo_match == "first" :
+            chosen = np.unique(pair_bi, return_index=True)[1] # pairs are grouped by Bi and time ordered within each group
+        elif bipo_rank == "delta_t" :
+            chosen = np.arange(len(pair_bi)) # already ordered by delta t within each Bi
+        else :
+            chosen = np.lexsort((delta_r[keep], pair_bi))
+        bi_matched.append(bi[pair_bi[chosen]])
+        po_matched.append(po[pair_po[chosen]])
+
+        iBi = iBiStop
+
+    if not bi_matched : return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+    return np.concatenate(bi_matched), np.concatenate(po_matched)
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def make_cut_grid(axes):
+
+    '''
+
+    Description
+    -----------
+    Build every combination of the given cut values, for bipo214_scan.
+
+    Parameters
+    ----------
+    axes : dict
+        Cut name (as in get_cut_settings) -> list of values to try, e.g. {"bi_r_max" : [5000.0, 5500.0, 6000.0]}.
+        Cuts that aren't given keep their tagger_settings value.
+
+    Returns
+    -------
+    grid : list of dicts
+        One complete set of cut values (structured like get_cut_settings()) per grid point.
+
+    '''
+
+    names = sorted(axes.keys())
+    grid = []
+    for values in itertools.product(*[axes[name] for name in names]) :
+        cuts = get_cut_settings()
+        cuts.update(zip(names, values))
+        grid.append(cuts)
+    return grid
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def bipo214_scan(in_files, grid):
+
+    '''
+
+    Description
+    -----------
+    Tag the same files with many sets of cuts while reading each file only once: the per-event quantities are extracted 
+    once per file (extract_bipo214_columns) and every grid point is then matched on those arrays (match_bipo214_columns).
+
+    Parameters
+    ----------
+    in_files : list
+        List of input root files, full path and file-type NOT included (as in bipo214_comb).
+    grid : list of dicts
+        Cut values for each grid point, structured like get_cut_settings(), e.g. from make_cut_grid. 
+        Missing cuts keep their tagger_settings value.
+
+    Returns
+    -------
+    results : list of tuples
+        (cuts, coincicount, ev_id_list) for each grid point, in order of grid. ev_id_list is the Bi and Po GTIDs 
+        across all files, as they would be written by write_out.
+
+    '''
+
+    full_grid = []
+    for point in grid :
+        cuts = get_cut_settings()
+        cuts.update(point)
+        full_grid.append(cuts)
+
+    coincicount = [0] * len(full_grid)
+    ev_id_lists = [[] for cuts in full_grid]
+
+    init_tagger_worker()
+
+    for fname in in_files :
+
+        if ".ntuple" in fname :
+            print "\n", fname, "is an invalid input file. Skipping."
+            continue
+
+        cols = read_bipo214_columns(data_dir + fname + ".root")
+        if cols is None : continue
+
+        counts[1] += len(cols["gtid"])
+
+        for iPoint in range(len(full_grid)) :
+            bi_idx, po_idx = match_bipo214_columns(cols, full_grid[iPoint])
+            coincicount[iPoint] += len(bi_idx)
+            for i in range(len(bi_idx)) :
+                ev_id_lists[iPoint].append(cols["gtid"][bi_idx[i]])
+                ev_id_lists[iPoint].append(cols["gtid"][po_idx[i]])
+
+    # only print the cuts that change across the grid
+    scanned = [name for name in sorted(get_cut_settings().keys()) if len(set(cuts[name] for cuts in full_grid)) > 1]
+    print "\n\tScan over", len(full_grid), "grid points,", counts[1], "events:"
+    for iPoint in range(len(full_grid)) :
+        print "\t", ", ".join("%s = %g"%(name, full_grid[iPoint][name]) for name in scanned), ":", coincicount[iPoint], "coincidence events"
+
+    return [(full_grid[iPoint], coincicount[iPoint], ev_id_lists[iPoint]) for iPoint in range(len(full_grid))]
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def bipo214_skim(in_files, n_neighbours=None):
+
+    '''
+
+    Description
+    -----------
+    Copy the tagged entries of each file (from its .pairs file, see bipo214_comb) into a small RAT DS file, 
+    ev_dir + name + "_skim.root", which dsreader (and so the histogram makers) can read like the original. 
+    The original entry id of each skimmed entry is saved to ev_dir + name + "_skim.txt", one per line.
+
+    Parameters
+    ----------
+    in_files : list
+        List of input root files, as given to bipo214_comb. Full path and file-type NOT included (must be .root)
+    n_neighbours : int
+        Also copy this many entries before and after each tagged entry, defaults to tagger_settings.skim_neighbours.
+
+    Returns
+    -------
+    nskimmed : list of ints
+        Number of entries copied from each file (0 for a file that was skipped).
+
+    '''
+
+    if n_neighbours is None : n_neighbours = tagger_settings.skim_neighbours
+
+    nskimmed = []
+    for fname in in_files :
+
+        pairFile = pair_file_name(fname)
+        if not os.path.isfile(pairFile) :
+            print "\n", pairFile, "not found, tag", fname, "with pair_output = True first. Skipping."
+            nskimmed.append(0)
+            continue
+
+        pairs = bipo_pairs.load_pairs(pairFile)
+        entries = np.unique(np.concatenate((pairs["bi_entry"], pairs["po_entry"])))
+        if n_neighbours > 0 :
+            entries = np.unique((entries[:, None] + np.arange(-n_neighbours, n_neighbours + 1)).ravel())
+
+        skimFile = ev_dir + fname + "_skim.root"
+        copied = skim_entries(data_dir + fname + ".root", skimFile, entries)
+        write_out(ev_dir + fname + "_skim.txt", copied)
+        nskimmed.append(len(copied))
+        print "\t", len(copied), "entries of", fname, "saved to", skimFile
+
+    return nskimmed
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def skim_entries(fname, skimFile, entries):
+
+    '''
+
+    Description
+    -----------
+    Copy the given entries of the event tree of a RAT DS file into a new file, along with the other trees and 
+    objects in it (run tree, meta data) unchanged.
+
+    Parameters
+    ----------
+    fname : str
+        full path to the RAT DS .root file.
+    skimFile : str
+        full path to the output .root file, overwritten if it exists.
+    entries : sorted list of ints
+        Entry ids to copy, ids outside the file are ignored.
+
+    Returns
+    -------
+    copied : list of ints
+        Entry ids that were copied, in order (entry i of skimFile is entry copied[i] of fname).
+
+    '''
+
+    fi = ROOT.TFile.Open(fname)
+    if not fi or fi.IsZombie() :
+        print fname, "is unable to be opened. Skipping this file."
+        return []
+    tree = fi.Get("T")
+
+    fo = ROOT.TFile(skimFile, "RECREATE") # deletes if prexisting
+    skim = tree.CloneTree(0) # same branches, no entries
+    copied = []
+    for iEntry in entries :
+        if iEntry < 0 or iEntry >= tree.GetEntries() : continue
+        tree.GetEntry(int(iEntry))
+        skim.Fill()
+        copied.append(int(iEntry))
+    skim.Write()
+
+    latest = {} # highest cycle of each name, so e.g. runT;1 isn't copied as well as runT;2
+    for key in fi.GetListOfKeys() :
+        latest[key.GetName()] = max(latest.get(key.GetName(), key.GetCycle()), key.GetCycle())
+
+    for key in fi.GetListOfKeys() : # run tree (needed by the dsreader), meta data, ...
+        if key.GetName() == "T" or key.GetCycle() != latest[key.GetName()] : continue
+        obj = key.ReadObj()
+        fo.cd()
+        if obj.InheritsFrom("TTree") :
+            obj.CloneTree(-1, "fast").Write()
+        else :
+            obj.Write(key.GetName())
+
+    fo.Close()
+    fi.Close()
+    return copied
 # ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
\ No newline at end of file
@@ -26,4 +26,20 @@ bipo_delta_t_max = 1800000.0 # [ns]
 
 is_mc = True
 fitName = "partialFitter" 
+tagger_mode = "window"       # "window" (single pass sliding window), "columns" (extract arrays then vectorized search) or "legacy" (original forward search)
+max_pairs_per_block = 5000000 # max Bi-Po time window pairs held in memory at once in "columns" mode
+use_spatial_index = True     # "window" mode: find the open Bi candidates near a Po with a voxel hash instead of checking them all
+bipo_match = "first"         # "first" : pair each Bi with its first matching Po, "all" : keep every matching Po
+bipo_rank = "delta_r"        # with bipo_match = "all", order the Po of each Bi by "delta_r" or "delta_t"
+n_workers = 1                # number of processes bipo214_comb tags files with
+n_shards = 1                 # "window" mode: number of entry ranges (and processes) each file is split into
+manifest_file = ev_dir + "bipo214_manifest.json" # per-file record of finished tagging, so reruns skip them. "" to disable
+offtime_windows = []         # [[t_min, t_max], ...] [ns] off-time delta t windows for the accidental estimate, e.g. [[5000000.0, 6796310.0]]
+pair_output = True           # also write the full pair records of each file to ev_dir + name + ".pairs" (bipo_pairs.load_pairs to read)
+skim_neighbours = 0          # bipo214_skim: also copy this many entries either side of each tagged entry
+use_event_cache = False      # "columns" mode and bipo214_scan: read the events through event_cache.py (no ROOT after the first read)
+cache_dir = ev_dir + "event_cache/" # where event_cache.py keeps its per (file, fit) column files
+cache_layout = "npz"         # event_cache.py : "npz" (one compressed file per run) or "flat" (one memory-mapped .npy per column)
+hist_store_dir = ev_dir + "hist_store/" # where hist_store.py keeps the per-file partial histograms of the histogram makers
+fit_store_dir = ev_dir + "fit_store/"   # where fit_scheduler.py keeps the fit results, by hash of the fit inputs. "" to always refit
 counts = [0, 0] # count in single file (most recent), count across all files
\ No newline at end of file
@@ -0,0 +1,34 @@
+# test_av_geometry.py
+
+'''
+Tests of av_geometry : the per-position is_liquid against the array classify, on random positions and on the
+boundaries. Run with python -m pytest test_av_geometry.py
+'''
+
+import numpy as np
+import av_geometry
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def test_is_liquid_as_classify():
+
+    '''
+    is_liquid agrees with classify + in_regions(LIQUID) everywhere, including exactly on the boundaries and for nan.
+    '''
+
+    rng = np.random.RandomState(0)
+    x, y, z = rng.uniform(-8000.0, 8000.0, (3, 100000))
+
+    # on the boundaries : the AV surface, the neck radius, z = 0 and the neck start, and nan
+    theta = rng.uniform(0.0, np.pi, 1000)
+    edges = [(av_geometry.R_AV*np.sin(theta), 0*theta, av_geometry.R_AV*np.cos(theta)),
+             (av_geometry.RHO_NECK + 0*theta, 0*theta, rng.uniform(5000.0, 8000.0, 1000)),
+             (rng.uniform(-800.0, 800.0, 1000), 0*theta, rng.choice([0.0, av_geometry.Z_NECK, 5955.0], 1000)),
+             (np.array([np.nan, 0.0]), np.array([0.0, 500.0]), np.array([0.0, 5990.0]))]
+    for ex, ey, ez in edges :
+        x, y, z = np.concatenate([x, ex]), np.concatenate([y, ey]), np.concatenate([z, ez])
+
+    expected = av_geometry.in_regions(av_geometry.classify(x, y, z), av_geometry.LIQUID)
+    assert [av_geometry.is_liquid(x[i], y[i], z[i]) for i in range(len(x))] == list(expected)
+    assert expected.any() and not expected.all()
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
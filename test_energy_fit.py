@@ -0,0 +1,162 @@
+# test_energy_fit.py
+
+'''
+Tests of energy_fit : the analytic gradient of peak_nll, the peaks fit_peaks recovers from a known spectrum, and
+find_peaks on spectra where the peaks sit on a falling background or overlap. Run with python -m pytest test_energy_fit.py
+'''
+
+import numpy as np
+import energy_fit
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def two_peak_spectrum(seed):
+
+    '''
+    Energies [MeV] of two Gaussian peaks, 8000 events at 0.8 +- 0.08 and 4000 at 1.6 +- 0.15, on 3000 flat in [0.3, 2.5].
+    '''
+
+    rng = np.random.RandomState(seed)
+    return np.concatenate([rng.normal(0.8, 0.08, 8000), rng.normal(1.6, 0.15, 4000), rng.uniform(0.3, 2.5, 3000)])
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def numerical_gradient(f, theta):
+
+    '''
+    Central finite difference gradient of f (function of a numpy array, returning (value, gradient)) at theta.
+    '''
+
+    grad = np.empty(len(theta))
+    for i in range(len(theta)) :
+        step = 1e-6*max(abs(theta[i]), 1.0)
+        up, down = theta.copy(), theta.copy()
+        up[i] += step
+        down[i] -= step
+        grad[i] = (f(up)[0] - f(down)[0])/(2*step)
+    return grad
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def test_peak_nll_gradient():
+
+    '''
+    The analytic gradient matches finite differences, away from the minimum, with and without background and weights.
+    '''
+
+    energies = two_peak_spectrum(0)
+    energies = energies[(energies >= 0.3) & (energies <= 2.5)]
+    counts, edges = np.histogram(energies, np.linspace(0.3, 2.5, 111))
+    centres = 0.5*(edges[1:] + edges[:-1])
+
+    for values, weights in [(energies, None), (centres, counts.astype(np.float64))] :
+        for background in [True, False] :
+            theta = np.array([7000.0, 0.85, 0.1, 5000.0, 1.5, 0.2] + ([2500.0] if background else []))
+            f = lambda theta : energy_fit.peak_nll(theta, values, [0.3, 2.5], 2, background, weights)
+            np.testing.assert_allclose(f(theta)[1], numerical_gradient(f, theta), rtol=1e-5, atol=1e-4)
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def test_fit_peaks():
+
+    '''
+    fit_peaks recovers the peaks of a known spectrum, from rough seeds, in a small number of NLL evaluations, and a
+    histogram of the same energies gives the same peaks.
+    '''
+
+    energies = two_peak_spectrum(0)
+    seeds = [(0.75, 0.1), (1.5, 0.2)]
+    fit = energy_fit.fit_peaks(energies, [0.3, 2.5], seeds)
+
+    assert fit["converged"]
+    assert fit["n_evaluations"] <= 50
+    for iPeak, (mean, sigma, n) in enumerate([(0.8, 0.08, 8000), (1.6, 0.15, 4000)]) :
+        assert abs(fit["mean"][iPeak] - mean) < 5*fit["mean_error"][iPeak]
+        assert abs(fit["sigma"][iPeak] - sigma) < 5*fit["sigma_error"][iPeak]
+        assert abs(fit["yield"][iPeak] - n) < 5*fit["yield_error"][iPeak]
+    assert abs(fit["background"] - 3000) < 5*fit["background_error"]
+
+    counts, edges = np.histogram(energies, np.linspace(0.3, 2.5, 111))
+    binned = energy_fit.fit_peaks(0.5*(edges[1:] + edges[:-1]), [0.3, 2.5], seeds, weights=counts)
+    np.testing.assert_allclose(binned["mean"], fit["mean"], atol=0.01)
+    np.testing.assert_allclose(binned["sigma"], fit["sigma"], atol=0.01)
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def test_fit_peaks_maxiter():
+
+    '''
+    The number of NLL evaluations is bounded by maxiter, converged or not.
+    '''
+
+    fit = energy_fit.fit_peaks(two_peak_spectrum(1), [0.3, 2.5], [(0.6, 0.3), (1.9, 0.3)], maxiter=3)
+    assert fit["n_evaluations"] <= 4*3
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def overlapping_spectrum(seed):
+
+    '''
+    Energies [MeV] of a falling exponential with two peaks on it, the lower one on its steep part.
+    '''
+
+    rng = np.random.RandomState(seed)
+    return np.concatenate([rng.exponential(0.5, 50000), rng.normal(0.9, 0.1, 5000), rng.normal(2.0, 0.2, 3000)])
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def test_overlapping_peaks():
+
+    '''
+    Both peaks are found, with sigmas of the right size, however the statistics fluctuate.
+    '''
+
+    for seed in range(5) :
+        seeds = energy_fit.find_peaks(overlapping_spectrum(seed), [0.5, 3.0])
+        assert len(seeds) == 2
+        (mean_1, sigma_1), (mean_2, sigma_2) = seeds
+        assert abs(mean_1 - 0.9) < 0.06 and 0.03 < sigma_1 < 0.2
+        assert abs(mean_2 - 2.0) < 0.15 and 0.06 < sigma_2 < 0.4
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def test_histogram_same_as_energies():
+
+    '''
+    The bins of a histogram (with weights) give the same peaks as the energies binned the same way.
+    '''
+
+    energies = overlapping_spectrum(0)
+    counts, edges = np.histogram(energies, np.linspace(0.5, 3.0, 201))
+    centres = 0.5*(edges[1:] + edges[:-1])
+    np.testing.assert_allclose(energy_fit.find_peaks(centres, [0.5, 3.0], weights=counts),
+                               energy_fit.find_peaks(energies, [0.5, 3.0]))
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def test_no_peak_at_the_edge():
+
+    '''
+    A spectrum falling from the start of the search range has no maximum there.
+    '''
+
+    for seed in range(5) :
+        energies = np.random.RandomState(seed).exponential(0.5, 50000)
+        assert all(mean > 0.75 for mean, sigma in energy_fit.find_peaks(energies, [0.5, 3.0]))
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
@@ -0,0 +1,84 @@
+# test_lifetime_fit.py
+
+'''
+Tests of lifetime_fit : the analytic gradient of lifetime_nll, the lifetime and background fraction fit_lifetime
+recovers from pairs selected in a delta t window (truncated exponential + flat), and the degenerate inputs. Run with
+python -m pytest test_lifetime_fit.py
+'''
+
+import numpy as np
+import lifetime_fit
+from test_energy_fit import numerical_gradient
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def window_sample(seed, t_range, tau=1.0, nsignal=8000, nbackground=2000):
+
+    '''
+    delta t of nsignal exponential (lifetime tau) and nbackground flat pairs, all within t_range ([lo, hi]).
+    '''
+
+    lo, hi = t_range
+    rng = np.random.RandomState(seed)
+    signal = lo + rng.exponential(tau, 20*nsignal)
+    signal = signal[signal <= hi][:nsignal] # the exponential from lo on, cut at hi : truncated at both edges
+    return np.concatenate([signal, rng.uniform(lo, hi, nbackground)])
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def test_lifetime_nll_gradient():
+
+    '''
+    The analytic gradient matches finite differences, away from the minimum, with and without weights.
+    '''
+
+    delta_t = window_sample(0, [0.2, 8.0])
+    counts, edges = np.histogram(delta_t, np.linspace(0.2, 8.0, 101))
+    centres = 0.5*(edges[1:] + edges[:-1])
+
+    for values, weights in [(delta_t, None), (centres, counts.astype(np.float64))] :
+        for theta in [np.array([1.5, 0.3]), np.array([0.4, 0.05])] :
+            f = lambda theta : lifetime_fit.lifetime_nll(theta, values, [0.2, 8.0], weights)
+            np.testing.assert_allclose(f(theta)[1], numerical_gradient(f, theta), rtol=1e-5, atol=1e-4)
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def test_fit_lifetime():
+
+    '''
+    tau and the background fraction are recovered within 5 errors, in a window much longer than tau and in one that cuts
+    off most of the exponential at both edges (where ignoring the truncation would be far off).
+    '''
+
+    for t_range in [[0.2, 8.0], [0.5, 2.0]] :
+        fit = lifetime_fit.fit_lifetime(window_sample(1, t_range), t_range)
+        assert fit["converged"]
+        assert fit["n_events"] == 10000
+        assert abs(fit["tau"] - 1.0) < 5*fit["tau_error"]
+        assert abs(fit["background_fraction"] - 0.2) < 5*fit["background_fraction_error"]
+        assert fit["covariance"][0][1] == fit["covariance"][1][0]
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+
+
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+def test_fit_lifetime_degenerate():
+
+    '''
+    No pairs, or only flat background : the fit returns (with nan errors) instead of raising.
+    '''
+
+    empty = lifetime_fit.fit_lifetime([], [0.0, 10.0])
+    assert empty["n_events"] == 0
+    assert np.all(np.isnan(empty["covariance"]))
+
+    flat = lifetime_fit.fit_lifetime(np.random.RandomState(0).uniform(0.0, 10.0, 2000), [0.0, 10.0])
+    assert np.all(np.isnan(flat["covariance"])) # tau isn't constrained when the exponential is gone or flat
+    p_lo, p_hi = [np.exp(-lifetime_fit.lifetime_nll([flat["tau"], flat["background_fraction"]], np.array([t]), [0.0, 10.0])[0])
+                  for t in [0.0, 10.0]]
+    assert abs(p_lo/p_hi - 1) < 0.01 # the fitted density is flat
+# ////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////